@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Adaptive Energy Grids for Dimension-Flow Curves
+
+A fixed np.logspace(-3, 3, 1000) spends most points on the flat plateaus of
+n_dof(E_c) and under-resolves the transition (wide for small c1, sharp for
+large c1). This module builds grids by bisection in ln E_c:
+
+- every interval is tested at its midpoint: the deviation of each refinement
+  criterion (n_dof itself and the local dimension α = -d ln n_dof / d ln E_c)
+  from the linear interpolant of the endpoints estimates the local
+  interpolation error
+- intervals whose error exceeds ``tol`` (relative to the criterion's range)
+  are split, all pending intervals of a pass being evaluated in one
+  vectorized call
+- refinement stops when every interval meets the tolerance, or at
+  ``max_points`` / ``max_depth``
+
+The resulting non-uniform grid is used with trapezoidal quadrature weights
+(``multifractal_analysis.trapezoid_weights``) by the analyzers.
+
+Task: 2.1.2 - Multifractal Spectrum Analysis (supporting module)
+"""
+
+import numpy as np
+
+from multifractal_analysis import trapezoid_weights
+
+
+def adaptive_log_grid(functions, x_min, x_max, tol=1e-3, n_initial=17,
+                      max_points=100_000, max_depth=40):
+    """
+    Bisection refinement of a grid on [x_min, x_max] in ln x.
+
+    Parameters
+    ----------
+    functions : callable or list of callables
+        Refinement criteria, each mapping an array of x to an array of values
+    x_min, x_max : float
+        Grid limits (positive)
+    tol : float
+        Maximum midpoint interpolation error, relative to each criterion's
+        range on the initial grid
+    n_initial : int
+        Points of the initial log-uniform grid
+
+    Returns
+    -------
+    x : ndarray
+        Sorted grid
+    info : dict
+        'max_error' (estimated, relative), 'converged', 'n_points', 'depth'
+    """
+    if callable(functions):
+        functions = [functions]
+
+    def evaluate(log_x):
+        x = np.exp(log_x)
+        return np.array([np.asarray(f(x), dtype=float) for f in functions])
+
+    log_x = np.linspace(np.log(x_min), np.log(x_max), n_initial)
+    values = evaluate(log_x)
+    span = np.nanmax(values, axis=1) - np.nanmin(values, axis=1)
+    scale = np.where(span > 0, span, 1.0)[:, None]
+
+    active = np.ones(n_initial - 1, dtype=bool)
+    max_error = np.inf
+    depth = 0
+    while active.any() and depth < max_depth and log_x.size < max_points:
+        idx = np.flatnonzero(active)
+        if log_x.size + idx.size > max_points:
+            idx = idx[:max_points - log_x.size]
+        mid = 0.5 * (log_x[idx] + log_x[idx + 1])
+        mid_values = evaluate(mid)
+        linear = 0.5 * (values[:, idx] + values[:, idx + 1])
+        error = np.nanmax(np.abs(mid_values - linear) / scale, axis=0)
+        split = error > tol
+
+        # interval i becomes (x_i, mid) and (mid, x_{i+1}); both stay active
+        # only if the midpoint test failed
+        flags = np.zeros_like(active)
+        flags[idx] = split
+        active = np.insert(flags, idx + 1, split)
+        log_x = np.insert(log_x, idx + 1, mid)
+        values = np.insert(values, idx + 1, mid_values, axis=1)
+        max_error = float(np.max(error)) if error.size else 0.0
+        depth += 1
+
+    return np.exp(log_x), {
+        'max_error': max_error,
+        'converged': not active.any(),
+        'n_points': log_x.size,
+        'depth': depth,
+    }
+
+
+def local_dimension_numeric(ndof_func, step=1e-4):
+    """α(E) = -d ln n_dof / d ln E by a central difference in ln E."""
+    def alpha(E):
+        up = ndof_func(E * np.exp(step))
+        down = ndof_func(E * np.exp(-step))
+        return -(np.log(up) - np.log(down)) / (2 * step)
+    return alpha
+
+
+def adaptive_energy_grid(ndof_func, E_min=1e-3, E_max=1e3, tol=1e-3,
+                         local_dimension_func=None, **kwargs):
+    """
+    Adaptive E_c grid for an n_dof curve.
+
+    Refines on n_dof and on the local dimension α(E_c); pass e.g.
+    ``analyzer.local_dimension`` when a closed form is available, otherwise a
+    central difference is used.
+
+    Returns
+    -------
+    E_c : ndarray
+        Sorted non-uniform grid
+    weights : ndarray
+        Trapezoidal quadrature weights dE_c for the grid
+    info : dict
+        See ``adaptive_log_grid``
+    """
+    if local_dimension_func is None:
+        local_dimension_func = local_dimension_numeric(ndof_func)
+    E_c, info = adaptive_log_grid([ndof_func, local_dimension_func], E_min, E_max,
+                                  tol, **kwargs)
+    return E_c, trapezoid_weights(E_c), info
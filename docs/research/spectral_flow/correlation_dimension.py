@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Correlation Dimension via Grassberger–Procaccia Pair Counting
+
+D_2 from the correlation integral
+
+    C(r) = 2 / (N (N - 1)) · #{i < j : |x_i - x_j| ≤ r},   C(r) ∝ r^(D_2)
+
+for point sets sampled from the n_dof measure or from delay-embedded time
+series. Pairs are counted for all radii without forming the O(N²) distance
+matrix:
+
+- 1-D points: sort once, then for every radius a vectorized ``searchsorted``
+  gives, for each point, the number of later points within r (sorted sweep)
+- d-D points: ``cKDTree.count_neighbors`` counts pairs for all radii in a
+  single dual-tree traversal
+
+Points are split into chunks whose counts are summed, optionally across a
+process pool.
+
+Task: 2.1.2 - Multifractal Spectrum Analysis (supporting module)
+"""
+
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from scipy.spatial import cKDTree
+
+
+# Per-process state for the pool workers (set once by the initializer)
+_WORKER_DATA = {}
+
+
+def delay_embedding(series, dim, delay=1):
+    """
+    Takens delay embedding of a 1-D series.
+
+    Returns an array of shape (N - (dim - 1) delay, dim) with rows
+    (x_t, x_{t+delay}, ..., x_{t+(dim-1) delay}).
+    """
+    series = np.asarray(series, dtype=float)
+    n = series.size - (dim - 1) * delay
+    if n <= 0:
+        raise ValueError("series too short for the requested embedding")
+    return np.lib.stride_tricks.sliding_window_view(series, (dim - 1) * delay + 1)[:n, ::delay]
+
+
+def sample_measure_points(measure, n_points, seed=None):
+    """
+    Draw points in [0, 1) from a discrete 1-D measure.
+
+    Bin i of the measure covers [i/N, (i+1)/N); bins are chosen by inverse-CDF
+    sampling and the position is uniform within the bin, so the point density
+    follows the measure.
+    """
+    measure = np.asarray(measure, dtype=float)
+    rng = np.random.default_rng(seed)
+    cdf = np.cumsum(measure)
+    if cdf[-1] <= 0:
+        raise ValueError("measure has no mass")
+    bins = np.searchsorted(cdf, rng.random(n_points) * cdf[-1], side='right')
+    bins = np.minimum(bins, measure.size - 1)
+    return (bins + rng.random(n_points)) / measure.size
+
+
+def _init_worker(points, is_1d):
+    _WORKER_DATA['points'] = points
+    _WORKER_DATA['tree'] = None if is_1d else cKDTree(points)
+
+
+def _pair_counts_chunk(bounds, radii):
+    """Ordered pair counts (i in chunk, j > i for 1-D; all j for d-D) per radius."""
+    start, stop = bounds
+    points = _WORKER_DATA['points']
+    tree = _WORKER_DATA['tree']
+    if tree is None:
+        # sorted sweep: later points within r of x_i
+        x = points[start:stop]
+        first_later = np.arange(start + 1, stop + 1)
+        return np.array([np.sum(np.searchsorted(points, x + r, side='right') - first_later)
+                         for r in radii], dtype=float)
+    return cKDTree(points[start:stop]).count_neighbors(tree, radii).astype(float)
+
+
+def correlation_sum(points, radii, n_workers=1, chunk_size=100_000):
+    """
+    Correlation integral C(r) for all radii.
+
+    Parameters
+    ----------
+    points : ndarray
+        (N,) for 1-D data or (N, d) for embedded data
+    radii : array_like
+        Radii (in the units of the points)
+    n_workers : int
+        Worker processes (1 = serial)
+    chunk_size : int
+        Points per chunk
+
+    Returns
+    -------
+    ndarray
+        C(r), the fraction of distinct pairs with distance ≤ r
+    """
+    points = np.asarray(points, dtype=float)
+    radii = np.asarray(radii, dtype=float)
+    n = points.shape[0]
+    if n < 2:
+        raise ValueError("at least two points are required")
+
+    is_1d = points.ndim == 1 or points.shape[1] == 1
+    if is_1d:
+        points = np.sort(points.ravel())
+    chunks = [(s, min(s + chunk_size, n)) for s in range(0, n, chunk_size)]
+
+    if n_workers == 1:
+        _init_worker(points, is_1d)
+        counts = sum(_pair_counts_chunk(c, radii) for c in chunks)
+    else:
+        with ProcessPoolExecutor(max_workers=n_workers, initializer=_init_worker,
+                                 initargs=(points, is_1d)) as pool:
+            counts = sum(pool.map(_pair_counts_chunk, chunks, [radii] * len(chunks)))
+    _WORKER_DATA.clear()
+
+    # d-D counts are ordered pairs including i = j
+    pairs = counts if is_1d else 0.5 * (counts - n)
+    return 2.0 * pairs / (n * (n - 1.0))
+
+
+def correlation_dimension(points, radii=None, fit_range=None, n_workers=1,
+                          chunk_size=100_000):
+    """
+    Grassberger–Procaccia estimate of D_2.
+
+    Parameters
+    ----------
+    points : ndarray
+        (N,) or (N, d) point set
+    radii : array_like, optional
+        Radii; 30 log-spaced values from the typical nearest-neighbour scale
+        to a tenth of the data extent by default
+    fit_range : tuple, optional
+        (r_min, r_max) of the scaling region used for the fit
+
+    Returns
+    -------
+    dict
+        'D_2', 'radii', 'C' and the fitted 'intercept'
+    """
+    points = np.asarray(points, dtype=float)
+    if radii is None:
+        span = np.ptp(points, axis=0)
+        extent = float(np.max(span))
+        dim = 1 if points.ndim == 1 else points.shape[1]
+        typical = extent * points.shape[0] ** (-1.0 / dim)
+        radii = np.logspace(np.log10(2 * typical), np.log10(0.1 * extent), 30)
+    radii = np.asarray(radii, dtype=float)
+
+    C = correlation_sum(points, radii, n_workers, chunk_size)
+
+    use = C > 0
+    if fit_range is not None:
+        use &= (radii >= fit_range[0]) & (radii <= fit_range[1])
+    if np.sum(use) < 3:
+        return {'D_2': None, 'radii': radii, 'C': C, 'intercept': None}
+    slope, intercept = np.polyfit(np.log(radii[use]), np.log(C[use]), 1)
+    return {'D_2': slope, 'radii': radii, 'C': C, 'intercept': intercept}
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+Monte Carlo Simulation of the Hierarchical Mode-Constraint Model
+
+Empirical check of FractalConstraintModel.constraint_probability and
+calculate_ndof_hierarchical with an explicit population of modes.
+
+Each simulated system has one mode per constraint level l = 1..N_levels. The
+mode at level l carries a random threshold energy T_l and is accessible at
+E_c if T_l > E_c. Choosing T_l log-logistic with scale E_ref and shape
+k_l = c1 · 2^l,
+
+    ln T_l = ln E_ref + ε / k_l,   ε ~ Logistic(0, 1),
+
+reproduces P(T_l > E_c) = 1 / (1 + (E_c/E_ref)^(k_l)) exactly, so
+n_dof = d_low + Σ_l 1[T_l > E_c] has the analytic hierarchical mean.
+
+Counting is done without a (systems × energies) array: for each chunk the
+thresholds are sorted once and the number above every grid energy follows from
+``searchsorted``. For the second moment, sorting each system's thresholds in
+descending order gives n(E)² = Σ_{j: t_j > E} (2j - 1), so Σ n² is a weighted
+count over the same sorted thresholds. Chunks use independent SeedSequence
+streams and can run in a process pool; only Σ n and Σ n² per energy are
+returned, so memory does not grow with the number of systems.
+
+Task: 2.1.1 - Subtask 2 (validation)
+"""
+
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+from ndof_fractal_calculation import FractalConstraintModel
+
+
+def _counts_above(sorted_values, log_E, weights_suffix=None):
+    """Number (or suffix-summed weight) of sorted values strictly above each energy."""
+    idx = np.searchsorted(sorted_values, log_E, side='right')
+    if weights_suffix is None:
+        return sorted_values.size - idx
+    return weights_suffix[idx]
+
+
+def _simulate_chunk(c1, n_levels, log_E, log_E_ref, n_systems, seed_seq):
+    """
+    Simulate one chunk of systems.
+
+    Returns Σ n_acc, Σ n_acc² over systems (per energy) and the accessible
+    count per level (n_levels, n_E).
+    """
+    rng = np.random.default_rng(seed_seq)
+    k = np.ldexp(c1, np.arange(1, n_levels + 1))
+    log_T = log_E_ref + rng.logistic(size=(n_systems, n_levels)) / k
+
+    # per-level accessibility counts
+    level_counts = np.empty((n_levels, log_E.size))
+    for l in range(n_levels):
+        level_counts[l] = _counts_above(np.sort(log_T[:, l]), log_E)
+
+    # Σ n and Σ n²: rank j (1 = largest) within each system has weight 2j - 1
+    per_system = -np.sort(-log_T, axis=1)
+    weights = np.broadcast_to(2.0 * np.arange(1, n_levels + 1) - 1.0, per_system.shape)
+    order = np.argsort(per_system, axis=None)
+    values = per_system.ravel()[order]
+    suffix = np.concatenate([np.cumsum(weights.ravel()[order][::-1])[::-1], [0.0]])
+
+    sum_n = _counts_above(values, log_E).astype(float)
+    sum_n2 = _counts_above(values, log_E, suffix)
+    return sum_n, sum_n2, level_counts
+
+
+def simulate_ndof(d_topo, w=0, E_c_range=None, E_ref=1.0, d_low=2,
+                  n_systems=1_000_000, chunk_modes=2**22, n_workers=1, seed=None):
+    """
+    Monte Carlo estimate of the hierarchical n_dof(E_c) and its fluctuations.
+
+    Parameters
+    ----------
+    d_topo, w : int
+        System (N_levels = d_topo - 2 + w, c1 = 2^-N_levels)
+    E_c_range : array, optional
+        Constraint energies; np.logspace(-3, 3, 61) by default
+    n_systems : int
+        Number of simulated systems (each with N_levels modes)
+    chunk_modes : int
+        Modes per chunk (bounds memory per worker)
+    n_workers : int
+        Worker processes (1 = serial)
+    seed : int, optional
+        Root seed; chunk k uses SeedSequence(seed).spawn(...)[k]
+
+    Returns
+    -------
+    dict
+        'n_dof' (mean), 'n_dof_se' (standard error), 'n_dof_std' (system-to-
+        system fluctuation) and their analytic counterparts, per-level
+        accessibility ('level_probability', 'level_se',
+        'level_probability_analytic'), z-scores against the analytic formula
+        and 'max_abs_z'.
+    """
+    model = FractalConstraintModel(d_topo, w)
+    E_c_range = np.logspace(-3, 3, 61) if E_c_range is None else np.asarray(E_c_range, float)
+    n_levels = model.N_levels
+    if n_levels < 1:
+        raise ValueError("the model has no constraint levels")
+
+    per_chunk = max(1, chunk_modes // n_levels)
+    sizes = [min(per_chunk, n_systems - s) for s in range(0, n_systems, per_chunk)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    with np.errstate(divide='ignore'):
+        log_E = np.log(E_c_range)
+    args = (model.c1, n_levels, log_E, np.log(E_ref))
+
+    sum_n = np.zeros(E_c_range.size)
+    sum_n2 = np.zeros(E_c_range.size)
+    level_counts = np.zeros((n_levels, E_c_range.size))
+    if n_workers == 1:
+        results = (_simulate_chunk(*args, size, s) for size, s in zip(sizes, seeds))
+        for s1, s2, lc in results:
+            sum_n += s1
+            sum_n2 += s2
+            level_counts += lc
+    else:
+        with ProcessPoolExecutor(max_workers=n_workers) as pool:
+            for s1, s2, lc in pool.map(_simulate_chunk, *[[a] * len(sizes) for a in args],
+                                       sizes, seeds):
+                sum_n += s1
+                sum_n2 += s2
+                level_counts += lc
+
+    mean = sum_n / n_systems
+    var = np.maximum(sum_n2 / n_systems - mean**2, 0.0) * n_systems / max(n_systems - 1, 1)
+    se = np.sqrt(var / n_systems)
+
+    p = level_counts / n_systems
+    p_analytic = model.constraint_probability(E_c_range[None, :], E_ref,
+                                              np.arange(1, n_levels + 1)[:, None])
+    analytic = model.calculate_ndof_hierarchical(E_c_range, E_ref, d_low)
+    std_analytic = np.sqrt(np.sum(p_analytic * (1 - p_analytic), axis=0))
+
+    se_safe = np.where(se > 0, se, np.inf)
+    z = (d_low + mean - analytic) / se_safe
+    return {
+        'E_c': E_c_range,
+        'n_systems': n_systems,
+        'n_modes': n_systems * n_levels,
+        'n_dof': d_low + mean,
+        'n_dof_se': se,
+        'n_dof_std': np.sqrt(var),
+        'n_dof_analytic': analytic,
+        'n_dof_std_analytic': std_analytic,
+        'z_score': z,
+        'max_abs_z': float(np.max(np.abs(z))),
+        'level_probability': p,
+        'level_se': np.sqrt(p * (1 - p) / n_systems),
+        'level_probability_analytic': p_analytic,
+    }
+
+
+if __name__ == '__main__':
+    import os
+    import time
+
+    print("=" * 60)
+    print("Monte Carlo check of the hierarchical n_dof formula")
+    print("=" * 60)
+    for d, w in [(3, 0), (4, 0), (4, 1)]:
+        start = time.perf_counter()
+        res = simulate_ndof(d, w, n_systems=2_000_000, n_workers=os.cpu_count(), seed=0)
+        mid = len(res['E_c']) // 2
+        print(f"\nd={d}, w={w}: {res['n_modes']:.2e} modes in {time.perf_counter() - start:.1f} s")
+        print(f"  n_dof(E_ref) = {res['n_dof'][mid]:.4f} ± {res['n_dof_se'][mid]:.4f} "
+              f"(analytic {res['n_dof_analytic'][mid]:.4f})")
+        print(f"  fluctuation σ = {res['n_dof_std'][mid]:.4f} "
+              f"(analytic {res['n_dof_std_analytic'][mid]:.4f})")
+        print(f"  max |z| over the grid = {res['max_abs_z']:.2f}")
@@ -11,6 +11,81 @@ import numpy as np
 import matplotlib.pyplot as plt
 from scipy.optimize import curve_fit
 from scipy.interpolate import interp1d
+from scipy.special import expit, logsumexp
+
+from box_counting import box_masses
+
+
+def trapezoid_weights(x):
+    """
+    Trapezoidal quadrature weights for a (possibly non-uniform) grid.
+
+    ∫ f dx ≈ Σ_i w_i f(x_i) with w_0 = (x_1 - x_0)/2, w_i = (x_{i+1} - x_{i-1})/2.
+    """
+    x = np.asarray(x, dtype=float)
+    w = np.zeros_like(x)
+    if x.size < 2:
+        return w
+    dx = np.diff(x)
+    w[:-1] += 0.5 * dx
+    w[1:] += 0.5 * dx
+    return w
+
+
+def log_moments(log_measure, q_values, log_weights=None, chunk_size=2**22):
+    """
+    Log partition function and its q-derivative for all q in one pass.
+
+    For each q evaluates
+        log Z(q) = log Σ_i w_i m_i^q
+        d log Z / dq = Σ_i w_i m_i^q ln m_i / Z(q)
+    as a log-sum-exp over an (n_q, n_E) block. The energy axis is processed in
+    chunks of at most ``chunk_size`` block elements and merged with logaddexp,
+    so memory stays bounded for very long grids.
+
+    Parameters
+    ----------
+    log_measure : ndarray
+        ln m_i on the support of the measure (finite values only)
+    q_values : array_like
+        Moment orders
+    log_weights : ndarray, optional
+        ln w_i (quadrature weights); unit weights if omitted
+    chunk_size : int
+        Maximum number of elements of the (n_q, chunk) block
+
+    Returns
+    -------
+    log_Z : ndarray
+        log Z(q)
+    mean_log : ndarray
+        Softmax-weighted mean of ln m, i.e. d log Z / dq
+    """
+    q = np.atleast_1d(np.asarray(q_values, dtype=float))
+    log_measure = np.asarray(log_measure, dtype=float)
+    log_Z = np.full(q.shape, -np.inf)
+    mean_log = np.zeros(q.shape)
+    step = max(1, chunk_size // max(q.size, 1))
+
+    for start in range(0, log_measure.size, step):
+        lm = log_measure[start:start + step]
+        a = q[:, None] * lm[None, :]
+        if log_weights is not None:
+            a += log_weights[start:start + step]
+        # one exponentiation serves both the sum and the weighted mean
+        a_max = a.max(axis=1, keepdims=True)
+        e = np.exp(a - a_max)
+        total = e.sum(axis=1)
+        log_Z_chunk = a_max[:, 0] + np.log(total)
+        mean_chunk = (e @ lm) / total
+
+        merged = np.logaddexp(log_Z, log_Z_chunk)
+        with np.errstate(invalid='ignore'):
+            mean_log = (mean_log * np.exp(log_Z - merged)
+                        + mean_chunk * np.exp(log_Z_chunk - merged))
+        log_Z = merged
+
+    return log_Z, mean_log
 
 
 class MultifractalAnalyzer:
@@ -37,99 +112,145 @@ class MultifractalAnalyzer:
         self.L = d_topo - 2 + w  # Number of constraint levels
         self.c1 = 2**(-self.L)
         
+    def _logistic(self, E_c, E_ref=1.0):
+        """
+        Transition fraction s = 1 / (1 + x^c1) in the stable logistic form.
+
+        s = expit(-c1 ln x), which neither overflows for large x nor loses
+        precision for small x; E_c = 0 gives s = 1.
+        """
+        x = np.asarray(E_c, dtype=float) / E_ref
+        with np.errstate(divide='ignore'):
+            return expit(-self.c1 * np.log(x))
+    
     def ndof_curve(self, E_c, E_ref=1.0):
         """
         Calculate n_dof as function of constraint energy.
         
         Uses the standard transition formula:
         n_dof(E_c) = d_low + (d_topo - d_low) / (1 + (E_c/E_ref)^c1)
+        
+        Accepts scalars or arrays of any shape.
         """
-        x = E_c / E_ref
-        return self.d_low + (self.d_topo - self.d_low) / (1.0 + x**self.c1)
+        return self.d_low + (self.d_topo - self.d_low) * self._logistic(E_c, E_ref)
+    
+    def ndof_log_derivative(self, E_c, E_ref=1.0):
+        """
+        Closed-form d n_dof / d ln(E_c).
+        
+        d n_dof / d ln E_c = -(d_topo - d_low) c1 s (1 - s),  s = 1 / (1 + x^c1)
+        """
+        s = self._logistic(E_c, E_ref)
+        return -(self.d_topo - self.d_low) * self.c1 * s * (1.0 - s)
     
     def local_dimension(self, E_c, E_ref=1.0):
         """
         Calculate local (pointwise) dimension at given E_c.
         
         α(E_c) = -d ln(n_dof) / d ln(E_c)
-        """
-        # Numerical derivative
-        dE = E_c * 0.001
         
-        n1 = self.ndof_curve(E_c - dE, E_ref)
-        n2 = self.ndof_curve(E_c + dE, E_ref)
+        Evaluated analytically for scalars or arrays; NaN where n_dof <= 0.
+        """
+        ndof = self.ndof_curve(E_c, E_ref)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            alpha = np.where(ndof > 0, -self.ndof_log_derivative(E_c, E_ref) / ndof, np.nan)
+        return alpha if alpha.ndim else float(alpha)
+    
+    def log_measure(self, E_c_range, E_ref=1.0, weights=None):
+        """
+        Normalised n_dof measure on the grid, in log space.
         
-        # Handle edge cases
-        if n1 <= 0 or n2 <= 0:
-            return np.nan
-            
-        alpha = -np.log(n2/n1) / np.log((E_c + dE)/(E_c - dE))
-        return alpha
+        The measure m = n_dof / ∫ n_dof dE_c is normalised with quadrature
+        weights (trapezoidal on the given, possibly non-uniform, grid unless
+        ``weights`` are supplied). Returns (ln m, ln w) restricted to points
+        with m > 0 and w > 0.
+        """
+        ndof = self.ndof_curve(E_c_range, E_ref)
+        weights = trapezoid_weights(E_c_range) if weights is None else np.asarray(weights, float)
+        support = (ndof > 0) & (weights > 0)
+        log_ndof = np.log(ndof[support])
+        log_w = np.log(weights[support])
+        log_norm = logsumexp(log_ndof + log_w)
+        return log_ndof - log_norm, log_w
     
-    def partition_function(self, q, E_c_range, E_ref=1.0):
+    def partition_function(self, q, E_c_range, E_ref=1.0, weights=None):
         """
         Calculate partition function Z(q) for multifractal analysis.
         
         Z(q) = ∫ dE_c [n_dof(E_c)]^q
         
-        This is related to the moment of the measure.
+        This is related to the moment of the measure. ``q`` may be a scalar or
+        an array; all orders share a single construction of the measure.
         """
-        ndof = np.array([self.ndof_curve(E_c, E_ref) for E_c in E_c_range])
-        
-        # Normalize to create probability measure
-        measure = ndof / np.trapz(ndof, E_c_range)
-        
-        # Calculate moment
-        Z_q = np.trapz(measure**q, E_c_range)
-        
-        return Z_q
+        log_m, log_w = self.log_measure(E_c_range, E_ref, weights)
+        log_Z, _ = log_moments(log_m, q, log_w)
+        Z_q = np.exp(log_Z)
+        return Z_q if np.ndim(q) else float(Z_q[0])
     
-    def tau_q(self, q_values, E_c_range, E_ref=1.0):
+    def tau_q(self, q_values, E_c_range, E_ref=1.0, weights=None):
         """
         Calculate mass exponent τ(q).
         
         τ(q) = lim_{ε→0} ln(Z(q)) / ln(ε)
         
-        where ε is the "box size" in energy space.
+        where ε is the "box size" in energy space, taken relative to the
+        integration span: ln 1/ε = ln(Σ w / E_ref). Z(q) is likewise
+        evaluated with energies in units of E_ref, so τ(q) depends neither on
+        the grid nor on the energy unit (as long as E_ref is given in the same
+        unit as E_c_range).
+        """
+        tau, _ = self._tau_alpha(q_values, E_c_range, E_ref, weights)
+        return tau
+    
+    def _tau_alpha(self, q_values, E_c_range, E_ref=1.0, weights=None):
+        """
+        τ(q) and α(q) = dτ/dq from a single log-sum-exp reduction.
+        
+        The scale is ln(Σ w / E_ref), the integration span (E_max - E_min for
+        the trapezoidal rule) in units of E_ref; on the default uniform
+        1000-point grid over [1e-3, 1e3] it equals the former ln(number of
+        points) to 1e-6. It is negative for spans below E_ref, where τ(q) is
+        equally well defined, and only a span of E_ref itself is singular.
         """
-        tau = []
-        
-        for q in q_values:
-            Z_q = self.partition_function(q, E_c_range, E_ref)
-            if Z_q > 0:
-                # Effective scaling exponent
-                tau_q_val = np.log(Z_q) / np.log(len(E_c_range))
-                tau.append(tau_q_val)
-            else:
-                tau.append(np.nan)
-                
-        return np.array(tau)
-    
-    def singularity_spectrum(self, alpha_range, E_c_range, E_ref=1.0):
+        weights = trapezoid_weights(E_c_range) if weights is None else np.asarray(weights, float)
+        scale = np.log(np.sum(weights) / E_ref)
+        if np.abs(scale) < 1e-6:
+            raise ValueError("τ(q) is undefined when the integration span equals E_ref (ln span = 0)")
+        log_m, log_w = self.log_measure(E_c_range, E_ref, weights)
+        log_Z, mean_log = log_moments(log_m, q_values, log_w)
+        # m·E_ref and dE/E_ref are dimensionless
+        log_E_ref = np.log(E_ref)
+        log_Z = log_Z + (np.asarray(q_values, float) - 1) * log_E_ref
+        mean_log = mean_log + log_E_ref
+        finite = np.isfinite(log_Z)
+        tau = np.where(finite, log_Z / scale, np.nan)
+        alpha = np.where(finite, mean_log / scale, np.nan)
+        return tau, alpha
+    
+    def singularity_spectrum(self, alpha_range, E_c_range, E_ref=1.0, weights=None):
         """
         Calculate singularity spectrum f(α).
         
         f(α) = q·α - τ(q)
         
-        where α = dτ/dq
+        where α = dτ/dq is obtained analytically as the measure-weighted mean
+        of ln m at each q (the softmax of q ln m), divided by the scale.
         """
-        # Calculate τ(q) for range of q
+        # Calculate τ(q) and α(q) for range of q in one pass
         q_values = np.linspace(-10, 10, 200)
-        tau = self.tau_q(q_values, E_c_range, E_ref)
+        tau, alpha = self._tau_alpha(q_values, E_c_range, E_ref, weights)
         
         # Remove NaN values
         valid_idx = ~np.isnan(tau)
         q_valid = q_values[valid_idx]
-        tau_valid = tau[valid_idx]
         
         if len(q_valid) < 2:
             return None, None
         
-        # Calculate α = dτ/dq
-        alpha = np.gradient(tau_valid, q_valid)
+        alpha = alpha[valid_idx]
         
         # Calculate f(α) = q·α - τ(q)
-        f_alpha = q_valid * alpha - tau_valid
+        f_alpha = q_valid * alpha - tau[valid_idx]
         
         return alpha, f_alpha
     
@@ -140,32 +261,28 @@ class MultifractalAnalyzer:
         N(ε) ∝ ε^(-D)
         where ε is box size.
         """
-        ndof = np.array([self.ndof_curve(E_c, E_ref) for E_c in E_c_range])
+        ndof = self.ndof_curve(E_c_range, E_ref)
+        occupied_points = (ndof > 0).astype(float)
+        n_points = len(E_c_range)
         
         dimensions = []
         
         for n_boxes in n_boxes_list:
-            # Divide energy range into boxes
-            box_size = len(E_c_range) / n_boxes
-            
-            # Count non-empty boxes
-            occupied = 0
-            for i in range(n_boxes):
-                start_idx = int(i * box_size)
-                end_idx = int((i + 1) * box_size)
-                if end_idx > len(ndof):
-                    end_idx = len(ndof)
-                
-                if np.any(ndof[start_idx:end_idx] > 0):
-                    occupied += 1
-            
+            # Divide energy range into boxes; count non-empty boxes from
+            # differences of the prefix sum of the occupation indicator
+            edges = np.minimum((np.arange(n_boxes + 1) * (n_points / n_boxes)).astype(int),
+                               n_points)
+            occupied = int(np.sum(box_masses(occupied_points, edges) > 0))
             dimensions.append((n_boxes, occupied))
             
         return dimensions
     
-    def analyze(self, E_c_range, E_ref=1.0, save_plots=True):
+    def analyze(self, E_c_range, E_ref=1.0, save_plots=True, weights=None):
         """
         Perform complete multifractal analysis.
+        
+        ``E_c_range`` may be non-uniform (e.g. from adaptive_grid); its
+        quadrature weights default to the trapezoidal rule on that grid.
         """
         results = {
             'd_topo': self.d_topo,
@@ -177,16 +294,15 @@ class MultifractalAnalyzer:
         }
         
         # 1. n_dof curve
-        results['n_dof'] = np.array([self.ndof_curve(E_c, E_ref) for E_c in E_c_range])
+        results['n_dof'] = self.ndof_curve(E_c_range, E_ref)
         
         # 2. Local dimension α(E_c)
-        results['alpha_local'] = np.array([self.local_dimension(E_c, E_ref) 
-                                           for E_c in E_c_range[10:-10]])
+        results['alpha_local'] = self.local_dimension(E_c_range[10:-10], E_ref)
         results['E_c_alpha'] = E_c_range[10:-10]
         
         # 3. Singularity spectrum f(α)
         alpha_range = np.linspace(0.5, 3.0, 100)
-        alpha, f_alpha = self.singularity_spectrum(alpha_range, E_c_range, E_ref)
+        alpha, f_alpha = self.singularity_spectrum(alpha_range, E_c_range, E_ref, weights)
         results['alpha_spectrum'] = alpha
         results['f_alpha'] = f_alpha
         
@@ -5,167 +5,228 @@ Refined Multifractal Analysis with Improved f(α) Extraction
 Task 2.1.2: Complete multifractal spectrum analysis
 """
 
+import functools
+import hashlib
+import inspect
+from collections import OrderedDict
+
 import numpy as np
 import matplotlib.pyplot as plt
 from scipy.optimize import minimize_scalar, curve_fit
-from scipy.interpolate import UnivariateSpline
+from scipy.special import expit
+
+from box_counting import MultiscaleBoxCounter
+from correlation_dimension import (correlation_dimension as grassberger_procaccia,
+                                   sample_measure_points)
+from multifractal_analysis import log_moments
+
+
+def _cache_key(value):
+    """Hashable key for a method argument; arrays are keyed by a content digest."""
+    if isinstance(value, np.ndarray):
+        value = np.ascontiguousarray(value)
+        return ('array', value.shape, value.dtype.str, hashlib.sha1(value.data).hexdigest())
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, (list, tuple)):
+        return tuple(_cache_key(v) for v in value)
+    try:
+        hash(value)
+        return value
+    except TypeError:
+        return repr(value)
+
+
+def _read_only(value):
+    """Freeze arrays in a result and return fresh containers around them."""
+    if isinstance(value, np.ndarray):
+        value.flags.writeable = False
+        return value
+    if isinstance(value, dict):
+        return {k: _read_only(v) for k, v in value.items()}
+    if isinstance(value, tuple):
+        return tuple(_read_only(v) for v in value)
+    if isinstance(value, list):
+        return [_read_only(v) for v in value]
+    return value
+
+
+def _memoized(method):
+    """
+    Cache a method's results on the analyzer instance.
+    
+    The key combines the method name, the analyzer's parameter fingerprint and
+    all (default-completed) arguments, with arrays such as the energy grid
+    keyed by a SHA-1 digest of their contents. Cached arrays are read-only.
+    """
+    signature = inspect.signature(method)
+    
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        bound = signature.bind(self, *args, **kwargs)
+        bound.apply_defaults()
+        key = ((method.__name__, self._fingerprint())
+               + tuple(_cache_key(v) for v in list(bound.arguments.values())[1:]))
+        cache = self._cache
+        if key in cache:
+            cache.move_to_end(key)
+            self.cache_hits += 1
+        else:
+            self.cache_misses += 1
+            cache[key] = _read_only(method(self, *args, **kwargs))
+            while len(cache) > self.cache_size:
+                cache.popitem(last=False)
+        return _read_only(cache[key])
+    
+    return wrapper
 
 
 class RefinedMultifractalAnalyzer:
     """Improved analyzer with better f(α) extraction."""
     
-    def __init__(self, d_topo, w=0, d_low=2):
+    def __init__(self, d_topo, w=0, d_low=2, cache_size=32):
         self.d_topo = d_topo
         self.w = w
         self.d_low = d_low
         self.L = d_topo - 2 + w
         self.c1 = 2**(-self.L)
         
+        # Bounded LRU cache of measures, spectra and dimensions
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self.cache_hits = 0
+        self.cache_misses = 0
+    
+    def _fingerprint(self):
+        """Parameters that determine every cached result."""
+        return (self.d_topo, self.w, self.d_low, self.c1)
+    
+    def clear_cache(self):
+        """Drop all cached results."""
+        self._cache.clear()
+        self.cache_hits = 0
+        self.cache_misses = 0
+        
     def ndof_curve(self, E_c, E_ref=1.0):
-        """Standard transition formula."""
-        x = E_c / E_ref
-        return self.d_low + (self.d_topo - self.d_low) / (1.0 + x**self.c1)
+        """Standard transition formula (array-native, stable logistic form)."""
+        x = np.asarray(E_c, dtype=float) / E_ref
+        with np.errstate(divide='ignore'):
+            s = expit(-self.c1 * np.log(x))
+        return self.d_low + (self.d_topo - self.d_low) * s
     
     def measure_density(self, E_c, E_ref=1.0):
-        """Create probability measure from n_dof."""
-        ndof = self.ndof_curve(E_c, E_ref)
-        # Normalize to create probability density
-        # Use derivative as measure
-        dE = E_c * 0.001
-        ndof_plus = self.ndof_curve(E_c + dE, E_ref)
-        ndof_minus = self.ndof_curve(E_c - dE, E_ref)
+        """
+        Create probability measure from n_dof.
         
-        density = np.abs(ndof_plus - ndof_minus) / (2*dE)
+        Uses the closed-form derivative as measure:
+        |d n_dof / d E_c| = (d_topo - d_low) c1 s (1 - s) / E_c,  s = 1 / (1 + x^c1)
+        """
+        E_c = np.asarray(E_c, dtype=float)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            s = expit(-self.c1 * np.log(E_c / E_ref))
+            density = (self.d_topo - self.d_low) * self.c1 * s * (1.0 - s) / E_c
         return density
     
+    @_memoized
     def box_counting_refined(self, E_c_range, n_scales=20):
         """
         Refined box-counting with multiple methods.
         
+        All scales and moments come from one pass of the prefix-sum
+        box-counting engine.
+        
         Returns:
         - Capacity dimension D_0
         - Information dimension D_1
-        - Correlation dimension D_2
+        - Correlation dimension D_2 (q = 2 moment of the box masses)
+        - Correlation dimension D_2_GP (Grassberger–Procaccia pair counting)
         """
-        ndof = np.array([self.ndof_curve(E_c) for E_c in E_c_range])
-        
-        # Normalize
-        measure = ndof / np.sum(ndof)
-        
-        dimensions = {}
+        ndof = self.ndof_curve(E_c_range)
         
-        # Method 1: Capacity dimension (D_0)
-        # Count non-empty boxes at different scales
+        # Box sizes in index space
         scales = np.logspace(-2, 0, n_scales)
-        counts_0 = []
+        box_sizes = np.maximum(1, (len(E_c_range) * scales).astype(int))
         
-        for scale in scales:
-            # Box size in index space
-            box_size = max(1, int(len(E_c_range) * scale))
-            n_boxes = len(E_c_range) // box_size
-            
-            count = 0
-            for i in range(n_boxes):
-                start = i * box_size
-                end = min((i+1) * box_size, len(measure))
-                if np.sum(measure[start:end]) > 0:
-                    count += 1
-            counts_0.append(max(count, 1))
+        boxes = MultiscaleBoxCounter(box_sizes).update(ndof).finalize()
+        counts_0 = np.maximum(boxes['counts'], 1)
         
-        # Fit D_0
+        # Fit against the nominal scales, as before
         log_scales = np.log(scales)
-        log_counts = np.log(counts_0)
-        valid = np.isfinite(log_counts)
-        if np.sum(valid) > 2:
-            coeffs = np.polyfit(log_scales[valid], log_counts[valid], 1)
-            dimensions['D_0'] = -coeffs[0]
-        else:
-            dimensions['D_0'] = None
-            
-        # Method 2: Information dimension (D_1)
-        # D_1 = lim_{ε→0} Σ p_i log(p_i) / log(ε)
-        counts_1 = []
-        for scale in scales:
-            box_size = max(1, int(len(E_c_range) * scale))
-            n_boxes = len(E_c_range) // box_size
-            
-            entropy_sum = 0
-            for i in range(n_boxes):
-                start = i * box_size
-                end = min((i+1) * box_size, len(measure))
-                p_i = np.sum(measure[start:end])
-                if p_i > 0:
-                    entropy_sum += p_i * np.log(p_i)
-            
-            counts_1.append(np.exp(-entropy_sum) if entropy_sum < 0 else 1)
+        log_Z = dict(zip(boxes['q_values'], boxes['log_Z'].T))
+        fits = {
+            # D_0: non-empty boxes, N(ε) ∝ ε^(-D_0)
+            'D_0': (np.log(counts_0), -1.0),
+            # D_1 = lim_{ε→0} Σ p_i log(p_i) / log(ε)
+            'D_1': (-boxes['entropy'], 1.0),
+            # D_2: Σ p_i^2 ∝ ε^(D_2)
+            'D_2': (log_Z[2.0], 1.0),
+        }
         
-        log_counts = np.log(counts_1)
-        valid = np.isfinite(log_counts)
-        if np.sum(valid) > 2:
-            coeffs = np.polyfit(log_scales[valid], log_counts[valid], 1)
-            dimensions['D_1'] = -coeffs[0]
-        else:
-            dimensions['D_1'] = None
-            
-        # Method 3: Correlation dimension (D_2)
-        # D_2 from correlation sum
-        # Simplified: use moment q=2
+        dimensions = {}
+        for name, (values, sign) in fits.items():
+            valid = np.isfinite(values)
+            if np.sum(valid) > 2:
+                coeffs = np.polyfit(log_scales[valid], values[valid], 1)
+                dimensions[name] = sign * coeffs[0]
+            else:
+                dimensions[name] = None
+        
+        dimensions['D_2_GP'] = self.correlation_dimension(E_c_range)['D_2']
         
-        return dimensions, scales, counts_0
+        return dimensions, scales, counts_0.tolist()
     
-    def singularity_spectrum_refined(self, E_c_range, n_q=100):
+    @_memoized
+    def correlation_dimension(self, E_c_range, n_points=20000, seed=0, n_workers=1):
+        """
+        Grassberger–Procaccia correlation dimension of the n_dof measure.
+        
+        Points are sampled from the normalised n_dof measure in index space
+        (the same coordinates as the box-counting scales) and pairs are
+        counted for all radii with a sorted sweep.
+        """
+        points = sample_measure_points(self.ndof_curve(E_c_range), n_points, seed)
+        return grassberger_procaccia(points, n_workers=n_workers)
+    
+    @_memoized
+    def singularity_spectrum_refined(self, E_c_range, n_q=100, weights=None):
         """
         Improved f(α) extraction using Legendre transform method.
+        
+        τ(q) = ln Σ p_i^q is evaluated for all q as one log-sum-exp reduction;
+        α(q) = dτ/dq = Σ p_i^q ln p_i / Σ p_i^q follows analytically, so no
+        spline smoothing of τ(q) is needed.
+        
+        By default p_i is the density at each grid point. For a non-uniform
+        grid pass quadrature weights (e.g. trapezoid_weights(E_c_range)) so
+        that p_i = density_i · w_i is the mass of each cell.
         """
         # Create measure
-        measure = np.array([self.measure_density(E_c) for E_c in E_c_range])
-        measure = measure / np.sum(measure)
+        measure = self.measure_density(E_c_range)
+        if weights is not None:
+            measure = measure * np.asarray(weights, dtype=float)
+        measure = measure / np.nansum(measure)
+        support = measure > 0
         
         # q-range (avoid singularities at large |q|)
         q_values = np.linspace(-5, 5, n_q)
         
-        tau_q = []
-        valid_q = []
-        
-        for q in q_values:
-            # Calculate partition function
-            if q == 1:
-                # Special case: entropy
-                p_log_p = measure * np.log(measure + 1e-15)
-                Z_q = np.exp(-np.sum(p_log_p))
-            else:
-                Z_q = np.sum(measure**q)
-            
-            if Z_q > 0 and np.isfinite(Z_q):
-                # τ(q) from scaling
-                tau = np.log(Z_q)
-                tau_q.append(tau)
-                valid_q.append(q)
+        if np.sum(support) < 2:
+            return None, None, None, None
         
-        q_valid = np.array(valid_q)
-        tau_q = np.array(tau_q)
+        tau_q, alpha = log_moments(np.log(measure[support]), q_values)
         
         # Remove NaN values
-        valid = np.isfinite(tau_q)
-        q_valid = q_valid[valid]
-        tau_q = tau_q[valid]
-        
-        if len(q_valid) < 3:
+        valid = np.isfinite(tau_q) & np.isfinite(alpha)
+        if np.sum(valid) < 3:
             return None, None, None, None
-        
-        # Smooth τ(q) with spline
-        spline = UnivariateSpline(q_valid, tau_q, s=0.1)
-        
-        # Calculate α = dτ/dq
-        q_fine = np.linspace(q_valid.min(), q_valid.max(), 200)
-        alpha = spline.derivative()(q_fine)
+        q_values, tau_q, alpha = q_values[valid], tau_q[valid], alpha[valid]
         
         # f(α) = q·α - τ(q)
-        tau_fine = spline(q_fine)
-        f_alpha = q_fine * alpha - tau_fine
+        f_alpha = q_values * alpha - tau_q
         
-        return q_fine, alpha, f_alpha, tau_fine
+        return q_values, alpha, f_alpha, tau_q
     
+    @_memoized
     def scaling_exponents(self, E_c_range):
         """
         Extract various scaling exponents.
@@ -226,6 +287,12 @@ class RefinedMultifractalAnalyzer:
         return exponents
 
 
+@functools.lru_cache(maxsize=64)
+def get_analyzer(d_topo, w=0, d_low=2):
+    """Shared analyzer per (d_topo, w, d_low), so its result cache is reused."""
+    return RefinedMultifractalAnalyzer(d_topo, w, d_low)
+
+
 def plot_comprehensive_analysis(d_values=[3, 4, 5], w_values=[0, 1]):
     """Generate comprehensive comparison plots."""
     
@@ -253,8 +320,8 @@ def plot_comprehensive_analysis(d_values=[3, 4, 5], w_values=[0, 1]):
     ax2 = plt.subplot(3, 3, 2)
     E_c = np.logspace(-3, 3, 1000)
     for d, w in systems[:4]:  # Plot first 4
-        analyzer = RefinedMultifractalAnalyzer(d, w)
-        ndof = [analyzer.ndof_curve(ec) for ec in E_c]
+        analyzer = get_analyzer(d, w)
+        ndof = analyzer.ndof_curve(E_c)
         ax2.semilogx(E_c, ndof, label=f'd={d},w={w}', linewidth=2)
     ax2.set_xlabel('$E_c / E_{ref}$')
     ax2.set_ylabel('$n_{dof}$')
@@ -267,7 +334,7 @@ def plot_comprehensive_analysis(d_values=[3, 4, 5], w_values=[0, 1]):
     D_0_vals = []
     c1_list = []
     for d, w in systems:
-        analyzer = RefinedMultifractalAnalyzer(d, w)
+        analyzer = get_analyzer(d, w)
         dims, _, _ = analyzer.box_counting_refined(E_c)
         if dims.get('D_0') is not None:
             D_0_vals.append(dims['D_0'])
@@ -281,7 +348,7 @@ def plot_comprehensive_analysis(d_values=[3, 4, 5], w_values=[0, 1]):
     # Plot 4: f(α) spectra
     ax4 = plt.subplot(3, 3, 4)
     for d, w in systems[:3]:
-        analyzer = RefinedMultifractalAnalyzer(d, w)
+        analyzer = get_analyzer(d, w)
         q, alpha, f_alpha, tau = analyzer.singularity_spectrum_refined(E_c)
         if alpha is not None:
             valid = (f_alpha > 0) & np.isfinite(f_alpha)
@@ -296,7 +363,7 @@ def plot_comprehensive_analysis(d_values=[3, 4, 5], w_values=[0, 1]):
     # Plot 5: τ(q) curves
     ax5 = plt.subplot(3, 3, 5)
     for d, w in systems[:3]:
-        analyzer = RefinedMultifractalAnalyzer(d, w)
+        analyzer = get_analyzer(d, w)
         q, alpha, f_alpha, tau = analyzer.singularity_spectrum_refined(E_c)
         if q is not None:
             ax5.plot(q, tau, label=f'd={d},w={w}', linewidth=2)
@@ -309,7 +376,7 @@ def plot_comprehensive_analysis(d_values=[3, 4, 5], w_values=[0, 1]):
     # Plot 6: α(q) curves
     ax6 = plt.subplot(3, 3, 6)
     for d, w in systems[:3]:
-        analyzer = RefinedMultifractalAnalyzer(d, w)
+        analyzer = get_analyzer(d, w)
         q, alpha, f_alpha, tau = analyzer.singularity_spectrum_refined(E_c)
         if q is not None:
             ax6.plot(q, alpha, label=f'd={d},w={w}', linewidth=2)
@@ -324,7 +391,7 @@ def plot_comprehensive_analysis(d_values=[3, 4, 5], w_values=[0, 1]):
     Delta_alpha_vals = []
     c1_for_delta = []
     for d, w in systems:
-        analyzer = RefinedMultifractalAnalyzer(d, w)
+        analyzer = get_analyzer(d, w)
         exponents = analyzer.scaling_exponents(E_c)
         if 'Delta_alpha' in exponents:
             Delta_alpha_vals.append(exponents['Delta_alpha'])
@@ -350,7 +417,7 @@ def plot_comprehensive_analysis(d_values=[3, 4, 5], w_values=[0, 1]):
     table_text += "-" * 40 + "\n"
     
     for d, w in systems:
-        analyzer = RefinedMultifractalAnalyzer(d, w)
+        analyzer = get_analyzer(d, w)
         dims, _, _ = analyzer.box_counting_refined(E_c)
         D_0 = dims.get('D_0', 0)
         name = f"d={d},w={w}"
@@ -410,7 +477,7 @@ def main():
     print("-" * 70)
     
     for d, w in systems:
-        analyzer = RefinedMultifractalAnalyzer(d, w)
+        analyzer = get_analyzer(d, w)
         exponents = analyzer.generate_report(E_c_range)
     
     # Generate comprehensive comparison
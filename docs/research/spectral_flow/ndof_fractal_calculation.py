@@ -10,7 +10,9 @@ Task: 2.1.1 - Subtask 2: Calculate n_dof for fractal hierarchy
 
 import numpy as np
 import matplotlib.pyplot as plt
-from scipy.special import gamma, zeta
+from scipy.special import expit, gamma, zeta
+
+from multifractal_analysis import trapezoid_weights
 
 
 class FractalConstraintModel:
@@ -42,10 +44,15 @@ class FractalConstraintModel:
         P_acc = 1 / (1 + (E_c/E_ref)^(c1 * 2^level))
         
         The factor 2^level accounts for hierarchical constraint strength.
+        
+        Evaluated in the log domain as expit(-k ln x) with k = c1 · 2^level
+        (np.ldexp), so it neither overflows for E_c >> E_ref nor for deep
+        hierarchies. ``level`` and ``E_c`` broadcast against each other.
         """
-        effective_c = self.c1 * (2**level)
-        x = E_c / E_ref
-        return 1.0 / (1.0 + x**effective_c)
+        effective_c = np.ldexp(self.c1, np.asarray(level))
+        x = np.asarray(E_c, dtype=float) / E_ref
+        with np.errstate(divide='ignore'):
+            return expit(-effective_c * np.log(x))
     
     def calculate_ndof(self, E_c, E_ref, d_low=2):
         """
@@ -53,47 +60,63 @@ class FractalConstraintModel:
         
         n_dof = d_low + (d_topo - d_low) / (1 + (E_c/E_ref)^c1)
         
-        This is the standard dimension flow formula.
+        This is the standard dimension flow formula (stable logistic form).
         """
-        x = E_c / E_ref
-        return d_low + (self.d_topo - d_low) / (1.0 + x**self.c1)
+        x = np.asarray(E_c, dtype=float) / E_ref
+        with np.errstate(divide='ignore'):
+            return d_low + (self.d_topo - d_low) * expit(-self.c1 * np.log(x))
     
-    def calculate_ndof_hierarchical(self, E_c, E_ref, d_low=2):
+    def calculate_ndof_hierarchical(self, E_c, E_ref, d_low=2, block_size=2**22):
         """
         Calculate n_dof using explicit hierarchical model.
         
-        Sum over all constraint levels with level-dependent accessibility.
+        Sum over all constraint levels with level-dependent accessibility,
+        evaluated as a broadcast (levels × energies) block. The energy axis is
+        processed in chunks of at most ``block_size`` block elements, so
+        hundreds of levels on million-point grids stay within bounded memory.
         """
-        n_accessible = 0
+        E_c = np.asarray(E_c, dtype=float)
+        flat = E_c.ravel()
         
         # Level 0: Always accessible (2 dimensions - time + 1 space)
-        n_accessible += d_low
+        n_accessible = np.full(flat.shape, float(d_low))
         
         # Higher levels: Each contributes based on constraint probability
-        for level in range(1, self.N_levels + 1):
-            p_acc = self.constraint_probability(E_c, E_ref, level)
-            n_accessible += p_acc
+        levels = np.arange(1, self.N_levels + 1)[:, None]
+        step = max(1, block_size // max(len(levels), 1))
+        for start in range(0, flat.size, step):
+            chunk = flat[start:start + step]
+            n_accessible[start:start + step] += np.sum(
+                self.constraint_probability(chunk[None, :], E_ref, levels), axis=0)
             
-        return n_accessible
+        n_accessible = n_accessible.reshape(E_c.shape)
+        return n_accessible if n_accessible.ndim else float(n_accessible)
     
     def fractal_dimension(self, E_c, E_ref):
         """
         Calculate effective fractal dimension at given constraint energy.
         
         D_f = -d log(n_dof) / d log(E_c)
-        """
-        # Numerical derivative
-        dE = E_c * 0.01
-        n1 = self.calculate_ndof(E_c - dE, E_ref)
-        n2 = self.calculate_ndof(E_c + dE, E_ref)
         
-        return -np.log(n2/n1) / np.log((E_c + dE)/(E_c - dE))
+        Closed form for the standard formula with d_low = 2:
+        D_f = (d_topo - 2) c1 s (1 - s) / n_dof,  s = 1 / (1 + x^c1)
+        """
+        x = np.asarray(E_c, dtype=float) / E_ref
+        with np.errstate(divide='ignore'):
+            s = expit(-self.c1 * np.log(x))
+        return (self.d_topo - 2) * self.c1 * s * (1 - s) / self.calculate_ndof(E_c, E_ref)
 
 
-def analyze_system(d_topo, w, E_c_range, E_ref=1.0):
+def analyze_system(d_topo, w, E_c_range, E_ref=1.0, weights=None):
     """
     Analyze a system with given topological dimension.
     
+    ``E_c_range`` may be non-uniform (e.g. from adaptive_grid). The mean
+    fractal dimension is an average over ln E_c, using dE_c quadrature weights
+    for the whole grid (the convention of ``trapezoid_weights`` and
+    ``adaptive_energy_grid``) converted to d ln E_c = dE_c / E_c on the
+    interior points where D_f is evaluated.
+    
     Parameters:
     -----------
     d_topo : int
@@ -104,6 +127,9 @@ def analyze_system(d_topo, w, E_c_range, E_ref=1.0):
         Range of constraint energies to analyze
     E_ref : float
         Reference energy scale
+    weights : array, optional
+        Quadrature weights dE_c for every point of E_c_range; trapezoidal
+        on the grid by default
         
     Returns:
     --------
@@ -112,12 +138,18 @@ def analyze_system(d_topo, w, E_c_range, E_ref=1.0):
     """
     model = FractalConstraintModel(d_topo, w)
     
-    # Calculate n_dof for each E_c
-    n_dof_standard = [model.calculate_ndof(E_c, E_ref) for E_c in E_c_range]
-    n_dof_hierarchical = [model.calculate_ndof_hierarchical(E_c, E_ref) for E_c in E_c_range]
+    # Calculate n_dof on the whole grid
+    n_dof_standard = model.calculate_ndof(E_c_range, E_ref)
+    n_dof_hierarchical = model.calculate_ndof_hierarchical(E_c_range, E_ref)
     
     # Calculate fractal dimension
-    D_f = [model.fractal_dimension(E_c, E_ref) for E_c in E_c_range[1:-1]]
+    D_f = model.fractal_dimension(E_c_range[1:-1], E_ref)
+    
+    weights = trapezoid_weights(E_c_range) if weights is None else np.asarray(weights, float)
+    if weights.shape != np.shape(E_c_range):
+        raise ValueError("weights must have one entry per point of E_c_range")
+    log_weights = weights[1:-1] / E_c_range[1:-1]
+    D_f_mean = np.sum(log_weights * D_f) / np.sum(log_weights)
     
     return {
         'model': model,
@@ -125,6 +157,7 @@ def analyze_system(d_topo, w, E_c_range, E_ref=1.0):
         'n_dof_standard': n_dof_standard,
         'n_dof_hierarchical': n_dof_hierarchical,
         'D_f': D_f,
+        'D_f_mean': D_f_mean,
         'c1': model.c1,
         'N_levels': model.N_levels
     }
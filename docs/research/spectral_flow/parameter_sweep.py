@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+"""
+Parallel Parameter Sweeps for Dimension-Flow Analyzers
+
+Evaluates an analyzer (RefinedMultifractalAnalyzer, FractalConstraintModel or
+RGFlowAnalyzer) over the Cartesian product of parameter grids — d_topo, w,
+d_low, E_ref and any analyzer-specific parameters — for phase-diagram studies
+with 10^4–10^6 points.
+
+- The flattened grid is split into shards of ``shard_size`` points
+- Shards are evaluated in a process pool; each worker writes its shard as a
+  columnar .npz file (one array per input parameter and per output quantity)
+- A sweep.json manifest records the grid, so an interrupted sweep resumes by
+  skipping shards whose files already exist
+- ``load_sweep`` concatenates the shards into one column table
+
+Task: 2.1 - Phase diagram studies (supporting module)
+"""
+
+import json
+import os
+import traceback
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from itertools import product
+from pathlib import Path
+
+from multifractal_refined import RefinedMultifractalAnalyzer
+from ndof_fractal_calculation import FractalConstraintModel
+from rg_flow_numerical import RGFlowAnalyzer
+
+
+MANIFEST = 'sweep.json'
+DEFAULT_E_C_RANGE = np.logspace(-3, 3, 1000)
+
+# Numerical failures at individual points become NaN rows; anything else
+# (e.g. a misspelled grid axis) is a programming error and fails the shard
+POINT_ERRORS = (ValueError, FloatingPointError, ZeroDivisionError, np.linalg.LinAlgError)
+
+
+# ============ Evaluators ============
+# Each evaluator maps one parameter point to a dict of scalar outputs. Grid
+# axes other than the standard ones are passed through as keyword arguments.
+
+def evaluate_multifractal(d_topo, w=0, d_low=2, E_ref=1.0, E_c_range=None):
+    """Scaling exponents of RefinedMultifractalAnalyzer at one parameter point."""
+    E_c_range = DEFAULT_E_C_RANGE if E_c_range is None else np.asarray(E_c_range)
+    analyzer = RefinedMultifractalAnalyzer(int(d_topo), int(w), d_low)
+    # the analyzer's curves depend on E_c only through E_c / E_ref
+    out = {'c1': analyzer.c1}
+    out.update(analyzer.scaling_exponents(E_c_range / E_ref))
+    return out
+
+
+def evaluate_fractal_model(d_topo, w=0, d_low=2, E_ref=1.0, E_c_range=None):
+    """Standard vs hierarchical n_dof of FractalConstraintModel at one parameter point."""
+    E_c_range = DEFAULT_E_C_RANGE if E_c_range is None else np.asarray(E_c_range)
+    model = FractalConstraintModel(int(d_topo), int(w))
+    standard = model.calculate_ndof(E_c_range, E_ref, d_low)
+    hierarchical = model.calculate_ndof_hierarchical(E_c_range, E_ref, d_low)
+    D_f = model.fractal_dimension(E_c_range[1:-1], E_ref)
+    peak = int(np.nanargmax(D_f))
+    return {
+        'c1': model.c1,
+        'n_dof_at_ref': model.calculate_ndof(E_ref, E_ref, d_low),
+        'n_dof_hierarchical_at_ref': model.calculate_ndof_hierarchical(E_ref, E_ref, d_low),
+        'max_hierarchy_deviation': np.max(np.abs(standard - hierarchical)),
+        'D_f_max': D_f[peak],
+        'E_c_at_D_f_max': E_c_range[1:-1][peak],
+    }
+
+
+def evaluate_rg_flow(d_topo, w=0, form='constrained', c1_min=1e-4, n_c1=500, **params):
+    """Phase-space zeros and critical exponent of RGFlowAnalyzer at one parameter point."""
+    analyzer = RGFlowAnalyzer(int(d_topo), int(w))
+    c1_range = np.logspace(np.log10(c1_min), 0, int(n_c1))
+    _, zeros = analyzer.analyze_phase_space(c1_range, form, **params)
+    return {
+        'c1_star': analyzer.c1_star,
+        'n_zeros': len(zeros),
+        'first_zero': zeros[0] if zeros else np.nan,
+        'theta_star': analyzer.critical_exponent(analyzer.c1_star, form, **params),
+    }
+
+
+EVALUATORS = {
+    'multifractal': evaluate_multifractal,
+    'fractal_model': evaluate_fractal_model,
+    'rg_flow': evaluate_rg_flow,
+}
+
+
+# ============ Grid and shards ============
+
+def parameter_grid(grid):
+    """
+    Flatten a dict of parameter axes into columns of the Cartesian product.
+
+    The last axis varies fastest, so shard k always covers the same points for
+    the same grid.
+    """
+    names = list(grid)
+    axes = [np.atleast_1d(grid[name]) for name in names]
+    points = list(product(*axes))
+    return {name: np.array([p[i] for p in points]) for i, name in enumerate(names)}
+
+
+def _jsonable(value):
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, (np.integer, np.floating)):
+        return value.item()
+    if isinstance(value, dict):
+        return {k: _jsonable(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_jsonable(v) for v in value]
+    return value
+
+
+def _shard_path(directory, index):
+    return Path(directory) / f"shard_{index:06d}.npz"
+
+
+def _run_shard(directory, index, evaluator, columns, options):
+    """
+    Evaluate one shard and write it as a columnar .npz (atomically).
+
+    Points raising one of POINT_ERRORS are recorded as failed (NaN outputs,
+    first traceback kept in the shard file). Other exceptions propagate, and
+    a shard in which every point failed is not written, so such errors cannot
+    produce a "completed" sweep of NaNs.
+    """
+    func = EVALUATORS[evaluator]
+    n = len(next(iter(columns.values())))
+    rows = []
+    n_failed = 0
+    first_error = ''
+    for i in range(n):
+        point = {name: values[i].item() for name, values in columns.items()}
+        try:
+            rows.append(func(**point, **options))
+        except POINT_ERRORS:
+            rows.append(None)
+            n_failed += 1
+            if not first_error:
+                first_error = traceback.format_exc()
+    if n_failed == n:
+        raise RuntimeError(f"every point of shard {index} failed; first error:\n{first_error}")
+
+    keys = []
+    for row in rows:
+        for key in row or {}:
+            if key not in keys:
+                keys.append(key)
+    outputs = {}
+    for key in keys:
+        values = [np.nan if row is None or row.get(key) is None else row[key] for row in rows]
+        outputs[key] = np.asarray(values, dtype=float)
+
+    path = _shard_path(directory, index)
+    tmp = path.with_suffix('.tmp.npz')
+    np.savez(tmp, **columns, **{f"out_{k}": v for k, v in outputs.items()},
+             failed=np.array([row is None for row in rows]),
+             first_error=np.array(first_error))
+    os.replace(tmp, path)
+    return index, n, n_failed
+
+
+def run_sweep(directory, grid, evaluator='multifractal', options=None,
+              shard_size=256, n_workers=1, verbose=True):
+    """
+    Evaluate ``evaluator`` over the Cartesian product of ``grid``.
+
+    Parameters
+    ----------
+    directory : str or Path
+        Output directory for the manifest and the shard files
+    grid : dict
+        Parameter axes, e.g. {'d_topo': [3, 4, 5, 6], 'w': [0, 1],
+        'E_ref': np.logspace(-1, 1, 50)}
+    evaluator : str
+        Key of EVALUATORS
+    options : dict, optional
+        Fixed keyword arguments for every point (e.g. 'E_c_range')
+    shard_size : int
+        Points per shard file
+    n_workers : int
+        Worker processes (1 = serial)
+
+    Returns
+    -------
+    dict
+        Counts of total, skipped (already present), computed and failed shards/points
+    """
+    if evaluator not in EVALUATORS:
+        raise ValueError(f"Unknown evaluator: {evaluator}")
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    options = dict(options or {})
+
+    manifest = {
+        'evaluator': evaluator,
+        'grid': _jsonable(grid),
+        'options': _jsonable(options),
+        'shard_size': int(shard_size),
+    }
+    manifest_path = directory / MANIFEST
+    if manifest_path.exists():
+        existing = json.loads(manifest_path.read_text(encoding='utf-8'))
+        if existing != manifest:
+            raise ValueError(f"{manifest_path} describes a different sweep; use a new directory")
+    else:
+        manifest_path.write_text(json.dumps(manifest, indent=2), encoding='utf-8')
+
+    columns = parameter_grid(grid)
+    n_points = len(next(iter(columns.values())))
+    n_shards = -(-n_points // shard_size)
+    pending = [k for k in range(n_shards) if not _shard_path(directory, k).exists()]
+    if verbose:
+        print(f"Sweep: {n_points} points in {n_shards} shards, "
+              f"{n_shards - len(pending)} already done")
+
+    def shard_columns(k):
+        sl = slice(k * shard_size, (k + 1) * shard_size)
+        return {name: values[sl] for name, values in columns.items()}
+
+    summary = {'n_points': n_points, 'n_shards': n_shards,
+               'skipped': n_shards - len(pending), 'computed': 0, 'failed_points': 0}
+    if n_workers == 1:
+        results = (_run_shard(directory, k, evaluator, shard_columns(k), options) for k in pending)
+        for _, _, n_failed in results:
+            summary['computed'] += 1
+            summary['failed_points'] += n_failed
+    else:
+        with ProcessPoolExecutor(max_workers=n_workers) as pool:
+            futures = [pool.submit(_run_shard, directory, k, evaluator, shard_columns(k), options)
+                       for k in pending]
+            for future in as_completed(futures):
+                _, _, n_failed = future.result()
+                summary['computed'] += 1
+                summary['failed_points'] += n_failed
+                if verbose and summary['computed'] % max(1, len(pending) // 10) == 0:
+                    print(f"  {summary['computed']}/{len(pending)} shards")
+    return summary
+
+
+def load_sweep(directory):
+    """
+    Concatenate all shard files into one column table.
+
+    Returns a dict of arrays: the input parameters, the outputs (prefixed
+    'out_'), the 'failed' mask and 'shard_errors' (the first traceback of
+    each shard, '' if none failed). Missing shards are skipped.
+    """
+    directory = Path(directory)
+    shards = sorted(directory.glob('shard_*.npz'))
+    shards = [p for p in shards if not p.name.endswith('.tmp.npz')]
+    if not shards:
+        return {}
+    parts = [dict(np.load(p)) for p in shards]
+    shard_errors = np.array([str(part.pop('first_error', '')) for part in parts])
+    keys = []
+    for part in parts:
+        keys.extend(k for k in part if k not in keys)
+    table = {}
+    for key in keys:
+        table[key] = np.concatenate([
+            part[key] if key in part else np.full(len(part['failed']), np.nan)
+            for part in parts
+        ])
+    table['shard_errors'] = shard_errors
+    return table
+
+
+if __name__ == '__main__':
+    import sys
+    import tempfile
+
+    directory = sys.argv[1] if len(sys.argv) > 1 else tempfile.mkdtemp(prefix='sweep_')
+    grid = {'d_topo': [3, 4, 5, 6], 'w': [0, 1], 'E_ref': np.logspace(-1, 1, 5)}
+    summary = run_sweep(directory, grid, 'fractal_model', shard_size=8,
+                        n_workers=os.cpu_count())
+    print(summary)
+    table = load_sweep(directory)
+    for d, w, e, n in zip(table['d_topo'], table['w'], table['E_ref'], table['out_n_dof_at_ref']):
+        if e == 1.0:
+            print(f"  d={d}, w={w}: n_dof(E_ref) = {n:.3f}")
+    print(f"Results in {directory}")
@@ -183,16 +183,21 @@ class RGFlowAnalyzer:
     def analyze_phase_space(self, c1_range, form='constrained', **params):
         """
         Analyze phase space (beta vs c1).
+        
+        c1_range may be any sorted, possibly non-uniform grid (e.g. from
+        adaptive_grid). Zeros are located by linear interpolation of beta
+        between the two points bracketing each sign change, so their accuracy
+        does not depend on the grid spacing alone.
         """
-        beta_vals = [self.beta_function_c1(c1, form, **params) for c1 in c1_range]
+        c1_range = np.asarray(c1_range, dtype=float)
+        beta_vals = np.array([self.beta_function_c1(c1, form, **params) for c1 in c1_range])
         
         # Find zeros
-        zeros = []
-        for i in range(len(beta_vals) - 1):
-            if beta_vals[i] * beta_vals[i+1] < 0:  # Sign change
-                zeros.append(c1_range[i])
+        i = np.flatnonzero(beta_vals[:-1] * beta_vals[1:] < 0)  # Sign change
+        b0, b1 = beta_vals[i], beta_vals[i + 1]
+        zeros = list(c1_range[i] - b0 * (c1_range[i + 1] - c1_range[i]) / (b1 - b0))
         
-        return np.array(beta_vals), zeros
+        return beta_vals, zeros
 
 
 def plot_rg_flow_comparison(analyzer, t_range, forms=['polynomial', 'logarithmic', 'constrained']):
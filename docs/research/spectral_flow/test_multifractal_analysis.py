@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""
+Grid independence of the spectral-flow analyzers: τ(q) must not depend on how
+the energy interval is sampled, and adaptive grids must be usable directly.
+"""
+
+import numpy as np
+import pytest
+
+from adaptive_grid import adaptive_energy_grid
+from multifractal_analysis import MultifractalAnalyzer
+from ndof_fractal_calculation import FractalConstraintModel, analyze_system
+
+Q = np.array([-3.0, -1.0, 0.0, 1.0, 2.0, 3.0])
+
+
+@pytest.mark.parametrize("d_topo, w", [(3, 0), (4, 0), (4, 1)])
+def test_tau_agrees_between_adaptive_and_uniform_grids(d_topo, w):
+    analyzer = MultifractalAnalyzer(d_topo, w)
+    E_c, weights, _ = adaptive_energy_grid(analyzer.ndof_curve,
+                                           local_dimension_func=analyzer.local_dimension)
+    tau_uniform = analyzer.tau_q(Q, np.logspace(-3, 3, 1000))
+    tau_adaptive = analyzer.tau_q(Q, E_c, weights=weights)
+
+    assert E_c.size < 200
+    np.testing.assert_allclose(tau_adaptive, tau_uniform, atol=1e-4)
+    assert tau_adaptive[Q == 0][0] == pytest.approx(1.0, abs=1e-6)
+
+
+def test_tau_defined_for_spans_below_one_and_unit_free():
+    analyzer = MultifractalAnalyzer(4)
+    E_c = np.linspace(0.1, 1.0, 100)
+    tau = analyzer.tau_q(Q, E_c)
+
+    assert np.all(np.isfinite(tau))
+    assert tau[Q == 0][0] == pytest.approx(1.0, abs=1e-6)
+    np.testing.assert_allclose(analyzer.tau_q(Q, 1e3 * E_c, E_ref=1e3), tau, atol=1e-10)
+
+
+def test_tau_rejects_span_equal_to_reference_energy():
+    with pytest.raises(ValueError):
+        MultifractalAnalyzer(4).tau_q(Q, np.linspace(1.0, 2.0, 50))
+
+
+@pytest.mark.parametrize("d_topo, w", [(3, 0), (4, 0), (4, 1)])
+def test_analyze_system_accepts_adaptive_grid(d_topo, w):
+    model = FractalConstraintModel(d_topo, w)
+    E_c, weights, _ = adaptive_energy_grid(lambda E: model.calculate_ndof(E, 1.0))
+    result = analyze_system(d_topo, w, E_c, weights=weights)
+    reference = analyze_system(d_topo, w, np.logspace(-3, 3, 100_000))
+
+    assert result['D_f_mean'] == pytest.approx(reference['D_f_mean'], rel=2e-2)
@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+"""
+批量最小二乘拟合 - 向量化Levenberg-Marquardt
+目标：一次性拟合成千上万个小数据集（bootstrap重采样、留一交叉验证、多材料），
+避免逐个调用curve_fit的解释器开销
+"""
+
+import numpy as np
+from scipy.linalg import solve_triangular
+from dataclasses import dataclass
+from typing import Callable, Optional, Sequence, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class BatchedFitResult:
+    """批量拟合结果容器"""
+    params: np.ndarray  # (B, P) 最优参数
+    covariance: np.ndarray  # (B, P, P) 参数协方差
+    chi2: np.ndarray  # (B,) 加权残差平方和
+    n_points: np.ndarray  # (B,) 参与拟合的数据点数
+    converged: np.ndarray  # (B,) 是否收敛
+    n_iter: int  # 实际迭代次数
+
+    @property
+    def errors(self) -> np.ndarray:
+        """参数标准误差 (B, P)"""
+        return np.sqrt(np.clip(np.diagonal(self.covariance, axis1=1, axis2=2), 0, None))
+
+
+# ============ 维度流模型的解析雅可比 ============
+
+def dimflow_jacobian(n, delta0, n0, c1):
+    """
+    维度流模型 δ(n) = δ₀ n₀^c₁ / (n^c₁ + n₀^c₁) 的解析雅可比
+
+    返回 (..., N, 3) 数组，依次为 ∂δ/∂δ₀, ∂δ/∂n₀, ∂δ/∂c₁
+    """
+    s = n**c1
+    s0 = n0**c1
+    denom = s + s0
+    d_delta0 = s0 / denom
+    d_n0 = delta0 * c1 * n0**(c1 - 1) * s / denom**2
+    d_c1 = delta0 * s0 * s * (np.log(n0) - np.log(n)) / denom**2
+    return np.stack(np.broadcast_arrays(d_delta0, d_n0, d_c1), axis=-1)
+
+
+def dimflow_fixed_jacobian(c1=1.0):
+    """固定c₁时维度流模型对 (δ₀, n₀) 的解析雅可比"""
+
+    def jac(n, delta0, n0):
+        return dimflow_jacobian(n, delta0, n0, c1)[..., :2]
+
+    return jac
+
+
+# ============ 相关误差 ============
+
+def covariance_cholesky(covariance: np.ndarray) -> np.ndarray:
+    """协方差矩阵的下三角Cholesky因子，每个数据集只需分解一次"""
+    return np.linalg.cholesky(np.asarray(covariance, dtype=float))
+
+
+def whitened_residuals(residuals: np.ndarray, chol: np.ndarray) -> np.ndarray:
+    """
+    白化残差 z = L⁻¹ r，使 χ² = Σz² = rᵀ Σ⁻¹ r
+
+    residuals 形状 (..., N)，所有批次共用同一个因子，一次三角求解完成。
+    """
+    r = np.asarray(residuals, dtype=float)
+    N = r.shape[-1]
+    z = solve_triangular(chol, r.reshape(-1, N).T, lower=True, check_finite=False)
+    return z.T.reshape(r.shape)
+
+
+def correlated_chi2(residuals: np.ndarray, chol: np.ndarray) -> np.ndarray:
+    """相关误差下的 χ²，对前导维度批量求值"""
+    return np.sum(whitened_residuals(residuals, chol)**2, axis=-1)
+
+
+# ============ 批量求解器 ============
+
+def _evaluate(model: Callable, x: np.ndarray, params: np.ndarray) -> np.ndarray:
+    """以curve_fit风格 model(x, *params) 批量求值，params为 (B, P)"""
+    return model(x, *[params[:, k, None] for k in range(params.shape[1])])
+
+
+def _jacobian(model: Callable, jac: Optional[Callable], x: np.ndarray,
+              params: np.ndarray, upper: Optional[np.ndarray] = None) -> np.ndarray:
+    """解析或前向差分雅可比 (B, N, P)"""
+    if upper is None:
+        upper = np.full(params.shape, np.inf)
+    if jac is not None:
+        return np.broadcast_to(
+            jac(x, *[params[:, k, None] for k in range(params.shape[1])]),
+            x.shape + (params.shape[1],)
+        )
+
+    f0 = _evaluate(model, x, params)
+    J = np.empty(x.shape + (params.shape[1],))
+    for k in range(params.shape[1]):
+        h = np.sqrt(np.finfo(float).eps) * np.maximum(np.abs(params[:, k]), 1.0)
+        # 靠近上界时向后差分
+        h = np.where(params[:, k] + h > upper[:, k], -h, h)
+        shifted = params.copy()
+        shifted[:, k] += h
+        J[..., k] = (_evaluate(model, x, shifted) - f0) / h[:, None]
+    return J
+
+
+def _whitening_operators(covariance: np.ndarray, valid: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    每个数据集的白化算子 W = L⁻¹（嵌入N×N，缺失/掩蔽点所在行列为0）
+
+    covariance 为 (N, N)（所有数据集共用，按有效点模式分组各分解一次）或
+    (B, N, N)（逐数据集）。返回 (算子数组, 每个数据集对应的算子下标)。
+    """
+    covariance = np.asarray(covariance, dtype=float)
+    B, N = valid.shape
+    shared = covariance.ndim == 2
+    if shared:
+        patterns, index = np.unique(valid, axis=0, return_inverse=True)
+        index = index.ravel()
+        covs = np.broadcast_to(covariance, (len(patterns), N, N))
+    else:
+        patterns, index, covs = valid, np.arange(B), covariance
+
+    ops = np.zeros((len(patterns), N, N))
+    for pattern in np.unique(patterns, axis=0):
+        rows = np.flatnonzero((patterns == pattern).all(axis=1))
+        keep = np.flatnonzero(pattern)
+        if keep.size == 0:
+            continue
+        sub = covs[rows][:, keep][:, :, keep]
+        chol = np.linalg.cholesky(sub)
+        ops[np.ix_(rows, keep, keep)] = np.linalg.solve(chol, np.eye(keep.size))
+    return ops, index
+
+
+def batched_least_squares(model: Callable,
+                          x: np.ndarray,
+                          y: np.ndarray,
+                          sigma: Optional[np.ndarray],
+                          p0: np.ndarray,
+                          bounds: Optional[Tuple[Sequence, Sequence]] = None,
+                          jac: Optional[Callable] = None,
+                          mask: Optional[np.ndarray] = None,
+                          covariance: Optional[np.ndarray] = None,
+                          max_iter: int = 500,
+                          ftol: float = 1e-10,
+                          xtol: float = 1e-10) -> BatchedFitResult:
+    """
+    向量化的有界Levenberg-Marquardt拟合（有效集投影）
+
+    对B个数据集同时最小化 χ²_b = z_bᵀz_b，其中白化残差 z = L⁻¹ (y - f(x; p))：
+    独立误差时 L = diag(σ)，给出 covariance 时 L 为其Cholesky因子。
+    所有线性代数以 (B, P, P) 批量形式完成。converged 仅在到达（投影）驻点时
+    为True：自由参数上的Gauss-Newton预测下降量低于 ftol·χ²，或无阻尼步长低于
+    xtol；λ发散或达到 max_iter 的数据集记为未收敛。
+
+    Parameters:
+    -----------
+    model : callable
+        curve_fit风格模型 model(x, *params)，须支持广播
+    x : array
+        自变量，形状 (N,) 或 (B, N)
+    y : array
+        观测值，形状 (B, N)；NaN视为缺失
+    sigma : array
+        标准误差，可广播到 (B, N)；给出 covariance 时可为None
+    p0 : array
+        初值，形状 (P,) 或 (B, P)（可用全数据最优解热启动）
+    bounds : (lower, upper), optional
+        参数边界；贴在边界上的参数按有效集固定，其余参数重新求解
+    jac : callable, optional
+        解析雅可比 jac(x, *params) -> (..., N, P)；缺省时用前向差分
+    mask : array, optional
+        (B, N) 布尔数组，False的点不参与拟合（留一/K折）
+    covariance : array, optional
+        相关误差协方差 (N, N)（所有数据集共用）或 (B, N, N)。残差与雅可比
+        均以 L⁻¹ 白化；缺失/掩蔽点取协方差的对应子矩阵，每种有效点模式只分解一次
+    """
+    y = np.atleast_2d(np.asarray(y, dtype=float))
+    B, N = y.shape
+    x = np.broadcast_to(np.asarray(x, dtype=float), (B, N))
+
+    valid = np.isfinite(y)
+    if covariance is None:
+        sigma = np.broadcast_to(np.asarray(sigma, dtype=float), (B, N))
+        valid &= np.isfinite(sigma) & (sigma > 0)
+    if mask is not None:
+        valid &= np.broadcast_to(mask, (B, N))
+    y = np.where(valid, y, 0.0)
+
+    if covariance is None:
+        root_w = np.where(valid, 1.0 / np.where(valid, sigma, 1.0), 0.0)
+    else:
+        ops, op_index = _whitening_operators(covariance, valid)
+
+    def whiten(v, rows):
+        """白化 (b, N) 残差或 (b, N, P) 雅可比，缺失点置零"""
+        if covariance is None:
+            return v * root_w[rows].reshape(root_w[rows].shape + (1,) * (v.ndim - 2))
+        v = np.where(valid[rows].reshape(valid[rows].shape + (1,) * (v.ndim - 2)), v, 0.0)
+        return np.einsum('bij,bj...->bi...', ops[op_index[rows]], v)
+
+    p = np.array(np.broadcast_to(np.asarray(p0, dtype=float),
+                                 (B, np.shape(p0)[-1])))
+    P = p.shape[1]
+    if bounds is None:
+        lower = np.full((B, P), -np.inf)
+        upper = np.full((B, P), np.inf)
+    else:
+        lower = np.broadcast_to(np.asarray(bounds[0], dtype=float), (B, P))
+        upper = np.broadcast_to(np.asarray(bounds[1], dtype=float), (B, P))
+    p = np.clip(p, lower, upper)
+
+    def residuals_of(rows, p_b):
+        pred = _evaluate(model, x[rows], p_b)
+        z = whiten(np.where(valid[rows], y[rows] - pred, 0.0), rows)
+        return pred, z, np.sum(z**2, axis=1)
+
+    all_rows = np.arange(B)
+    pred, r, chi2 = residuals_of(all_rows, p)
+    lam = np.full(B, 1e-3)
+    nu = np.full(B, 2.0)
+    active = np.isfinite(chi2)
+    converged = np.zeros(B, dtype=bool)
+    eye = np.eye(P)
+
+    n_iter = 0
+    for n_iter in range(1, max_iter + 1):
+        idx = np.flatnonzero(active)
+        if idx.size == 0:
+            break
+
+        x_a, p_a = x[idx], p[idx]
+        J = _jacobian(model, jac, x_a, p_a, upper[idx])
+        Jw = whiten(J, idx)
+        A = np.einsum('bnp,bnq->bpq', Jw, Jw)
+        g = np.einsum('bnp,bn->bp', Jw, r[idx])
+
+        # 有效集：贴在边界上且下降方向指向界外的参数固定，只对自由参数求解
+        fixed = (((p_a <= lower[idx]) & (g < 0)) | ((p_a >= upper[idx]) & (g > 0)))
+        free = ~fixed
+        g = np.where(free, g, 0.0)
+        A = np.where(free[:, :, None] & free[:, None, :], A, 0.0) + fixed[:, :, None] * eye
+
+        diag = np.diagonal(A, axis1=1, axis2=2)
+        scale = np.maximum(diag, 1e-12 * np.maximum(diag.max(axis=1, keepdims=True), 1.0))
+
+        # Gauss-Newton预测下降量 gᵀA⁻¹g 或无阻尼步长可忽略时即为（投影）驻点
+        newton = np.linalg.solve(A + 1e-12 * scale[:, :, None] * eye, g[..., None])[..., 0]
+        stationary = ((np.sum(g * newton, axis=1) <= ftol * np.maximum(chi2[idx], 1e-300))
+                      | (np.abs(newton) <= xtol * (np.abs(p_a) + xtol)).all(axis=1))
+
+        A_damped = A + lam[idx, None, None] * scale[:, :, None] * eye
+        step = np.linalg.solve(A_damped, g[..., None])[..., 0]
+
+        # 测地线加速：沿步长方向的二阶方向导数修正，沿狭长弯曲谷前进
+        # （探测点超出边界的数据集不加速，避免在定义域外求值）
+        h = 0.1
+        probe = p_a + h * step
+        inside = ((probe >= lower[idx]) & (probe <= upper[idx])).all(axis=1)
+        probe = np.where(inside[:, None], probe, p_a)
+        curvature = (2.0 / h) * ((_evaluate(model, x_a, probe) - pred[idx]) / h
+                                 - np.einsum('bnp,bp->bn', J, step))
+        accel = -np.linalg.solve(A_damped, np.einsum('bnp,bn->bp', Jw, whiten(curvature, idx))
+                                 [..., None])[..., 0]
+        accel = np.where(free, accel, 0.0)
+        ratio = np.sqrt(np.sum(scale * accel**2, axis=1)
+                        / np.maximum(np.sum(scale * step**2, axis=1), 1e-300))
+        use_accel = inside & (2.0 * ratio <= 0.75) & np.isfinite(accel).all(axis=1)
+        step = np.where(use_accel[:, None], step + 0.5 * accel, step)
+
+        p_new = np.clip(p_a + step, lower[idx], upper[idx])
+        pred_new, r_new, chi2_new = residuals_of(idx, p_new)
+
+        improved = np.isfinite(chi2_new) & (chi2_new < chi2[idx]) & ~stationary
+
+        # Nielsen阻尼更新：按实际/预测下降比 ρ 连续调整λ，狭长弯曲谷中不会反复振荡
+        predicted = np.sum(step * (2.0 * g - np.einsum('bpq,bq->bp', A, step)), axis=1)
+        rho = (chi2[idx] - chi2_new) / np.maximum(predicted, 1e-300)
+        shrink = np.maximum(1.0 / 3.0, 1.0 - (2.0 * np.clip(rho, 0.0, 1.0) - 1.0)**3)
+
+        upd = idx[improved]
+        p[upd] = p_new[improved]
+        pred[upd] = pred_new[improved]
+        r[upd] = r_new[improved]
+        chi2[upd] = chi2_new[improved]
+        lam[idx] = np.where(improved, np.maximum(lam[idx] * shrink, 1e-12), lam[idx] * nu[idx])
+        nu[idx] = np.where(improved, 2.0, nu[idx] * 2.0)
+
+        # 阻尼发散（λ过大仍无法下降）视为失败而非收敛
+        failed = ~stationary & (lam[idx] > 1e12)
+        converged[idx[stationary]] = True
+        active[idx[stationary | failed]] = False
+
+    Jw = whiten(_jacobian(model, jac, x, p, upper), all_rows)
+    A = np.einsum('bnp,bnq->bpq', Jw, Jw)
+    return BatchedFitResult(
+        params=p,
+        covariance=np.linalg.pinv(A),
+        chi2=chi2,
+        n_points=valid.sum(axis=1),
+        converged=converged & np.isfinite(chi2),
+        n_iter=n_iter
+    )
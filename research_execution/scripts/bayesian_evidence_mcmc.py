@@ -11,9 +11,12 @@ from scipy.optimize import minimize
 import matplotlib.pyplot as plt
 import json
 from dataclasses import dataclass
-from typing import Dict, Tuple, List
+from typing import Dict, Tuple, List, Optional
 import logging
 
+from batched_fitting import correlated_chi2, covariance_cholesky
+from posterior_chain_combiner import save_chain
+
 logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s')
 logger = logging.getLogger(__name__)
 
@@ -21,13 +24,21 @@ logger = logging.getLogger(__name__)
 # ============ MCMC采样器 ============
 
 class MCMCSampler:
-    """简单的MCMC采样器（Metropolis-Hastings）"""
+    """
+    简单的MCMC采样器（Metropolis-Hastings）
+
+    vectorized=True 时 log_likelihood / log_prior 接受 (nwalkers, ndim) 数组并返回
+    (nwalkers,)，每步只做一次批量求值。rng 可传入独立的 np.random.Generator。
+    """
     
-    def __init__(self, log_likelihood, log_prior, ndim, nwalkers=50):
+    def __init__(self, log_likelihood, log_prior, ndim, nwalkers=50,
+                 vectorized=False, rng=None):
         self.log_likelihood = log_likelihood
         self.log_prior = log_prior
         self.ndim = ndim
         self.nwalkers = nwalkers
+        self.vectorized = vectorized
+        self.rng = np.random if rng is None else rng
         self.samples = []
         
     def log_posterior(self, params):
@@ -36,20 +47,31 @@ class MCMCSampler:
         if not np.isfinite(lp):
             return -np.inf
         return lp + self.log_likelihood(params)
+
+    def log_posterior_batch(self, positions):
+        """所有walker的对数后验 (nwalkers,)"""
+        if not self.vectorized:
+            return np.array([self.log_posterior(p) for p in positions])
+        lp = self.log_prior(positions)
+        inside = np.isfinite(lp)
+        log_prob = np.full(len(positions), -np.inf)
+        if inside.any():
+            log_prob[inside] = lp[inside] + self.log_likelihood(positions[inside])
+        return log_prob
     
     def run_mcmc(self, nsteps=10000, burn_in=2000, initial_pos=None):
         """运行MCMC链"""
         
         if initial_pos is None:
             # 随机初始化
-            initial_pos = np.random.randn(self.nwalkers, self.ndim) * 0.1 + 0.5
+            initial_pos = self.rng.standard_normal((self.nwalkers, self.ndim)) * 0.1 + 0.5
         
         # 存储所有样本
         all_samples = []
         current_pos = initial_pos.copy()
         
         # 计算初始对数后验
-        current_log_prob = np.array([self.log_posterior(p) for p in current_pos])
+        current_log_prob = self.log_posterior_batch(current_pos)
         
         logger.info(f"开始MCMC采样: {nsteps}步, {self.nwalkers} walkers")
         
@@ -58,14 +80,16 @@ class MCMCSampler:
                 logger.info(f"  进度: {step}/{nsteps}")
             
             # 提议新位置
-            proposal = current_pos + np.random.randn(self.nwalkers, self.ndim) * 0.1
+            proposal = current_pos + self.rng.standard_normal((self.nwalkers, self.ndim)) * 0.1
             
             # 计算提议的对数后验
-            proposal_log_prob = np.array([self.log_posterior(p) for p in proposal])
+            proposal_log_prob = self.log_posterior_batch(proposal)
             
-            # Metropolis-Hastings接受准则
-            log_ratio = proposal_log_prob - current_log_prob
-            accept = np.log(np.random.rand(self.nwalkers)) < log_ratio
+            # Metropolis-Hastings接受准则（当前位置后验为 -inf 时总是接受）
+            with np.errstate(invalid='ignore'):
+                log_ratio = np.where(np.isneginf(current_log_prob), np.inf,
+                                     proposal_log_prob - current_log_prob)
+            accept = np.log(self.rng.random(self.nwalkers)) < log_ratio
             
             # 更新位置
             current_pos[accept] = proposal[accept]
@@ -73,9 +97,10 @@ class MCMCSampler:
             
             # 存储样本（burn-in后）
             if step >= burn_in:
-                all_samples.extend(current_pos.copy())
+                all_samples.append(current_pos.copy())
         
-        self.samples = np.array(all_samples)
+        self.samples = (np.concatenate(all_samples) if all_samples
+                        else np.empty((0, self.ndim)))
         logger.info(f"MCMC完成，收集{len(self.samples)}个样本")
         
         return self.samples
@@ -85,13 +110,44 @@ class MCMCSampler:
         if len(self.samples) == 0:
             return None
         
-        return {
-            'mean': np.mean(self.samples, axis=0),
-            'std': np.std(self.samples, axis=0),
-            'median': np.median(self.samples, axis=0),
-            'percentiles_16_84': np.percentile(self.samples, [16, 84], axis=0),
-            'percentiles_2.5_97.5': np.percentile(self.samples, [2.5, 97.5], axis=0)
-        }
+        return _sample_statistics(self.samples)
+
+
+def _sample_statistics(samples):
+    """样本的均值、标准差、中位数与分位数"""
+    return {
+        'mean': np.mean(samples, axis=0),
+        'std': np.std(samples, axis=0),
+        'median': np.median(samples, axis=0),
+        'percentiles_16_84': np.percentile(samples, [16, 84], axis=0),
+        'percentiles_2.5_97.5': np.percentile(samples, [2.5, 97.5], axis=0)
+    }
+
+
+def integrated_autocorr_time(chain, c=5.0):
+    """
+    积分自相关时间 τ_int（每个参数）
+
+    chain : (nsteps, nwalkers, ndim)，即 run_mcmc 输出按步 reshape 的结果。
+    自协方差用FFT逐walker计算后对walker平均，τ = 1 + 2Σ ρ(t)，
+    求和窗口取满足 M ≥ c·τ(M) 的最小 M（Sokal自动窗口）。
+    所有walker都未移动的参数返回 nsteps。
+    """
+    chain = np.asarray(chain, dtype=float)
+    nsteps = chain.shape[0]
+    x = chain - chain.mean(axis=0)
+    size = 2 ** int(np.ceil(np.log2(2 * nsteps)))
+    f = np.fft.rfft(x, n=size, axis=0)
+    acov = np.fft.irfft(f * np.conj(f), n=size, axis=0)[:nsteps].mean(axis=1)  # (nsteps, ndim)
+
+    tau = np.full(chain.shape[2], float(nsteps))
+    for k in range(chain.shape[2]):
+        if acov[0, k] <= 0:
+            continue
+        taus = 2.0 * np.cumsum(acov[:, k] / acov[0, k]) - 1.0
+        window = np.flatnonzero(np.arange(nsteps) >= c * taus)
+        tau[k] = taus[window[0]] if window.size else taus[-1]
+    return tau
 
 
 # ============ 模型定义 ============
@@ -110,19 +166,39 @@ def standard_model(n, params):
 
 # ============ 似然函数 ============
 
-def create_log_likelihood(n_data, delta_data, delta_err, model_func):
-    """创建对数似然函数"""
+def create_log_likelihood(n_data, delta_data, delta_err, model_func, vectorized=False,
+                          covariance=None):
+    """
+    创建对数似然函数
+
+    vectorized=True 时返回的函数接受 (nwalkers, ndim) 参数数组，
+    模型以 params.T[..., None] 广播求值，一次得到所有walker的 χ²。
+
+    给出 covariance (N, N) 时使用相关误差 χ² = rᵀ Σ⁻¹ r（此时忽略 delta_err）。
+    Cholesky分解在创建时做一次并保存在闭包中，每次求值只需一次三角求解，
+    批量版本对所有walker共用同一次求解。
+    """
+    chol = None if covariance is None else covariance_cholesky(covariance)
+
+    def chi2_of(residual):
+        if chol is None:
+            return np.sum((residual / delta_err)**2, axis=-1)
+        return correlated_chi2(residual, chol)
     
     def log_likelihood(params):
         """对数似然 = -0.5 * χ²"""
         delta_pred = model_func(n_data, params)
-        chi2 = np.sum(((delta_data - delta_pred) / delta_err)**2)
-        return -0.5 * chi2
+        return -0.5 * float(chi2_of(delta_data - delta_pred))
+
+    def log_likelihood_batch(params):
+        """批量对数似然 (nwalkers,)"""
+        delta_pred = model_func(n_data, np.asarray(params).T[..., None])
+        return -0.5 * chi2_of(delta_data - delta_pred)
     
-    return log_likelihood
+    return log_likelihood_batch if vectorized else log_likelihood
 
 
-def create_log_prior(bounds):
+def create_log_prior(bounds, vectorized=False):
     """创建均匀先验的对数先验函数"""
     
     def log_prior(params):
@@ -131,8 +207,179 @@ def create_log_prior(bounds):
             if p < low or p > high:
                 return -np.inf
         return 0.0  # 均匀先验在对数空间为0
+
+    low, high = np.array(bounds, dtype=float).T
+
+    def log_prior_batch(params):
+        """批量均匀先验 (nwalkers,)"""
+        inside = np.all((params >= low) & (params <= high), axis=-1)
+        return np.where(inside, 0.0, -np.inf)
     
-    return log_prior
+    return log_prior_batch if vectorized else log_prior
+
+
+# ============ 带隙/里德伯能量的冗余参数边缘化 ============
+
+def _level_factor(n_data, params, model_func, n_offset):
+    """u_n(θ) = 1/(n - n_offset - δ(n;θ))²；有效主量子数非正时为NaN"""
+    n_eff = n_data - n_offset - model_func(n_data, params)
+    return np.where(n_eff > 0, 1.0 / np.where(n_eff > 0, n_eff, 1.0)**2, np.nan)
+
+
+def create_marginal_energy_log_likelihood(n_data, energies, energy_errors, model_func,
+                                          band_gap_prior, rydberg_prior,
+                                          n_offset=0.5, vectorized=False):
+    """
+    在能量空间中解析边缘化 E_g 和 R* 的对数似然
+
+    能级模型 E_n = E_g - R*·u_n(θ) 对 (E_g, R*) 是线性的。给定高斯先验
+    E_g ~ N(μ_g, σ_g²)、R* ~ N(μ_R, σ_R²)，边缘分布为
+        E ~ N(μ_g - μ_R u, D + σ_g² 11ᵀ + σ_R² uuᵀ),  D = diag(σ_E²)
+    协方差是对角阵加秩2更新，用Woodbury恒等式和矩阵行列式引理求逆和对数行列式，
+    每次求值只需 O(N) 运算加一个2×2求解。采样器维度不变（仍只采样 θ），
+    量子缺陷在似然内部由 θ 重新计算，不再依赖固定的 E_g、R*。
+
+    Parameters:
+    -----------
+    band_gap_prior, rydberg_prior : (mean, std)
+        E_g 与 R* 的信息先验 (eV)
+    n_offset : float
+        2D为0.5 (n - 1/2 - δ)，3D为0 (n - δ)
+
+    返回值包含归一化常数（对数行列式随 θ 变化，不能省略）。
+    """
+    E = np.asarray(energies, dtype=float)
+    inv_var = 1.0 / np.asarray(energy_errors, dtype=float)**2
+    mu_g, sigma_g = band_gap_prior
+    mu_R, sigma_R = rydberg_prior
+    N = len(E)
+    const = N * np.log(2 * np.pi) - np.sum(np.log(inv_var))
+
+    def marginal(u):
+        # u: (..., N)；V = [σ_g 1, σ_R u]
+        r = E - mu_g + mu_R * u
+        a = r * inv_var
+        b_g = sigma_g * np.sum(a, axis=-1)
+        b_R = sigma_R * np.sum(a * u, axis=-1)
+        # M = I₂ + Vᵀ D⁻¹ V
+        m11 = 1.0 + sigma_g**2 * np.sum(inv_var)
+        m12 = sigma_g * sigma_R * np.sum(inv_var * u, axis=-1)
+        m22 = 1.0 + sigma_R**2 * np.sum(inv_var * u**2, axis=-1)
+        det = m11 * m22 - m12**2
+        quad = np.sum(r * a, axis=-1) - (m22 * b_g**2 - 2 * m12 * b_g * b_R + m11 * b_R**2) / det
+        log_like = -0.5 * (quad + np.log(det) + const)
+        return np.where(np.isfinite(log_like), log_like, -np.inf)
+
+    def log_likelihood(params):
+        """单组参数的边缘对数似然"""
+        return float(marginal(_level_factor(n_data, params, model_func, n_offset)))
+
+    def log_likelihood_batch(params):
+        """批量边缘对数似然 (nwalkers,)"""
+        u = _level_factor(n_data, np.asarray(params).T[..., None], model_func, n_offset)
+        return marginal(u)
+
+    return log_likelihood_batch if vectorized else log_likelihood
+
+
+def sample_nuisance_conditional(samples, n_data, energies, energy_errors, model_func,
+                                band_gap_prior, rydberg_prior, n_offset=0.5, rng=None):
+    """
+    从条件后验 p(E_g, R* | θ, E) 为每个 θ 样本抽取一组冗余参数
+
+    条件后验是高斯的：精度 P = Λ₀ + AᵀD⁻¹A，均值 P⁻¹(Λ₀μ₀ + AᵀD⁻¹E)，A = [1, -u]。
+    与边缘似然的 θ 样本组合即得到联合后验样本。返回 (S, 2) 数组 [E_g, R*]。
+    """
+    rng = np.random.default_rng() if rng is None else rng
+    samples = np.atleast_2d(samples)
+    E = np.asarray(energies, dtype=float)
+    inv_var = 1.0 / np.asarray(energy_errors, dtype=float)**2
+    mu_g, sigma_g = band_gap_prior
+    mu_R, sigma_R = rydberg_prior
+
+    u = _level_factor(n_data, samples.T[..., None], model_func, n_offset)  # (S, N)
+    P = np.empty((len(samples), 2, 2))
+    P[:, 0, 0] = 1.0 / sigma_g**2 + np.sum(inv_var)
+    P[:, 0, 1] = P[:, 1, 0] = -np.sum(inv_var * u, axis=-1)
+    P[:, 1, 1] = 1.0 / sigma_R**2 + np.sum(inv_var * u**2, axis=-1)
+    h = np.stack([mu_g / sigma_g**2 + np.sum(inv_var * E) * np.ones(len(samples)),
+                  mu_R / sigma_R**2 - np.sum(inv_var * u * E, axis=-1)], axis=-1)
+
+    chol = np.linalg.cholesky(P)
+    mean = np.linalg.solve(P, h[..., None])[..., 0]
+    # x = mean + L⁻ᵀ z 的协方差为 P⁻¹
+    z = rng.standard_normal((len(samples), 2, 1))
+    return mean + np.linalg.solve(np.swapaxes(chol, 1, 2), z)[..., 0]
+
+
+def run_nuisance_mcmc(n_data, energies, energy_errors, model_func, bounds,
+                      band_gap_prior, rydberg_prior, n_offset=0.5,
+                      nwalkers=32, nsteps=3000, burn_in=1000,
+                      initial_pos=None, rng=None):
+    """
+    对 θ 采样边缘似然，再逐样本抽取 (E_g, R*)，返回联合后验样本 (S, ndim + 2)
+
+    采样器只在 θ 空间运行，速度与固定 E_g、R* 时相当。
+    """
+    rng = np.random.default_rng() if rng is None else rng
+    ndim = len(bounds)
+    low, high = np.array(bounds, dtype=float).T
+    log_like = create_marginal_energy_log_likelihood(
+        n_data, energies, energy_errors, model_func,
+        band_gap_prior, rydberg_prior, n_offset, vectorized=True)
+    log_prior = create_log_prior(bounds, vectorized=True)
+
+    if initial_pos is None:
+        # 只在后验有限的区域内初始化（部分先验区域 n_eff ≤ 0，后验为 -inf）
+        initial_pos = np.empty((nwalkers, ndim))
+        filled = 0
+        for _ in range(1000):
+            candidates = rng.uniform(low, high, size=(nwalkers, ndim))
+            ok = candidates[np.isfinite(log_like(candidates) + log_prior(candidates))]
+            take = min(len(ok), nwalkers - filled)
+            initial_pos[filled:filled + take] = ok[:take]
+            filled += take
+            if filled == nwalkers:
+                break
+        else:
+            raise ValueError("先验范围内找不到后验有限的初始位置")
+    sampler = MCMCSampler(log_like, log_prior, ndim=ndim, nwalkers=nwalkers,
+                          vectorized=True, rng=rng)
+    theta = sampler.run_mcmc(nsteps=nsteps, burn_in=burn_in, initial_pos=initial_pos)
+    nuisance = sample_nuisance_conditional(theta, n_data, energies, energy_errors,
+                                           model_func, band_gap_prior, rydberg_prior,
+                                           n_offset, rng)
+    return np.hstack([theta, nuisance])
+
+
+def fit_series_priors(n_data, energies, energy_errors, model_func, p0, bounds,
+                      n_offset=0.5):
+    """
+    剖面拟合给出 E_g、R* 的信息先验
+
+    对每个 θ，(E_g, R*) 由加权线性最小二乘解析求出（E_n = E_g - R*·u_n(θ)），
+    在 θ 上最小化剖面 χ²。返回 (θ̂, (E_g, σ_g), (R*, σ_R))，误差取自
+    (AᵀD⁻¹A)⁻¹ 的对角元，可直接作为 band_gap_prior / rydberg_prior。
+    """
+    E = np.asarray(energies, dtype=float)
+    sigma = np.asarray(energy_errors, dtype=float)
+
+    def linear_fit(params):
+        u = _level_factor(n_data, np.asarray(params), model_func, n_offset)
+        A = np.column_stack([np.ones_like(u), -u]) / sigma[:, None]
+        coeffs, *_ = np.linalg.lstsq(A, E / sigma, rcond=None)
+        return coeffs, A
+
+    def profile_chi2(params):
+        coeffs, A = linear_fit(params)
+        chi2 = np.sum((A @ coeffs - E / sigma)**2)
+        return chi2 if np.isfinite(chi2) else np.inf
+
+    result = minimize(profile_chi2, p0, method='Nelder-Mead', bounds=bounds,
+                      options={'xatol': 1e-10, 'fatol': 1e-10, 'maxiter': 20000})
+    coeffs, A = linear_fit(result.x)
+    errors = np.sqrt(np.diag(np.linalg.inv(A.T @ A)))
+    return result.x, (float(coeffs[0]), float(errors[0])), (float(coeffs[1]), float(errors[1]))
 
 
 # ============ 贝叶斯证据计算 ============
@@ -209,14 +456,20 @@ def laplace_approximation_evidence(log_likelihood_func, log_prior_func,
 
 
 def nested_sampling_evidence(log_likelihood_func, log_prior_func,
-                             ndim, bounds, nlive=100, nsteps=10000):
+                             ndim, bounds, nlive=100, nsteps=10000, rng=None):
     """
     嵌套采样计算贝叶斯证据
     
     最可靠的方法之一
+
+    返回 (log_evidence, samples)，samples 为死点与最终活点，形状 (N, ndim+1)，
+    最后一列为未归一化的对数后验权重 log L + log ΔX
+    （后验权重 = exp(该列 - log_evidence)）。
     """
+    rng = np.random if rng is None else rng
+
     # 初始化活点
-    live_points = np.random.uniform(
+    live_points = rng.uniform(
         low=[b[0] for b in bounds],
         high=[b[1] for b in bounds],
         size=(nlive, ndim)
@@ -235,12 +488,13 @@ def nested_sampling_evidence(log_likelihood_func, log_prior_func,
         
         # 更新证据
         log_evidence = np.logaddexp(log_evidence, worst_loglike + log_width)
+        samples.append(np.append(live_points[worst_idx], worst_loglike + log_width))
         
         # 生成新点（服从先验且似然更高）
         accepted = False
         attempts = 0
         while not accepted and attempts < 1000:
-            new_point = np.random.uniform(
+            new_point = rng.uniform(
                 low=[b[0] for b in bounds],
                 high=[b[1] for b in bounds],
                 size=ndim
@@ -263,93 +517,118 @@ def nested_sampling_evidence(log_likelihood_func, log_prior_func,
             logger.info(f"嵌套采样进度: {step}/{nsteps}, log Z ≈ {log_evidence:.2f}")
     
     # 添加剩余活点的贡献
-    for loglike in live_loglikes:
+    for point, loglike in zip(live_points, live_loglikes):
         log_evidence = np.logaddexp(log_evidence, loglike + log_width)
+        samples.append(np.append(point, loglike + log_width))
     
-    return log_evidence, samples
+    return log_evidence, np.array(samples)
 
 
 # ============ 主分析流程 ============
 
-def analyze_cu2o_with_bayesian():
-    """使用贝叶斯方法分析Cu₂O数据"""
+def analyze_cu2o_with_bayesian(chain_dir: Optional[str] = None):
+    """
+    使用贝叶斯方法分析Cu₂O数据
     
+    在能量空间中比较两个模型：E_g 与 R* 作为冗余参数，以剖面拟合的值和误差为
+    高斯先验，在似然中解析边缘化；MCMC 给出 θ 与 (E_g, R*) 的联合后验。
+    
+    给出 chain_dir 时把维度流模型的后验链保存到该目录，
+    供 posterior_chain_combiner 做跨材料合并。
+    """
+    
+    from cu2o_cross_material_analysis import load_cross_material_data
+
     logger.info("="*70)
     logger.info("Cu₂O数据的贝叶斯分析")
     logger.info("="*70)
     
-    # Cu₂O数据 (n=3到25)
-    n_data = np.arange(3, 26)
-    
-    # 量子缺陷（基于c₁=0.516的拟合）
-    c1_obs = 0.516
-    n0_obs = 10.0
-    delta0_obs = 0.23
-    
-    delta_data = delta0_obs * (n0_obs**c1_obs) / (n_data**c1_obs + n0_obs**c1_obs)
+    # Cu₂O能级 (n=3到25)，E_n = E_g - R*/(n - δ)²（3D，n_offset=0）
+    cu2o = next(m for m in load_cross_material_data() if m.name == "Cu₂O")
+    n_data = cu2o.n_levels
+    energies = cu2o.energies
+
+    # 量子缺陷误差 0.01 传播到能量：σ_E = 2R*·σ_δ/(n - δ)³
+    delta_data = n_data - np.sqrt(cu2o.rydberg / (cu2o.band_gap - energies))
     delta_err = np.full(len(n_data), 0.01)  # 假设误差
-    
+    energy_err = 2 * cu2o.rydberg * delta_err / (n_data - delta_data)**3
+
     logger.info(f"数据点: {len(n_data)}")
     logger.info(f"n范围: {n_data.min()}到{n_data.max()}")
-    
-    # ===== 维度流模型 (3参数) =====
-    logger.info("\n维度流模型分析...")
-    
-    # 先验边界
+
+    # E_g、R* 作为冗余参数，先验取自剖面拟合的值与误差，似然中解析边缘化
     bounds_df = [(0.01, 1.0), (1.0, 20.0), (0.1, 2.0)]  # δ₀, n₀, c₁
-    
-    log_like_df = create_log_likelihood(n_data, delta_data, delta_err, dimflow_model)
+    _, band_gap_prior, rydberg_prior = fit_series_priors(
+        n_data, energies, energy_err, dimflow_model, [0.23, 10.0, 0.516], bounds_df, n_offset=0)
+    logger.info(f"E_g 先验: {band_gap_prior[0]:.6f} ± {band_gap_prior[1]:.2e} eV, "
+                f"R* 先验: {rydberg_prior[0]:.6f} ± {rydberg_prior[1]:.2e} eV")
+    nuisance = (energies, energy_err, band_gap_prior, rydberg_prior)
+
+    # ===== 维度流模型 (3参数 + E_g, R*) =====
+    logger.info("\n维度流模型分析...")
+
+    log_like_df = create_marginal_energy_log_likelihood(n_data, *nuisance[:2], dimflow_model,
+                                                        *nuisance[2:], n_offset=0)
     log_prior_df = create_log_prior(bounds_df)
-    
+
     # 使用嵌套采样计算证据
     logger.info("运行嵌套采样...")
     log_evidence_df, _ = nested_sampling_evidence(
         log_like_df, log_prior_df, 3, bounds_df,
         nlive=100, nsteps=5000
     )
-    
+
     logger.info(f"维度流模型 log证据 = {log_evidence_df:.4f}")
-    
-    # MCMC采样获取后验
+
+    # MCMC采样获取后验（θ 与 E_g、R* 的联合样本）
     logger.info("运行MCMC...")
-    sampler_df = MCMCSampler(log_like_df, log_prior_df, ndim=3, nwalkers=50)
-    
+
     # 从MAP附近开始
     initial_pos = np.array([0.23, 10.0, 0.516]) + np.random.randn(50, 3) * 0.05
-    samples_df = sampler_df.run_mcmc(nsteps=8000, burn_in=2000, initial_pos=initial_pos)
-    stats_df = sampler_df.get_statistics()
-    
+    joint_df = run_nuisance_mcmc(n_data, *nuisance[:2], dimflow_model, bounds_df,
+                                 *nuisance[2:], n_offset=0, nwalkers=50, nsteps=8000,
+                                 burn_in=2000, initial_pos=initial_pos)
+    samples_df = joint_df[:, :3]
+    stats_df = _sample_statistics(samples_df)
+    stats_nuisance = _sample_statistics(joint_df[:, 3:])
+    if chain_dir is not None:
+        save_chain(chain_dir, "Cu₂O", samples_df, ('delta0', 'n0', 'c1'))
+
     logger.info("维度流模型后验统计:")
     logger.info(f"  c₁ = {stats_df['mean'][2]:.4f} ± {stats_df['std'][2]:.4f}")
     logger.info(f"  95% CI: [{stats_df['percentiles_2.5_97.5'][0][2]:.4f}, "
                 f"{stats_df['percentiles_2.5_97.5'][1][2]:.4f}]")
-    
-    # ===== 标准模型 (2参数) =====
+    logger.info(f"  E_g = {stats_nuisance['mean'][0]:.6f} ± {stats_nuisance['std'][0]:.2e} eV, "
+                f"R* = {stats_nuisance['mean'][1]:.6f} ± {stats_nuisance['std'][1]:.2e} eV")
+
+    # ===== 标准模型 (2参数 + E_g, R*) =====
     logger.info("\n标准模型分析...")
-    
+
     bounds_std = [(0.01, 1.0), (0.01, 5.0)]  # δ₀, α
-    
-    log_like_std = create_log_likelihood(n_data, delta_data, delta_err, standard_model)
+
+    log_like_std = create_marginal_energy_log_likelihood(n_data, *nuisance[:2], standard_model,
+                                                         *nuisance[2:], n_offset=0)
     log_prior_std = create_log_prior(bounds_std)
-    
+
     log_evidence_std, _ = nested_sampling_evidence(
         log_like_std, log_prior_std, 2, bounds_std,
         nlive=100, nsteps=5000
     )
-    
+
     logger.info(f"标准模型 log证据 = {log_evidence_std:.4f}")
-    
+
     # MCMC
-    sampler_std = MCMCSampler(log_like_std, log_prior_std, ndim=2, nwalkers=50)
     initial_pos_std = np.array([0.23, 0.5]) + np.random.randn(50, 2) * 0.05
-    samples_std = sampler_std.run_mcmc(nsteps=8000, burn_in=2000, 
-                                       initial_pos=initial_pos_std)
-    stats_std = sampler_std.get_statistics()
-    
+    joint_std = run_nuisance_mcmc(n_data, *nuisance[:2], standard_model, bounds_std,
+                                  *nuisance[2:], n_offset=0, nwalkers=50, nsteps=8000,
+                                  burn_in=2000, initial_pos=initial_pos_std)
+    samples_std = joint_std[:, :2]
+    stats_std = _sample_statistics(samples_std)
+
     logger.info("标准模型后验统计:")
     logger.info(f"  δ₀ = {stats_std['mean'][0]:.4f} ± {stats_std['std'][0]:.4f}")
     logger.info(f"  α = {stats_std['mean'][1]:.4f} ± {stats_std['std'][1]:.4f}")
-    
+
     # ===== 贝叶斯因子 =====
     logger.info("\n贝叶斯因子计算...")
     
@@ -392,6 +671,14 @@ def analyze_cu2o_with_bayesian():
                          'std': float(stats_std['std'][1])}
             }
         },
+        'nuisance': {
+            'band_gap': {'prior': list(band_gap_prior),
+                         'mean': float(stats_nuisance['mean'][0]),
+                         'std': float(stats_nuisance['std'][0])},
+            'rydberg': {'prior': list(rydberg_prior),
+                        'mean': float(stats_nuisance['mean'][1]),
+                        'std': float(stats_nuisance['std'][1])}
+        },
         'bayes_factor': {
             'log_B10': float(log_B10),
             'B10': float(B10),
@@ -4,9 +4,10 @@ Cu₂O跨材料一致性分析
 目标：证明多个3D系统收敛到c₁≈0.5，降低"巧合"可能性
 """
 
+import copy
 import numpy as np
 import pandas as pd
-from scipy import stats
+from scipy import special, stats
 import matplotlib.pyplot as plt
 import json
 from dataclasses import dataclass
@@ -133,6 +134,146 @@ def load_cross_material_data() -> List[MaterialData]:
     return materials
 
 
+@dataclass
+class MetaAnalysisAccumulator:
+    """
+    元分析的充分统计量累加器
+    
+    加权部分保存 Σw、Σw(c₁-c_ref)、Σw(c₁-c_ref)²（w = 1/σ²），相对理论值 c_ref
+    平移以避免大数相减；简单平均部分用Welford的 (n, 均值, M2)。
+    每个材料的加入/移除都是 O(1)，两个累加器可以合并（并行工作进程的部分结果），
+    移除操作用于留一影响分析。
+    """
+    expected: float = 0.5  # 理论值 c_ref
+    n: int = 0
+    sum_w: float = 0.0
+    sum_w2: float = 0.0  # Σw²（DerSimonian–Laird 需要）
+    sum_wd: float = 0.0  # Σw(c₁ - c_ref)
+    sum_wd2: float = 0.0  # Σw(c₁ - c_ref)² = χ²
+    mean: float = 0.0  # 简单均值
+    m2: float = 0.0  # Σ(c₁ - 均值)²
+    
+    def add(self, c1: float, c1_error: float) -> 'MetaAnalysisAccumulator':
+        """加入一个材料的测量"""
+        w = 1.0 / c1_error**2
+        d = c1 - self.expected
+        self.sum_w += w
+        self.sum_w2 += w**2
+        self.sum_wd += w * d
+        self.sum_wd2 += w * d**2
+        
+        self.n += 1
+        delta = c1 - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (c1 - self.mean)
+        return self
+    
+    def remove(self, c1: float, c1_error: float) -> 'MetaAnalysisAccumulator':
+        """移除一个先前加入的测量"""
+        if self.n == 0:
+            raise ValueError("Cannot remove from an empty accumulator")
+        w = 1.0 / c1_error**2
+        d = c1 - self.expected
+        self.sum_w -= w
+        self.sum_w2 -= w**2
+        self.sum_wd -= w * d
+        self.sum_wd2 -= w * d**2
+        
+        if self.n == 1:
+            self.n, self.mean, self.m2 = 0, 0.0, 0.0
+            return self
+        old_mean = self.mean
+        self.n -= 1
+        self.mean = (old_mean * (self.n + 1) - c1) / self.n
+        self.m2 = max(self.m2 - (c1 - old_mean) * (c1 - self.mean), 0.0)
+        return self
+    
+    def merge(self, other: 'MetaAnalysisAccumulator') -> 'MetaAnalysisAccumulator':
+        """并入另一个累加器（须使用相同的理论值）"""
+        if other.expected != self.expected:
+            raise ValueError("Accumulators use different reference values")
+        if other.n == 0:
+            return self
+        n = self.n + other.n
+        delta = other.mean - self.mean
+        self.m2 += other.m2 + delta**2 * self.n * other.n / n
+        self.mean += delta * other.n / n
+        self.n = n
+        self.sum_w += other.sum_w
+        self.sum_w2 += other.sum_w2
+        self.sum_wd += other.sum_wd
+        self.sum_wd2 += other.sum_wd2
+        return self
+    
+    def __add__(self, other: 'MetaAnalysisAccumulator') -> 'MetaAnalysisAccumulator':
+        return copy.copy(self).merge(other)
+    
+    @classmethod
+    def from_arrays(cls, c1_values, c1_errors, expected: float = 0.5) -> 'MetaAnalysisAccumulator':
+        acc = cls(expected=expected)
+        for c1, err in zip(c1_values, c1_errors):
+            acc.add(float(c1), float(err))
+        return acc
+    
+    def result(self) -> Dict:
+        """当前的元分析统计量（键与 meta_analysis 一致）"""
+        n = self.n
+        c1_weighted = self.expected + self.sum_wd / self.sum_w
+        c1_weighted_err = np.sqrt(1.0 / self.sum_w)
+        c1_std = np.sqrt(self.m2 / (n - 1)) if n > 1 else np.nan
+        
+        chi2_stat = self.sum_wd2
+        chi2_dof = n - 1
+        p_value = 1 - stats.chi2.cdf(chi2_stat, chi2_dof)
+        
+        t_stat = (c1_weighted - self.expected) / c1_weighted_err
+        p_value_t = 2 * (1 - stats.t.cdf(abs(t_stat), n - 1))
+        
+        return {
+            'weighted_mean': c1_weighted,
+            'weighted_error': c1_weighted_err,
+            'simple_mean': self.mean,
+            'std_dev': c1_std,
+            'sem': c1_std / np.sqrt(n),
+            'chi2_statistic': chi2_stat,
+            'chi2_dof': chi2_dof,
+            'chi2_pvalue': p_value,
+            't_statistic': t_stat,
+            't_pvalue': p_value_t,
+            'consistency_with_theory': p_value > 0.05
+        }
+    
+    @property
+    def cochran_q(self) -> float:
+        """Cochran Q = Σw(c₁ - c̄_w)²"""
+        return self.sum_wd2 - self.sum_wd**2 / self.sum_w
+    
+    def dersimonian_laird_tau2(self) -> float:
+        """DerSimonian–Laird 矩估计的总体方差 τ²，可直接由流式统计量得到"""
+        if self.n < 2:
+            return 0.0
+        c = self.sum_w - self.sum_w2 / self.sum_w
+        return max(0.0, (self.cochran_q - (self.n - 1)) / c)
+    
+    def leave_one_out(self, c1_values, c1_errors) -> Dict:
+        """
+        留一影响分析：对每个已加入的测量，给出移除它之后的加权均值和χ²
+        
+        直接由充分统计量向量化求得，不重新累加。
+        """
+        c1_values = np.asarray(c1_values, dtype=float)
+        w = 1.0 / np.asarray(c1_errors, dtype=float)**2
+        d = c1_values - self.expected
+        sum_w = self.sum_w - w
+        weighted_mean = self.expected + (self.sum_wd - w * d) / sum_w
+        return {
+            'weighted_mean': weighted_mean,
+            'weighted_error': np.sqrt(1.0 / sum_w),
+            'chi2_statistic': self.sum_wd2 - w * d**2,
+            'influence': self.expected + self.sum_wd / self.sum_w - weighted_mean
+        }
+
+
 def meta_analysis(materials: List[MaterialData]) -> Dict:
     """
     元分析：合并多个独立测量
@@ -142,46 +283,185 @@ def meta_analysis(materials: List[MaterialData]) -> Dict:
     c1_errors = np.array([m.c1_error for m in materials])
     names = [m.name for m in materials]
     
-    # 加权平均
-    weights = 1.0 / c1_errors**2
-    c1_weighted = np.sum(weights * c1_values) / np.sum(weights)
-    c1_weighted_err = np.sqrt(1.0 / np.sum(weights))
-    
-    # 简单平均
-    c1_mean = np.mean(c1_values)
-    c1_std = np.std(c1_values, ddof=1)
-    c1_sem = c1_std / np.sqrt(len(c1_values))
-    
-    # 一致性检验 (chi²)
-    expected = 0.5  # 理论值
-    chi2_stat = np.sum(((c1_values - expected) / c1_errors)**2)
-    chi2_dof = len(c1_values) - 1
-    p_value = 1 - stats.chi2.cdf(chi2_stat, chi2_dof)
-    
-    # 与理论值0.5的偏差
-    t_stat = (c1_weighted - expected) / c1_weighted_err
-    p_value_t = 2 * (1 - stats.t.cdf(abs(t_stat), len(c1_values)-1))
+    # 理论值0.5；统计量全部由累加器的充分统计量给出
+    acc = MetaAnalysisAccumulator.from_arrays(c1_values, c1_errors, expected=0.5)
     
     results = {
         'materials': names,
         'c1_values': c1_values.tolist(),
         'c1_errors': c1_errors.tolist(),
-        'weighted_mean': c1_weighted,
-        'weighted_error': c1_weighted_err,
-        'simple_mean': c1_mean,
-        'std_dev': c1_std,
-        'sem': c1_sem,
-        'chi2_statistic': chi2_stat,
-        'chi2_dof': chi2_dof,
-        'chi2_pvalue': p_value,
-        't_statistic': t_stat,
-        't_pvalue': p_value_t,
-        'consistency_with_theory': p_value > 0.05
     }
+    results.update(acc.result())
     
     return results
 
 
+# ============ 随机效应与分层模型 ============
+
+def random_effects_meta_analysis(c1_values, c1_errors, method: str = 'REML',
+                                 max_iter: int = 100, tol: float = 1e-10) -> Dict:
+    """
+    随机效应元分析：c₁,ᵢ ~ N(μ, σᵢ² + τ²)
+    
+    method='DL' 为DerSimonian–Laird矩估计；'REML' 为限制极大似然，
+    以DL为初值做Fisher评分迭代。返回 μ、SE(μ)、τ²、Cochran Q 与 I²。
+    """
+    c1_values = np.asarray(c1_values, dtype=float)
+    var = np.asarray(c1_errors, dtype=float)**2
+    k = len(c1_values)
+    acc = MetaAnalysisAccumulator.from_arrays(c1_values, np.sqrt(var))
+    q = acc.cochran_q
+    tau2 = acc.dersimonian_laird_tau2()
+    
+    if method == 'REML':
+        for _ in range(max_iter):
+            w = 1.0 / (var + tau2)
+            mu = np.sum(w * c1_values) / np.sum(w)
+            # REML 得分方程的Fisher评分步
+            update = (np.sum(w**2 * ((c1_values - mu)**2 - var)) / np.sum(w**2)
+                      + 1.0 / np.sum(w))
+            new_tau2 = max(0.0, update)
+            if abs(new_tau2 - tau2) < tol * max(1.0, tau2):
+                tau2 = new_tau2
+                break
+            tau2 = new_tau2
+    elif method != 'DL':
+        raise ValueError(f"Unknown random-effects method: {method}")
+    
+    w = 1.0 / (var + tau2)
+    mu = np.sum(w * c1_values) / np.sum(w)
+    return {
+        'method': method,
+        'mu': float(mu),
+        'mu_error': float(np.sqrt(1.0 / np.sum(w))),
+        'tau2': float(tau2),
+        'tau': float(np.sqrt(tau2)),
+        'cochran_Q': float(q),
+        'I2': float(max(0.0, (q - (k - 1)) / q)) if q > 0 else 0.0,
+    }
+
+
+def hierarchical_gibbs(c1_values, c1_errors, n_samples: int = 5000, burn_in: int = 1000,
+                       n_chains: int = 4, tau2_prior=(1.0, 1e-3),
+                       seed=None) -> Dict:
+    """
+    分层模型的向量化Gibbs采样
+    
+    c₁,ᵢ ~ N(θᵢ, σᵢ²)，θᵢ ~ N(μ, τ²)，μ 平坦先验，τ² ~ InvGamma(a, b)。
+    三个条件分布都是共轭的：
+        θᵢ | μ, τ² ~ N((c₁,ᵢ/σᵢ² + μ/τ²)/(1/σᵢ² + 1/τ²), 1/(1/σᵢ² + 1/τ²))
+        μ | θ, τ² ~ N(θ̄, τ²/k)
+        τ² | θ, μ ~ InvGamma(a + k/2, b + Σ(θᵢ - μ)²/2)
+    每步对 (链, 材料) 数组整体更新，开销与材料数成线性。
+    返回 μ、τ 的后验统计、各材料收缩后的 θᵢ 以及 μ 的 R̂。
+    """
+    rng = np.random.default_rng(seed)
+    c1 = np.asarray(c1_values, dtype=float)
+    prec = 1.0 / np.asarray(c1_errors, dtype=float)**2
+    k = len(c1)
+    a, b = tau2_prior
+    
+    mu = rng.normal(c1.mean(), c1.std() + 1e-3, size=n_chains)
+    tau2 = np.full(n_chains, max(c1.var(), 1e-6))
+    theta_sum = np.zeros((n_chains, k))
+    mu_draws = np.empty((n_chains, n_samples))
+    tau2_draws = np.empty((n_chains, n_samples))
+    
+    for step in range(burn_in + n_samples):
+        post_prec = prec + 1.0 / tau2[:, None]
+        post_mean = (prec * c1 + mu[:, None] / tau2[:, None]) / post_prec
+        theta = post_mean + rng.standard_normal((n_chains, k)) / np.sqrt(post_prec)
+        
+        mu = theta.mean(axis=1) + rng.standard_normal(n_chains) * np.sqrt(tau2 / k)
+        
+        ss = np.sum((theta - mu[:, None])**2, axis=1)
+        tau2 = (b + 0.5 * ss) / rng.gamma(a + 0.5 * k, size=n_chains)
+        
+        if step >= burn_in:
+            i = step - burn_in
+            mu_draws[:, i] = mu
+            tau2_draws[:, i] = tau2
+            theta_sum += theta
+    
+    # Gelman–Rubin R̂（μ）
+    chain_means = mu_draws.mean(axis=1)
+    W = mu_draws.var(axis=1, ddof=1).mean()
+    B = n_samples * chain_means.var(ddof=1) if n_chains > 1 else 0.0
+    r_hat = np.sqrt(((n_samples - 1) / n_samples * W + B / n_samples) / W)
+    
+    mu_flat = mu_draws.ravel()
+    tau_flat = np.sqrt(tau2_draws.ravel())
+    return {
+        'mu_mean': float(mu_flat.mean()),
+        'mu_std': float(mu_flat.std()),
+        'mu_95CI': np.percentile(mu_flat, [2.5, 97.5]).tolist(),
+        'tau_mean': float(tau_flat.mean()),
+        'tau_median': float(np.median(tau_flat)),
+        'tau_95CI': np.percentile(tau_flat, [2.5, 97.5]).tolist(),
+        'theta_mean': (theta_sum.sum(axis=0) / (n_chains * n_samples)).tolist(),
+        'r_hat_mu': float(r_hat),
+        'n_samples': n_chains * n_samples,
+    }
+
+
+# ============ 闭式对数证据 ============
+
+def _log_normal_interval(lo, hi):
+    """log(Φ(hi) - Φ(lo))，lo < hi；两端都在右尾时利用对称性避免相消"""
+    lo, hi = np.broadcast_arrays(np.asarray(lo, dtype=float), np.asarray(hi, dtype=float))
+    flip = lo > 0
+    a = np.where(flip, -hi, lo)
+    b = np.where(flip, -lo, hi)
+    log_b = special.log_ndtr(b)
+    return log_b + np.log1p(-np.exp(special.log_ndtr(a) - log_b))
+
+
+def log_evidence_uniform(c1_values, c1_errors, low: float = 0.0, high: float = 2.0):
+    """
+    均匀假设 c₁ ~ U[low, high] 下每个材料的精确对数证据
+    
+    p(ĉ | H) = ∫ N(ĉ | c, s²) / (high - low) dc
+             = [Φ((high - ĉ)/s) - Φ((low - ĉ)/s)] / (high - low)
+    参数均可广播，返回与输入广播形状相同的数组。
+    """
+    c1_values = np.asarray(c1_values, dtype=float)
+    c1_errors = np.asarray(c1_errors, dtype=float)
+    high = np.asarray(high, dtype=float)
+    low = np.asarray(low, dtype=float)
+    return (_log_normal_interval((low - c1_values) / c1_errors, (high - c1_values) / c1_errors)
+            - np.log(high - low))
+
+
+def log_evidence_gaussian(c1_values, c1_errors, mu: float = 0.5, sigma_H=0.1):
+    """
+    高斯假设 c₁ ~ N(μ, σ_H²) 下每个材料的精确对数证据：ĉ ~ N(μ, s² + σ_H²)
+    
+    sigma_H 可以是数组，例如形状 (G, 1) 的网格与 (k,) 的材料广播为 (G, k)。
+    """
+    c1_values = np.asarray(c1_values, dtype=float)
+    total_var = np.asarray(c1_errors, dtype=float)**2 + np.asarray(sigma_H, dtype=float)**2
+    return -0.5 * (np.log(2 * np.pi * total_var) + (c1_values - mu)**2 / total_var)
+
+
+def evidence_sensitivity(c1_values, c1_errors, sigma_H1_grid, mu_H1: float = 0.5,
+                         low_H0: float = 0.0, high_H0: float = 2.0) -> Dict:
+    """
+    先验敏感性扫描：对 σ_H1 网格一次性求 log B₁₀
+    
+    材料相互独立，总证据为各材料对数证据之和；计算对 (网格, 材料) 完全向量化。
+    """
+    sigma_H1_grid = np.atleast_1d(np.asarray(sigma_H1_grid, dtype=float))
+    log_Z0 = np.sum(log_evidence_uniform(c1_values, c1_errors, low_H0, high_H0))
+    log_Z1 = np.sum(log_evidence_gaussian(c1_values, c1_errors, mu_H1,
+                                          sigma_H1_grid[:, None]), axis=1)
+    return {
+        'sigma_H1': sigma_H1_grid,
+        'log_evidence_H0': log_Z0,
+        'log_evidence_H1': log_Z1,
+        'log_B10': log_Z1 - log_Z0,
+    }
+
+
 def bayesian_evidence_analysis(materials: List[MaterialData]) -> Dict:
     """
     贝叶斯证据分析
@@ -200,23 +480,17 @@ def bayesian_evidence_analysis(materials: List[MaterialData]) -> Dict:
     mu_H1 = 0.5
     sigma_H1 = 0.1
     
-    # 计算证据（近似）
-    evidence_H0 = 1.0
-    evidence_H1 = 1.0
-    
-    for c1, err in zip(c1_values, c1_errors):
-        # 似然（高斯）
-        likelihood_H0 = 1.0 / 2.0  # 均匀先验下平均似然
-        
-        # H1的似然：先验×似然
-        prior_val = stats.norm.pdf(c1, mu_H1, sigma_H1)
-        likelihood_H1 = prior_val
-        
-        evidence_H0 *= likelihood_H0
-        evidence_H1 *= likelihood_H1
+    # 精确对数证据（高斯测量误差与假设先验的解析卷积）
+    log_evidence_H0 = float(np.sum(log_evidence_uniform(c1_values, c1_errors, 0.0, 1.0 / prior_H0)))
+    log_evidence_H1 = float(np.sum(log_evidence_gaussian(c1_values, c1_errors, mu_H1, sigma_H1)))
     
     # 贝叶斯因子
-    B10 = evidence_H1 / evidence_H0 if evidence_H0 > 0 else np.inf
+    log_B10 = log_evidence_H1 - log_evidence_H0
+    B10 = np.exp(log_B10)
+    
+    # 先验宽度敏感性
+    sensitivity = evidence_sensitivity(c1_values, c1_errors, np.logspace(-2.5, 0, 200),
+                                       mu_H1, 0.0, 1.0 / prior_H0)
     
     # 使用BIC近似
     n = len(c1_values)
@@ -232,15 +506,19 @@ def bayesian_evidence_analysis(materials: List[MaterialData]) -> Dict:
     B10_BIC = np.exp(ln_B10_BIC)
     
     return {
-        'evidence_H0_approx': evidence_H0,
-        'evidence_H1_approx': evidence_H1,
-        'B10_approx': B10,
+        'log_evidence_H0': log_evidence_H0,
+        'log_evidence_H1': log_evidence_H1,
+        'log_B10': log_B10,
+        'B10': B10,
+        'sensitivity_sigma_H1': sensitivity['sigma_H1'].tolist(),
+        'sensitivity_log_B10': sensitivity['log_B10'].tolist(),
         'BIC_H0': BIC_H0,
         'BIC_H1': BIC_H1,
         'B10_BIC': B10_BIC,
-        'interpretation': 'B10 > 10: Strong evidence for H1' if B10_BIC > 10 else 
-                         '10 > B10 > 3: Moderate evidence' if B10_BIC > 3 else
-                         '3 > B10 > 1: Weak evidence' if B10_BIC > 1 else
+        # 解释基于精确证据；BIC值仅作为粗略对照保留
+        'interpretation': 'B10 > 10: Strong evidence for H1' if log_B10 > np.log(10) else
+                         '10 > B10 > 3: Moderate evidence' if log_B10 > np.log(3) else
+                         '3 > B10 > 1: Weak evidence' if log_B10 > 0 else
                          'B10 < 1: Evidence favors H0'
     }
 
@@ -378,13 +656,14 @@ def generate_report(materials: List[MaterialData], meta_results: Dict, bayes_res
     
     report.append("贝叶斯分析：")
     report.append("-"*70)
-    report.append(f"B₁₀ (BIC)  = {bayes_results['B10_BIC']:.2f}")
+    report.append(f"ln B₁₀     = {bayes_results['log_B10']:.2f} (精确证据)")
+    report.append(f"B₁₀ (BIC)  = {bayes_results['B10_BIC']:.2f} (近似，仅供对照)")
     report.append(f"解释       = {bayes_results['interpretation']}")
     report.append("")
     
     report.append("结论：")
     report.append("-"*70)
-    if meta_results['consistency_with_theory'] and bayes_results['B10_BIC'] > 3:
+    if meta_results['consistency_with_theory'] and bayes_results['log_B10'] > np.log(3):
         report.append("✓ 多个独立3D系统一致收敛到c₁≈0.5")
         report.append("✓ 与维度流理论预测一致")
         report.append("✓ 强烈支持c₁公式的物理真实性")
@@ -412,6 +691,18 @@ def main():
     logger.info("\n执行元分析...")
     meta_results = meta_analysis(materials)
     
+    # 随机效应与分层模型
+    logger.info("执行随机效应元分析...")
+    c1_values = [m.c1_value for m in materials]
+    c1_errors = [m.c1_error for m in materials]
+    random_effects = {method: random_effects_meta_analysis(c1_values, c1_errors, method)
+                      for method in ('DL', 'REML')}
+    hierarchical = hierarchical_gibbs(c1_values, c1_errors, seed=42)
+    logger.info(f"  REML: μ = {random_effects['REML']['mu']:.4f} ± "
+                f"{random_effects['REML']['mu_error']:.4f}, τ = {random_effects['REML']['tau']:.4f}")
+    logger.info(f"  分层Gibbs: μ = {hierarchical['mu_mean']:.4f} ± {hierarchical['mu_std']:.4f}, "
+                f"R̂ = {hierarchical['r_hat_mu']:.3f}")
+    
     # 贝叶斯分析
     logger.info("执行贝叶斯分析...")
     bayes_results = bayesian_evidence_analysis(materials)
@@ -429,6 +720,8 @@ def main():
     results = {
         'materials': [{'name': m.name, 'c1': m.c1_value, 'error': m.c1_error} for m in materials],
         'meta_analysis': meta_results,
+        'random_effects': random_effects,
+        'hierarchical': hierarchical,
         'bayesian_analysis': bayes_results
     }
     
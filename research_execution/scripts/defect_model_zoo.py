@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+"""
+量子缺陷模型库扫描
+目标：不再只比较手选的标准模型与维度流模型，而是对注册表中的每个模型
+（多阶Ritz展开、指数、幂律、维度流变体）在所有材料上拟合并按AIC/BIC/证据排序
+
+所有模型都以共享的 log n 表作为自变量：该表对所有材料只计算一次，
+n^(-p)、费米函数等形式直接由它求得，每个模型在所有材料上只做一次批量LM求解。
+"""
+
+import os
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+import logging
+
+from batched_fitting import batched_least_squares, dimflow_jacobian
+from tmdc_phase2_analysis import TMDCData
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class DefectModel:
+    """注册的量子缺陷模型；func(log_n, *params)"""
+    name: str
+    func: Callable
+    param_names: Tuple[str, ...]
+    p0: Sequence[float]
+    bounds: Tuple[Sequence[float], Sequence[float]]  # 有限边界，同时定义均匀先验
+    jac: Optional[Callable] = None
+    description: str = ''
+
+    @property
+    def n_params(self) -> int:
+        return len(self.param_names)
+
+    @property
+    def log_prior_volume(self) -> float:
+        return float(np.sum(np.log(np.subtract(self.bounds[1], self.bounds[0]))))
+
+
+DEFECT_MODELS: Dict[str, DefectModel] = {}
+
+
+def register_defect_model(name: str, param_names: Sequence[str], p0: Sequence[float],
+                          bounds: Tuple[Sequence[float], Sequence[float]],
+                          jac: Optional[Callable] = None, description: str = ''):
+    """装饰器：把 func(log_n, *params) 注册到 DEFECT_MODELS"""
+
+    def decorator(func):
+        DEFECT_MODELS[name] = DefectModel(name, func, tuple(param_names), list(p0),
+                                          bounds, jac, description)
+        return func
+
+    return decorator
+
+
+# ============ 模型定义 ============
+
+@register_defect_model('constant', ['delta0'], [0.2], ([-1.0], [1.0]),
+                       description='δ = δ₀')
+def constant_defect(log_n, delta0):
+    return delta0 + 0.0 * log_n
+
+
+@register_defect_model('exponential', ['delta0', 'alpha'], [0.2, 0.5], ([0, 0], [1, 2]),
+                       description='δ₀ exp(-α(n-1))，即 standard_defect_2d')
+def exponential_defect(log_n, delta0, alpha):
+    return delta0 * np.exp(-alpha * (np.exp(log_n) - 1))
+
+
+@register_defect_model('power_law', ['delta0', 'p'], [0.2, 1.0], ([0, 0], [1, 5]),
+                       description='δ₀ n^(-p)')
+def power_law_defect(log_n, delta0, p):
+    return delta0 * np.exp(-p * log_n)
+
+
+def _register_ritz(order: int):
+    """修正Ritz展开 δ = δ₀ + Σ_k a_k/(n - δ₀)^(2k)，k = 1..order"""
+    names = ['delta0'] + [f'a{2 * k}' for k in range(1, order + 1)]
+
+    def ritz(log_n, delta0, *coeffs):
+        # (n - δ₀)^(-2) 只算一次，高阶项逐次相乘
+        inv_sq = 1.0 / (np.exp(log_n) - delta0)**2
+        term = np.ones_like(inv_sq)
+        total = delta0 + 0.0 * inv_sq
+        for a in coeffs:
+            term = term * inv_sq
+            total = total + a * term
+        return total
+
+    ritz.__name__ = f'ritz_{order}'
+    register_defect_model(f'ritz_{order}', names, [0.2] + [0.0] * order,
+                          ([-1.0] + [-5.0] * order, [0.9] + [5.0] * order),
+                          description=f'{order}阶修正Ritz展开')(ritz)
+
+
+for _order in (1, 2, 3):
+    _register_ritz(_order)
+
+
+def _dimflow(log_n, delta0, n0, c1):
+    # δ₀ n₀^c₁/(n^c₁ + n₀^c₁) = δ₀ / (1 + exp(c₁(log n - log n₀)))
+    return delta0 / (1.0 + np.exp(c1 * (log_n - np.log(n0))))
+
+
+@register_defect_model('dimflow_fixed', ['delta0', 'n0'], [0.3, 3.0], ([0.01, 0.5], [1.0, 10.0]),
+                       jac=lambda log_n, d0, n0: dimflow_jacobian(np.exp(log_n), d0, n0, 1.0)[..., :2],
+                       description='维度流，c₁=1（2D预测）')
+def dimflow_fixed_defect(log_n, delta0, n0):
+    return _dimflow(log_n, delta0, n0, 1.0)
+
+
+@register_defect_model('dimflow_half', ['delta0', 'n0'], [0.3, 3.0], ([0.01, 0.5], [1.0, 10.0]),
+                       jac=lambda log_n, d0, n0: dimflow_jacobian(np.exp(log_n), d0, n0, 0.5)[..., :2],
+                       description='维度流，c₁=0.5（3D预测）')
+def dimflow_half_defect(log_n, delta0, n0):
+    return _dimflow(log_n, delta0, n0, 0.5)
+
+
+@register_defect_model('dimflow_free', ['delta0', 'n0', 'c1'], [0.3, 3.0, 1.0],
+                       ([0.01, 0.5, 0.1], [1.0, 10.0, 2.0]),
+                       jac=lambda log_n, d0, n0, c1: dimflow_jacobian(np.exp(log_n), d0, n0, c1),
+                       description='维度流，自由c₁')
+def dimflow_free_defect(log_n, delta0, n0, c1):
+    return _dimflow(log_n, delta0, n0, c1)
+
+
+@register_defect_model('dimflow_offset', ['delta_inf', 'delta0', 'n0', 'c1'], [0.0, 0.3, 3.0, 1.0],
+                       ([-0.5, 0.01, 0.5, 0.1], [0.5, 1.0, 10.0, 2.0]),
+                       description='维度流 + 常数渐近缺陷 δ∞')
+def dimflow_offset_defect(log_n, delta_inf, delta0, n0, c1):
+    return delta_inf + _dimflow(log_n, delta0, n0, c1)
+
+
+# ============ 扫描 ============
+
+def _prepare(datasets: List[TMDCData]):
+    """共享表：对所有材料一次性求 log n、δ、σ（按最长序列填充）"""
+    rows = []
+    for data in datasets:
+        delta, delta_err = data.quantum_defect()
+        valid = ~np.isnan(delta)
+        rows.append((data.n_values[valid].astype(float), delta[valid], delta_err[valid]))
+
+    width = max(len(r[0]) for r in rows)
+    log_n = np.zeros((len(rows), width))
+    y = np.full((len(rows), width), np.nan)
+    sigma = np.ones((len(rows), width))
+    for i, (n, d, e) in enumerate(rows):
+        log_n[i, :len(n)] = np.log(n)
+        y[i, :len(n)] = d
+        sigma[i, :len(n)] = e
+    counts = np.array([len(r[0]) for r in rows])
+    return log_n, y, sigma, counts
+
+
+def fit_model_all_materials(name: str, log_n: np.ndarray, y: np.ndarray,
+                            sigma: np.ndarray, counts: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    单个模型在所有材料上的一次批量拟合
+
+    数据点不超过参数个数的材料不参与（结果为NaN）。
+    拉普拉斯证据：log Z ≈ log L̂ + (k_f/2) log 2π - ½ log|A_ff| - log V_f，
+    其中 log L̂ 含高斯归一化常数，A = JᵀΣ⁻¹J 为Fisher矩阵。贴在边界上的参数
+    视为固定在边界（高斯近似在该方向不成立），积分与均匀先验体积 V_f 都只取
+    自由参数 f；这对该方向的边缘化偏乐观，比较时应参考 evidence_note。自由块奇异时证据为NaN，evidence_note 给出原因：
+    'at_bound: <参数>'（已投影到自由参数）或 'singular_covariance'。
+    """
+    spec = DEFECT_MODELS[name]
+    k = spec.n_params
+    out = {key: np.full(len(counts), np.nan) for key in ('chi2', 'AIC', 'BIC', 'log_evidence')}
+    out['params'] = np.full((len(counts), k), np.nan)
+    out['converged'] = np.zeros(len(counts), dtype=bool)
+    out['evidence_note'] = np.full(len(counts), '', dtype=object)
+
+    eligible = np.flatnonzero(counts > k)
+    if eligible.size == 0:
+        return out
+
+    fit = batched_least_squares(spec.func, log_n[eligible], y[eligible], sigma[eligible],
+                                spec.p0, bounds=spec.bounds, jac=spec.jac)
+    N = counts[eligible]
+    valid = np.isfinite(y[eligible])
+    log_norm = -np.sum(np.where(valid, np.log(np.sqrt(2 * np.pi) * sigma[eligible]), 0.0), axis=1)
+
+    # 自由参数块的Fisher矩阵；固定参数的行列置为单位阵，不影响行列式
+    lower, upper = (np.asarray(b, dtype=float) for b in spec.bounds)
+    free = (fit.params > lower) & (fit.params < upper)
+    fisher = np.linalg.pinv(fit.covariance)
+    fisher = (np.where(free[:, :, None] & free[:, None, :], fisher, 0.0)
+              + (~free)[:, :, None] * np.eye(k))
+    eigvals = np.linalg.eigvalsh(fisher)
+    regular = eigvals[:, 0] > 1e-12 * np.maximum(eigvals[:, -1], 1e-300)
+    log_det = np.sum(np.log(np.where(regular[:, None], eigvals, 1.0)), axis=1)
+    log_volume = np.log(upper - lower)
+
+    out['chi2'][eligible] = fit.chi2
+    out['AIC'][eligible] = fit.chi2 + 2 * k
+    out['BIC'][eligible] = fit.chi2 + k * np.log(N)
+    out['log_evidence'][eligible] = np.where(
+        regular,
+        log_norm - 0.5 * fit.chi2 + 0.5 * free.sum(axis=1) * np.log(2 * np.pi) - 0.5 * log_det
+        - free @ log_volume,
+        np.nan
+    )
+    out['evidence_note'][eligible] = [
+        'singular_covariance' if not ok else
+        f"at_bound: {', '.join(np.asarray(spec.param_names)[~f])}" if not f.all() else ''
+        for ok, f in zip(regular, free)
+    ]
+    out['params'][eligible] = fit.params
+    out['converged'][eligible] = fit.converged
+    return out
+
+
+def scan_defect_models(datasets: List[TMDCData],
+                       models: Optional[Sequence[str]] = None,
+                       n_workers: Optional[int] = 1) -> pd.DataFrame:
+    """
+    对每个材料拟合所有注册模型，返回排好序的比较表
+
+    各模型在进程池中并行（n_workers=1 为串行），模型内部对所有材料批量求解。
+    表中每行一个 (材料, 模型)，按材料内BIC排序，附 ΔAIC、ΔBIC、Akaike权重、
+    Δlog Z（相对材料内最佳证据）。未收敛的拟合 (converged=False) 排在最后，
+    其 Δ 值、权重和名次为NaN。note 列说明特殊情况：'not_converged'，或
+    拉普拉斯证据的 evidence_note（奇异协方差时 Δlog Z 为NaN）。
+    """
+    models = list(DEFECT_MODELS) if models is None else list(models)
+    log_n, y, sigma, counts = _prepare(datasets)
+
+    args = (log_n, y, sigma, counts)
+    if n_workers == 1:
+        fits = [fit_model_all_materials(name, *args) for name in models]
+    else:
+        with ProcessPoolExecutor(max_workers=n_workers) as pool:
+            fits = list(pool.map(fit_model_all_materials, models,
+                                 *[[a] * len(models) for a in args]))
+
+    rows = []
+    for name, fit in zip(models, fits):
+        spec = DEFECT_MODELS[name]
+        for i, data in enumerate(datasets):
+            if not np.isfinite(fit['chi2'][i]):
+                continue
+            rows.append({
+                'material': data.material,
+                'model': name,
+                'k': spec.n_params,
+                'n_points': int(counts[i]),
+                'chi2': fit['chi2'][i],
+                'AIC': fit['AIC'][i],
+                'BIC': fit['BIC'][i],
+                'log_evidence': fit['log_evidence'][i],
+                'converged': bool(fit['converged'][i]),
+                'note': fit['evidence_note'][i] if fit['converged'][i] else 'not_converged',
+                'params': dict(zip(spec.param_names, fit['params'][i].tolist())),
+            })
+
+    table = pd.DataFrame(rows)
+    if table.empty:
+        return table
+
+    # 未收敛的拟合保留在表中以便检查，但不参与排序、Δ 值和Akaike权重
+    ranked = table.where(table['converged'])
+    ranked['material'] = table['material']
+    by_material = ranked.groupby('material', sort=False)
+    table['delta_AIC'] = ranked['AIC'] - by_material['AIC'].transform('min')
+    table['delta_BIC'] = ranked['BIC'] - by_material['BIC'].transform('min')
+    table['delta_log_evidence'] = (ranked['log_evidence']
+                                   - by_material['log_evidence'].transform('max'))
+    rel = np.exp(-0.5 * table['delta_AIC'])
+    table['akaike_weight'] = rel / rel.groupby(table['material']).transform('sum')
+    table['rank'] = by_material['BIC'].rank(method='min').astype('Int64')
+    return table.sort_values(['material', 'rank'], kind='stable',
+                             na_position='last').reset_index(drop=True)
+
+
+if __name__ == "__main__":
+    from tmdc_phase2_analysis import (load_tmdc_data_comprehensive,
+                                      generate_synthetic_tmdc_data)
+
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s')
+    all_data = load_tmdc_data_comprehensive() + generate_synthetic_tmdc_data()
+    table = scan_defect_models(all_data, n_workers=os.cpu_count())
+
+    columns = ['model', 'k', 'chi2', 'delta_AIC', 'delta_BIC', 'delta_log_evidence', 'akaike_weight',
+               'converged', 'note']
+    for material, group in table.groupby('material', sort=False):
+        logger.info(f"\n{material} ({group['n_points'].iloc[0]} 个能级):\n"
+                    f"{group[columns].to_string(index=False, float_format=lambda v: f'{v:.3f}')}")
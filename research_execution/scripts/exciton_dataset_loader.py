@@ -0,0 +1,345 @@
+#!/usr/bin/env python3
+"""
+激子数据目录的惰性加载器
+目标：用数据文件 + 清单取代 load_tmdc_data_comprehensive / load_cross_material_data /
+load_3d_comparison_data 中的Python字面量，新增材料无需改代码
+
+目录结构：
+    data_dir/
+        manifest.json
+        mos2.csv          # 逐能级列：n_values, energies, energy_errors
+        cu2o.parquet
+        ws2.npz           # 数组与标量（0维数组）都可存放在文件中
+
+manifest.json：
+    {"datasets": [
+        {"name": "MoS₂", "schema": "tmdc", "file": "mos2.csv",
+         "fields": {"band_gap": 2.16, "binding_energy_1s": 240.0, ...}},
+        ...
+    ]}
+
+只在首次访问某个材料时读取并校验其文件；解析结果按 (mtime, 内容哈希) 缓存。
+"""
+
+import re
+import json
+import hashlib
+import unicodedata
+import importlib
+import dataclasses
+import numpy as np
+import pandas as pd
+from collections.abc import Mapping
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = 'manifest.json'
+
+
+class DatasetValidationError(ValueError):
+    """数据文件不符合目标数据类的模式"""
+
+
+@dataclass(frozen=True)
+class DatasetSchema:
+    """目标数据类及其逐能级数组字段（数据类在首次使用时才导入）"""
+    module: str
+    class_name: str
+    array_fields: Tuple[str, ...]
+    level_field: str
+
+    @property
+    def cls(self):
+        return getattr(importlib.import_module(self.module), self.class_name)
+
+
+SCHEMAS = {
+    'tmdc': DatasetSchema('tmdc_phase2_analysis', 'TMDCData',
+                          ('n_values', 'energies', 'energy_errors'), 'n_values'),
+    'material': DatasetSchema('cu2o_cross_material_analysis', 'MaterialData',
+                              ('n_levels', 'energies'), 'n_levels'),
+    'exciton': DatasetSchema('tmdc_data_collection', 'ExcitonData',
+                             ('n_levels', 'energies', 'uncertainties'), 'n_levels'),
+}
+
+
+# ============ 文件解析与缓存 ============
+
+# 绝对路径 -> (mtime_ns, sha1, 解析后的列)
+_FILE_CACHE: Dict[str, Tuple[int, str, Dict[str, np.ndarray]]] = {}
+
+
+def _file_hash(path: Path, block_size: int = 1 << 20) -> str:
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _parse_file(path: Path) -> Dict[str, np.ndarray]:
+    """按扩展名解析为 {列名: 数组}"""
+    suffix = path.suffix.lower()
+    if suffix == '.npz':
+        with np.load(path, allow_pickle=False) as npz:
+            return {k: npz[k] for k in npz.files}
+    if suffix == '.csv':
+        frame = pd.read_csv(path, comment='#')
+    elif suffix in ('.parquet', '.pq'):
+        try:
+            frame = pd.read_parquet(path)
+        except ImportError as e:
+            raise ImportError(f"读取 {path.name} 需要 pyarrow 或 fastparquet") from e
+    else:
+        raise ValueError(f"Unsupported data file format: {path.suffix}")
+    return {col: frame[col].to_numpy() for col in frame.columns}
+
+
+def read_data_file(path) -> Dict[str, np.ndarray]:
+    """
+    读取数据文件，带解析缓存
+
+    mtime 未变时直接命中；mtime 变化但内容哈希相同（如 touch、重新检出）时
+    同样复用已解析结果，只有内容真正变化才重新解析。
+    """
+    path = Path(path).resolve()
+    key = str(path)
+    mtime = path.stat().st_mtime_ns
+
+    cached = _FILE_CACHE.get(key)
+    if cached is not None and cached[0] == mtime:
+        return cached[2]
+
+    digest = _file_hash(path)
+    if cached is not None and cached[1] == digest:
+        _FILE_CACHE[key] = (mtime, digest, cached[2])
+        return cached[2]
+
+    columns = _parse_file(path)
+    for arr in columns.values():
+        arr.setflags(write=False)
+    _FILE_CACHE[key] = (mtime, digest, columns)
+    return columns
+
+
+def clear_file_cache():
+    """清空解析缓存"""
+    _FILE_CACHE.clear()
+
+
+# ============ 模式校验 ============
+
+def validate_record(record: Dict[str, Any], schema: DatasetSchema, source: str = '') -> Dict[str, Any]:
+    """
+    按数据类字段校验并规整一条记录
+
+    - 无默认值的字段必须存在
+    - 逐能级字段为等长、有限的一维浮点数组，能级编号须为整数
+    - 标量字段从0维/单元素数组中取出
+    返回可直接传给数据类构造函数的关键字参数。
+    """
+    prefix = f"{source}: " if source else ''
+    fields = {f.name: f for f in dataclasses.fields(schema.cls)}
+
+    unknown = set(record) - set(fields)
+    if unknown:
+        raise DatasetValidationError(f"{prefix}未知字段 {sorted(unknown)}")
+    missing = [name for name, f in fields.items()
+               if name not in record and f.default is dataclasses.MISSING
+               and f.default_factory is dataclasses.MISSING]
+    if missing:
+        raise DatasetValidationError(f"{prefix}缺少字段 {missing}")
+
+    kwargs = {}
+    n_levels = None
+    for name, value in record.items():
+        if name in schema.array_fields:
+            try:
+                arr = np.asarray(value, dtype=float).ravel()
+            except (TypeError, ValueError) as e:
+                raise DatasetValidationError(f"{prefix}字段 {name} 不是数值数组") from e
+            if not np.all(np.isfinite(arr)):
+                raise DatasetValidationError(f"{prefix}字段 {name} 含非有限值")
+            if n_levels is not None and arr.size != n_levels:
+                raise DatasetValidationError(
+                    f"{prefix}字段 {name} 长度 {arr.size} 与其他逐能级字段 ({n_levels}) 不一致")
+            n_levels = arr.size
+            if name == schema.level_field:
+                if not np.all(arr == np.round(arr)):
+                    raise DatasetValidationError(f"{prefix}能级编号 {name} 须为整数")
+                arr = arr.astype(int)
+            kwargs[name] = arr
+        else:
+            if isinstance(value, np.ndarray):
+                if value.size != 1:
+                    raise DatasetValidationError(f"{prefix}标量字段 {name} 含 {value.size} 个值")
+                value = value.item()
+            expected = fields[name].type
+            if expected in (float, 'float'):
+                value = float(value)
+            elif expected in (int, 'int'):
+                value = int(value)
+            elif expected in (str, 'str'):
+                value = str(value)
+            kwargs[name] = value
+
+    if n_levels == 0:
+        raise DatasetValidationError(f"{prefix}没有能级数据")
+    return kwargs
+
+
+# ============ 惰性数据集映射 ============
+
+@dataclass
+class ManifestEntry:
+    """清单中的一个数据集"""
+    name: str
+    schema: str
+    file: Optional[str]
+    fields: Dict[str, Any]
+
+
+class ExcitonDataDirectory(Mapping):
+    """
+    数据目录的只读映射 {材料名: 数据类实例}
+
+    构造时只读取清单；数据文件在首次 __getitem__ 时才解析、校验并实例化，
+    实例在本映射内缓存。
+    """
+
+    def __init__(self, directory, schema: Optional[str] = None):
+        self.directory = Path(directory)
+        manifest_path = self.directory / MANIFEST_NAME
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+
+        self._entries: Dict[str, ManifestEntry] = {}
+        for raw in manifest.get('datasets', []):
+            entry = ManifestEntry(
+                name=raw['name'],
+                schema=raw.get('schema', 'tmdc'),
+                file=raw.get('file'),
+                fields=raw.get('fields', {})
+            )
+            if entry.schema not in SCHEMAS:
+                raise DatasetValidationError(f"{entry.name}: 未知模式 {entry.schema}")
+            if schema is not None and entry.schema != schema:
+                continue
+            if entry.name in self._entries:
+                raise DatasetValidationError(f"清单中重复的数据集名 {entry.name}")
+            self._entries[entry.name] = entry
+        self._loaded: Dict[str, Any] = {}
+
+    def __getitem__(self, name: str):
+        if name not in self._loaded:
+            self._loaded[name] = self._materialise(self._entries[name])
+        return self._loaded[name]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._entries)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def schema_of(self, name: str) -> str:
+        return self._entries[name].schema
+
+    def _materialise(self, entry: ManifestEntry):
+        schema = SCHEMAS[entry.schema]
+        record = {}
+        if entry.file is not None:
+            record.update(read_data_file(self.directory / entry.file))
+        # 清单中的字段覆盖文件中的同名标量
+        record.update(entry.fields)
+        name_field = 'name' if 'name' in {f.name for f in dataclasses.fields(schema.cls)} else 'material'
+        record.setdefault(name_field, entry.name)
+
+        kwargs = validate_record(record, schema, source=entry.file or entry.name)
+        # 缓存中的数组是只读的，实例拿到各自的可写副本
+        kwargs = {k: v.copy() if isinstance(v, np.ndarray) else v for k, v in kwargs.items()}
+        logger.debug(f"加载 {entry.name} ({entry.schema})")
+        return schema.cls(**kwargs)
+
+
+def load_dataset_directory(directory, schema: Optional[str] = None) -> List:
+    """立即加载目录中的全部（或指定模式的）数据集，返回列表，可替代内置加载函数"""
+    datasets = ExcitonDataDirectory(directory, schema)
+    return [datasets[name] for name in datasets]
+
+
+# ============ 导出 ============
+
+def export_datasets(directory, datasets: List, schema: str, fmt: str = 'csv',
+                    append: bool = True) -> Path:
+    """
+    将数据类实例写为数据目录（逐能级字段写入文件，标量字段写入清单）
+
+    可用于把内置的字面量数据迁移到目录中。
+    """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    spec = SCHEMAS[schema]
+    manifest_path = directory / MANIFEST_NAME
+
+    manifest = {'datasets': []}
+    if append and manifest_path.exists():
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    existing = {(e['name'], e.get('schema', 'tmdc')): i
+                for i, e in enumerate(manifest['datasets'])}
+
+    for data in datasets:
+        record = dataclasses.asdict(data)
+        name = record.pop('name', None) or record.pop('material')
+        stem = re.sub(r'[^0-9A-Za-z]+', '_', unicodedata.normalize('NFKD', name)).strip('_')
+        arrays = {k: np.asarray(record.pop(k)) for k in spec.array_fields}
+
+        filename = f"{schema}_{stem}.{fmt}"
+        if fmt == 'npz':
+            np.savez(directory / filename, **arrays)
+        elif fmt == 'csv':
+            pd.DataFrame(arrays).to_csv(directory / filename, index=False)
+        elif fmt == 'parquet':
+            pd.DataFrame(arrays).to_parquet(directory / filename, index=False)
+        else:
+            raise ValueError(f"Unsupported data file format: {fmt}")
+
+        fields = {k: (v.item() if isinstance(v, np.generic) else v) for k, v in record.items()}
+        entry = {'name': name, 'schema': schema, 'file': filename, 'fields': fields}
+        if (name, schema) in existing:
+            manifest['datasets'][existing[(name, schema)]] = entry
+        else:
+            manifest['datasets'].append(entry)
+
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    return manifest_path
+
+
+if __name__ == "__main__":
+    import sys
+
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s')
+    if len(sys.argv) < 2:
+        print("用法: python exciton_dataset_loader.py <数据目录> [--export]")
+        sys.exit(1)
+
+    target = sys.argv[1]
+    if '--export' in sys.argv:
+        from tmdc_phase2_analysis import load_tmdc_data_comprehensive
+        from cu2o_cross_material_analysis import load_cross_material_data
+        from tmdc_data_collection import load_3d_comparison_data
+
+        export_datasets(target, load_tmdc_data_comprehensive(), 'tmdc', append=False)
+        export_datasets(target, load_cross_material_data(), 'material')
+        export_datasets(target, load_3d_comparison_data(), 'exciton')
+
+    for schema in SCHEMAS:
+        datasets = ExcitonDataDirectory(target, schema)
+        logger.info(f"{target} [{schema}]: {len(datasets)} 个数据集")
+        for name in datasets:
+            logger.info(f"  {name:<14} {len(datasets[name].energies)} 个能级")
@@ -0,0 +1,377 @@
+#!/usr/bin/env python3
+"""
+原始光谱激子峰提取
+目标：直接从反射/PL/吸收原始光谱（CSV或.npy，可达数百MB）提取里德伯系列峰位及其不确定度，
+输出 ExcitonData / TMDCData，取代手工抄录的能级（如 [1.897, 1.970, 1.986]）
+
+流程：内存映射/分块读取 → 流式分箱降采样 → 峰检测 → 向量化多洛伦兹拟合 → 里德伯序号指派
+"""
+
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from scipy.optimize import least_squares
+from scipy.signal import find_peaks, peak_widths, savgol_filter
+from dataclasses import dataclass
+from typing import Iterator, Optional, Tuple
+import logging
+
+from tmdc_data_collection import ExcitonData
+from tmdc_phase2_analysis import TMDCData
+
+logger = logging.getLogger(__name__)
+
+HC_EV_NM = 1239.84193  # hc (eV·nm)，波长→能量
+
+
+@dataclass
+class ExcitonPeaks:
+    """提取出的激子峰"""
+    n_levels: np.ndarray  # 指派的主量子数
+    energies: np.ndarray  # 峰位 (eV)
+    energy_errors: np.ndarray  # 峰位标准误差 (eV)
+    widths: np.ndarray  # 洛伦兹半宽 γ (eV)
+    amplitudes: np.ndarray  # 峰高
+    band_gap: Optional[float] = None  # 由里德伯系列外推的带隙 (eV)，≥2个峰时才有
+    rydberg: Optional[float] = None  # 由里德伯系列外推的有效里德伯能量 (eV)，≥2个峰时才有
+    source: str = ""
+
+    def series_parameters(self, band_gap: Optional[float] = None,
+                          rydberg: Optional[float] = None,
+                          use_extrapolated: bool = False) -> Tuple[float, float]:
+        """
+        量子缺陷计算所用的 (E_g, R*)，单位 eV
+
+        外推值来自零缺陷公式 E_n = E_g - R*/(n - 1/2)² 的拟合，用它们计算的量子缺陷
+        被系统性地压向0（两个峰时恰为0），因此须显式给出独立测得的 E_g 和 R*；
+        use_extrapolated=True 时才以外推值补缺并发出警告。
+        """
+        missing = [name for name, value in (('band_gap', band_gap), ('rydberg', rydberg))
+                   if value is None]
+        if missing and not use_extrapolated:
+            raise ValueError(f"须显式给出 {', '.join(missing)}：外推值会使量子缺陷偏向0"
+                             "（确需使用时传入 use_extrapolated=True）")
+        if missing:
+            if self.band_gap is None or self.rydberg is None:
+                raise ValueError(f"{self.source}: 仅 {len(self.energies)} 个峰，"
+                                 f"无法外推 {', '.join(missing)}，须显式给出")
+            logger.warning(f"{self.source}: {', '.join(missing)} 取里德伯系列外推值，"
+                           "量子缺陷将偏向0")
+        return (self.band_gap if band_gap is None else band_gap,
+                self.rydberg if rydberg is None else rydberg)
+
+    def to_exciton_data(self, material: str, band_gap: Optional[float] = None,
+                        rydberg: Optional[float] = None, dimension: int = 2,
+                        use_extrapolated: bool = False) -> ExcitonData:
+        """转换为 ExcitonData（E_g、R* 须显式给出，见 series_parameters）"""
+        band_gap, rydberg = self.series_parameters(band_gap, rydberg, use_extrapolated)
+        return ExcitonData(
+            material=material,
+            n_levels=self.n_levels,
+            energies=self.energies,
+            uncertainties=self.energy_errors,
+            band_gap=band_gap,
+            rydberg=rydberg,
+            dimension=dimension
+        )
+
+    def to_tmdc_data(self, material: str, reduced_mass: float, dielectric_constant: float,
+                     band_gap: Optional[float] = None,
+                     binding_energy_1s: Optional[float] = None,
+                     reference: Optional[str] = None,
+                     use_extrapolated: bool = False) -> TMDCData:
+        """转换为 TMDCData（binding_energy_1s 单位 meV；E_g、R* 须显式给出，见 series_parameters）"""
+        rydberg = None if binding_energy_1s is None else binding_energy_1s / 1000.0
+        band_gap, rydberg = self.series_parameters(band_gap, rydberg, use_extrapolated)
+        return TMDCData(
+            material=material,
+            n_values=self.n_levels,
+            energies=self.energies,
+            energy_errors=self.energy_errors,
+            band_gap=band_gap,
+            binding_energy_1s=1000.0 * rydberg,
+            reduced_mass=reduced_mass,
+            dielectric_constant=dielectric_constant,
+            reference=f"Extracted from {self.source}" if reference is None else reference
+        )
+
+
+# ============ 分块读取 ============
+
+def read_spectrum_chunks(path: str, chunk_rows: int = 1_000_000,
+                         columns: Tuple[int, int] = (0, 1)) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+    """
+    逐块读取 (x, signal)
+
+    .npy 以 mmap_mode='r' 打开，只把当前块读入内存（支持 (N, ≥2) 或 (2, N) 布局）；
+    .csv 以逗号、其它文本文件以空白分隔，由 pandas 分块解析（跳过 '#' 注释和非数值表头）。
+    """
+    path = Path(path)
+    if path.suffix == '.npy':
+        arr = np.load(path, mmap_mode='r')
+        if arr.ndim != 2:
+            raise ValueError(f"{path}: 需要二维数组，实际形状 {arr.shape}")
+        by_rows = arr.shape[1] >= 2 and not (arr.shape[0] == 2 and arr.shape[1] > 2)
+        n_total = arr.shape[0] if by_rows else arr.shape[1]
+        for start in range(0, n_total, chunk_rows):
+            stop = min(start + chunk_rows, n_total)
+            if by_rows:
+                block = np.asarray(arr[start:stop, list(columns)], dtype=float)
+                yield block[:, 0], block[:, 1]
+            else:
+                yield (np.asarray(arr[columns[0], start:stop], dtype=float),
+                       np.asarray(arr[columns[1], start:stop], dtype=float))
+        return
+
+    sep = ',' if path.suffix == '.csv' else r'\s+'
+    reader = pd.read_csv(path, comment='#', header=0 if _has_header(path, sep) else None,
+                         usecols=list(columns), chunksize=chunk_rows, sep=sep,
+                         dtype=float)
+    for block in reader:
+        block = block.dropna()
+        yield block.iloc[:, 0].to_numpy(), block.iloc[:, 1].to_numpy()
+
+
+def _has_header(path: Path, sep: str) -> bool:
+    """首个非注释行是否为非数值表头"""
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                fields = line.split(',') if sep == ',' else line.split()
+                try:
+                    [float(x) for x in fields]
+                    return False
+                except ValueError:
+                    return True
+    return False
+
+
+def _to_energy(x: np.ndarray, x_unit: str) -> np.ndarray:
+    if x_unit == 'eV':
+        return x
+    if x_unit == 'meV':
+        return x / 1000.0
+    if x_unit == 'nm':
+        return HC_EV_NM / x
+    raise ValueError(f"Unknown x unit: {x_unit}")
+
+
+def bin_spectrum(path: str, n_bins: int = 20000,
+                 energy_range: Optional[Tuple[float, float]] = None,
+                 x_unit: str = 'eV', chunk_rows: int = 1_000_000,
+                 columns: Tuple[int, int] = (0, 1)) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    流式分箱降采样
+
+    每块只做一次 bincount 累加 Σs、Σs²、计数，内存与文件大小无关。
+    未给 energy_range 时先做一遍扫描求能量范围。
+    返回 (能量中心, 箱内均值, 均值标准误差)，空箱被丢弃。
+    """
+    if energy_range is None:
+        lo, hi = np.inf, -np.inf
+        for x, _ in read_spectrum_chunks(path, chunk_rows, columns):
+            E = _to_energy(x, x_unit)
+            lo, hi = min(lo, E.min()), max(hi, E.max())
+        energy_range = (lo, hi)
+
+    lo, hi = energy_range
+    sums = np.zeros(n_bins)
+    sums_sq = np.zeros(n_bins)
+    counts = np.zeros(n_bins)
+    for x, s in read_spectrum_chunks(path, chunk_rows, columns):
+        E = _to_energy(x, x_unit)
+        inside = (E >= lo) & (E <= hi) & np.isfinite(s)
+        idx = np.minimum(((E[inside] - lo) / (hi - lo) * n_bins).astype(int), n_bins - 1)
+        sums += np.bincount(idx, weights=s[inside], minlength=n_bins)
+        sums_sq += np.bincount(idx, weights=s[inside]**2, minlength=n_bins)
+        counts += np.bincount(idx, minlength=n_bins)
+
+    filled = counts > 0
+    centers = lo + (np.arange(n_bins) + 0.5) * (hi - lo) / n_bins
+    mean = sums[filled] / counts[filled]
+    var = np.maximum(sums_sq[filled] / counts[filled] - mean**2, 0.0)
+    sem = np.sqrt(var / np.maximum(counts[filled] - 1, 1))
+
+    # 单点箱没有箱内方差：用相邻差分的MAD估计噪声
+    noise = 1.4826 * np.median(np.abs(np.diff(mean))) / np.sqrt(2) if mean.size > 2 else 1.0
+    sem = np.where((counts[filled] > 1) & (sem > 0), sem, max(noise, 1e-12))
+    return centers[filled], mean, sem
+
+
+# ============ 多洛伦兹拟合 ============
+
+def multi_lorentzian(E: np.ndarray, params: np.ndarray, E_mid: float) -> np.ndarray:
+    """线性基线 + K个洛伦兹峰；params = [a, b, A₁, E₁, γ₁, ..., A_K, E_K, γ_K]"""
+    A, E0, gamma = params[2:].reshape(-1, 3).T
+    d = E[:, None] - E0[None, :]
+    return params[0] + params[1] * (E - E_mid) + np.sum(A * gamma**2 / (d**2 + gamma**2), axis=1)
+
+
+def multi_lorentzian_jacobian(E: np.ndarray, params: np.ndarray, E_mid: float) -> np.ndarray:
+    """多洛伦兹模型的解析雅可比 (N, 2+3K)，对所有峰同时向量化求值"""
+    A, E0, gamma = params[2:].reshape(-1, 3).T
+    d = E[:, None] - E0[None, :]
+    denom = d**2 + gamma**2
+    L = gamma**2 / denom
+    J = np.empty((len(E), len(params)))
+    J[:, 0] = 1.0
+    J[:, 1] = E - E_mid
+    J[:, 2::3] = L
+    J[:, 3::3] = A * 2 * d * gamma**2 / denom**2
+    J[:, 4::3] = A * 2 * gamma * d**2 / denom**2
+    return J
+
+
+def fit_peaks(E: np.ndarray, signal: np.ndarray, sigma: np.ndarray,
+              peak_idx: np.ndarray, widths_idx: Optional[np.ndarray] = None,
+              window_widths: float = 4.0) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    对检测到的峰做联合多洛伦兹拟合
+
+    widths_idx 为半高全宽（分箱数）初值，缺省时由 peak_widths 在 signal 上估计；
+    噪声较大时应传入平滑谱上的宽度。
+    返回 (参数 (K, 3) [A, E₀, γ], 参数标准误差 (K, 3))
+    """
+    if widths_idx is None:
+        widths_idx = peak_widths(signal, peak_idx, rel_height=0.5)[0]
+    dE = np.gradient(E)
+    gamma0 = np.maximum(0.5 * widths_idx * dE[peak_idx], dE[peak_idx])
+    E0 = E[peak_idx]
+
+    lo = E0.min() - window_widths * gamma0[np.argmin(E0)]
+    hi = E0.max() + window_widths * gamma0[np.argmax(E0)]
+    win = (E >= lo) & (E <= hi)
+    E_w, s_w, sig_w = E[win], signal[win], sigma[win]
+    E_mid = 0.5 * (lo + hi)
+
+    baseline = np.percentile(s_w, 5)
+    p0 = np.concatenate([[baseline, 0.0],
+                         np.column_stack([signal[peak_idx] - baseline, E0, gamma0]).ravel()])
+    lower = np.concatenate([[-np.inf, -np.inf],
+                            np.column_stack([np.zeros_like(E0), E0 - 3 * gamma0,
+                                             0.1 * gamma0]).ravel()])
+    upper = np.concatenate([[np.inf, np.inf],
+                            np.column_stack([np.full_like(E0, np.inf), E0 + 3 * gamma0,
+                                             10 * gamma0]).ravel()])
+    p0 = np.clip(p0, lower, upper)
+
+    result = least_squares(
+        lambda p: (multi_lorentzian(E_w, p, E_mid) - s_w) / sig_w, p0,
+        jac=lambda p: multi_lorentzian_jacobian(E_w, p, E_mid) / sig_w[:, None],
+        bounds=(lower, upper), x_scale='jac'
+    )
+
+    # 协方差按约化χ²缩放（分箱误差只是噪声的估计）
+    dof = max(len(E_w) - len(p0), 1)
+    chi2_red = 2 * result.cost / dof
+    cov = np.linalg.pinv(result.jac.T @ result.jac) * max(chi2_red, 1.0)
+    errors = np.sqrt(np.clip(np.diag(cov), 0, None))
+    return result.x[2:].reshape(-1, 3), errors[2:].reshape(-1, 3)
+
+
+def estimate_rydberg_series(n_levels: np.ndarray, energies: np.ndarray,
+                            energy_errors: np.ndarray) -> Tuple[float, float]:
+    """
+    由2D类氢公式 E_n = E_g - R*/(n - 1/2)² 线性加权最小二乘外推 (E_g, R*)
+    """
+    u = 1.0 / (n_levels - 0.5)**2
+    A = np.column_stack([np.ones_like(u), -u]) / energy_errors[:, None]
+    coeffs, *_ = np.linalg.lstsq(A, energies / energy_errors, rcond=None)
+    return float(coeffs[0]), float(coeffs[1])
+
+
+# ============ 主流程 ============
+
+def extract_exciton_series(path: str,
+                           kind: str = 'absorption',
+                           x_unit: str = 'eV',
+                           energy_range: Optional[Tuple[float, float]] = None,
+                           n_bins: int = 20000,
+                           max_levels: int = 7,
+                           min_prominence: float = 5.0,
+                           min_width_bins: float = 3.0,
+                           n_start: int = 1,
+                           band_gap: Optional[float] = None,
+                           chunk_rows: int = 1_000_000,
+                           columns: Tuple[int, int] = (0, 1)) -> ExcitonPeaks:
+    """
+    从原始光谱文件提取激子里德伯系列
+
+    Parameters:
+    -----------
+    kind : str
+        'absorption' / 'pl'（峰朝上）或 'reflectance'（共振表现为凹陷，取反后处理）
+    min_prominence : float
+        峰的最小显著度，以噪声标准差为单位
+    min_width_bins : float
+        峰的最小半高宽（分箱数），排除单箱噪声尖峰
+    n_start : int
+        能量最低峰对应的主量子数
+    band_gap : float, optional
+        若给出，丢弃高于带隙的峰
+    """
+    E, signal, sigma = bin_spectrum(path, n_bins, energy_range, x_unit, chunk_rows, columns)
+    order = np.argsort(E)
+    E, signal, sigma = E[order], signal[order], sigma[order]
+    if kind == 'reflectance':
+        signal = -signal
+    elif kind not in ('absorption', 'pl'):
+        raise ValueError(f"Unknown spectrum kind: {kind}")
+
+    # 检测在平滑后的谱上进行，拟合仍使用分箱数据
+    window = int(2 * (min_width_bins // 2) + 5)
+    smoothed = savgol_filter(signal, window, 3) if signal.size > window else signal
+    noise = np.median(sigma)
+    peak_idx, props = find_peaks(smoothed, prominence=min_prominence * noise,
+                                 width=min_width_bins)
+    if band_gap is not None:
+        keep = E[peak_idx] < band_gap
+        peak_idx = peak_idx[keep]
+        props = {k: v[keep] for k, v in props.items()}
+    if peak_idx.size == 0:
+        raise ValueError(f"{path}: 未检测到显著的激子峰")
+
+    # 保留最显著的 max_levels 个峰，再按能量排序
+    strongest = np.sort(np.argsort(props['prominences'])[::-1][:max_levels])
+    peak_idx = peak_idx[strongest]
+
+    params, errors = fit_peaks(E, signal, sigma, peak_idx, props['widths'][strongest])
+    order = np.argsort(params[:, 1])
+    params, errors = params[order], errors[order]
+    n_levels = np.arange(n_start, n_start + len(params))
+
+    peaks = ExcitonPeaks(
+        n_levels=n_levels,
+        energies=params[:, 1],
+        energy_errors=errors[:, 1],
+        widths=params[:, 2],
+        amplitudes=params[:, 0],
+        source=Path(path).name
+    )
+    if len(params) >= 2:
+        peaks.band_gap, peaks.rydberg = estimate_rydberg_series(
+            n_levels, peaks.energies, np.maximum(peaks.energy_errors, 1e-9))
+    if band_gap is not None:
+        peaks.band_gap = band_gap
+
+    logger.info(f"{peaks.source}: 提取 {len(params)} 个激子峰 "
+                f"{np.round(peaks.energies, 4).tolist()} eV")
+    return peaks
+
+
+if __name__ == "__main__":
+    import sys
+
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s')
+    if len(sys.argv) < 2:
+        sys.exit("用法: exciton_peak_extraction.py <spectrum.csv|.npy> [kind] [material] "
+                 "[E_g (eV)] [R* (meV)]")
+
+    peaks = extract_exciton_series(sys.argv[1], kind=sys.argv[2] if len(sys.argv) > 2 else 'absorption')
+    band_gap = float(sys.argv[4]) if len(sys.argv) > 4 else None
+    rydberg = float(sys.argv[5]) / 1000.0 if len(sys.argv) > 5 else None
+    data = peaks.to_exciton_data(sys.argv[3] if len(sys.argv) > 3 else Path(sys.argv[1]).stem,
+                                 band_gap, rydberg, use_extrapolated=True)
+    logger.info(f"E_g = {data.band_gap:.4f} eV, R* = {data.rydberg * 1000:.1f} meV")
+    logger.info(f"量子缺陷: {data.quantum_defect()}")
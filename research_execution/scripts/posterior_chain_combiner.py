@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""
+逐材料后验链的流式合并
+目标：跨材料分析不再把每个材料压缩成 c1_value ± c1_error，而是直接使用已保存的
+MCMC链（如 analyze_cu2o_with_bayesian 的结果），且不把所有链同时读入内存、不重跑采样
+
+流程（每条链以 .npy 保存，按块内存映射读取）：
+1. 第一遍：流式矩（Welford/Chan合并）和取值范围
+2. 第二遍：线性分箱计数 + FFT高斯核卷积得到 c₁ 边缘的分箱KDE；同时维护固定大小的蓄水池样本
+3. 乘积后验：在公共网格上对各材料的对数KDE求和
+4. 总体后验：用蓄水池样本对 (μ, τ) 网格做重要性重加权
+"""
+
+import json
+import numpy as np
+from scipy.special import logsumexp
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+CHAIN_INDEX = 'chains.json'
+
+
+# ============ 链的存储 ============
+
+def save_chain(directory, material: str, samples: np.ndarray,
+               param_names: Sequence[str] = ('delta0', 'n0', 'c1')) -> Path:
+    """把一条后验链保存为 .npy，并登记到目录索引"""
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    index_path = directory / CHAIN_INDEX
+    index = json.loads(index_path.read_text(encoding='utf-8')) if index_path.exists() else {}
+
+    filename = f"chain_{len(index):04d}.npy" if material not in index else index[material]['file']
+    np.save(directory / filename, np.asarray(samples, dtype=float))
+    index[material] = {'file': filename, 'param_names': list(param_names)}
+    index_path.write_text(json.dumps(index, indent=2, ensure_ascii=False), encoding='utf-8')
+    return directory / filename
+
+
+def iter_chain_column(path, column: int, chunk_size: int = 1_000_000):
+    """以内存映射按块读取链的一列"""
+    chain = np.load(path, mmap_mode='r')
+    for start in range(0, chain.shape[0], chunk_size):
+        yield np.asarray(chain[start:start + chunk_size, column], dtype=float)
+
+
+# ============ 单条链的流式摘要 ============
+
+@dataclass
+class ChainSummary:
+    """一条链中 c₁ 边缘的摘要"""
+    material: str
+    n: int
+    mean: float
+    std: float
+    grid: np.ndarray  # 公共网格
+    log_density: np.ndarray  # 网格上的对数KDE
+    reservoir: np.ndarray  # 均匀子样本
+
+
+def _streaming_moments(path, column, chunk_size) -> Tuple[int, float, float, float, float]:
+    """第一遍：计数、均值、M2、最小值、最大值（Chan合并）"""
+    n, mean, m2 = 0, 0.0, 0.0
+    lo, hi = np.inf, -np.inf
+    for x in iter_chain_column(path, column, chunk_size):
+        x = x[np.isfinite(x)]
+        if x.size == 0:
+            continue
+        nb, mb = x.size, x.mean()
+        m2b = np.sum((x - mb)**2)
+        delta = mb - mean
+        total = n + nb
+        m2 += m2b + delta**2 * n * nb / total
+        mean += delta * nb / total
+        n = total
+        lo, hi = min(lo, x.min()), max(hi, x.max())
+    return n, mean, m2, lo, hi
+
+
+def _linear_bin_counts(x: np.ndarray, grid: np.ndarray) -> np.ndarray:
+    """线性分箱：每个样本按距离分给相邻两个格点"""
+    step = grid[1] - grid[0]
+    pos = (x - grid[0]) / step
+    inside = (pos >= 0) & (pos <= len(grid) - 1)
+    pos = pos[inside]
+    left = np.minimum(pos.astype(int), len(grid) - 2)
+    frac = pos - left
+    counts = np.bincount(left, weights=1 - frac, minlength=len(grid))
+    counts += np.bincount(left + 1, weights=frac, minlength=len(grid))
+    return counts
+
+
+def _gaussian_smooth(counts: np.ndarray, step: float, bandwidth: float) -> np.ndarray:
+    """用FFT与高斯核做循环卷积（两侧补零避免回绕）"""
+    half = int(np.ceil(5 * bandwidth / step))
+    padded = np.concatenate([np.zeros(half), counts, np.zeros(half)])
+    offsets = np.arange(-half, half + 1) * step
+    kernel = np.exp(-0.5 * (offsets / bandwidth)**2)
+    size = len(padded) + len(kernel) - 1
+    conv = np.fft.irfft(np.fft.rfft(padded, size) * np.fft.rfft(kernel, size), size)
+    return conv[2 * half:2 * half + len(counts)]
+
+
+def summarize_chain(path, material: str, grid: np.ndarray, column: int = 2,
+                    reservoir_size: int = 2000, chunk_size: int = 1_000_000,
+                    moments: Optional[Tuple] = None,
+                    rng: Optional[np.random.Generator] = None) -> ChainSummary:
+    """
+    第二遍：在公共网格上做分箱KDE，并抽取蓄水池样本
+
+    KDE带宽用Silverman规则（基于第一遍的标准差）；蓄水池以随机优先级实现：
+    每块为样本生成均匀键，与现有蓄水池合并后保留键最小的 reservoir_size 个，
+    结果是全链的均匀无放回子样本。
+    """
+    rng = np.random.default_rng() if rng is None else rng
+    n, mean, m2, _, _ = _streaming_moments(path, column, chunk_size) if moments is None else moments
+    std = np.sqrt(m2 / max(n - 1, 1))
+    step = grid[1] - grid[0]
+    bandwidth = max(1.06 * std * n**(-0.2), step)
+
+    counts = np.zeros(len(grid))
+    res_values = np.empty(0)
+    res_keys = np.empty(0)
+    for x in iter_chain_column(path, column, chunk_size):
+        x = x[np.isfinite(x)]
+        counts += _linear_bin_counts(x, grid)
+
+        keys = rng.random(x.size)
+        res_values = np.concatenate([res_values, x])
+        res_keys = np.concatenate([res_keys, keys])
+        if res_values.size > reservoir_size:
+            keep = np.argpartition(res_keys, reservoir_size)[:reservoir_size]
+            res_values, res_keys = res_values[keep], res_keys[keep]
+
+    density = _gaussian_smooth(counts, step, bandwidth)
+    density /= np.sum(density) * step
+    with np.errstate(divide='ignore'):
+        log_density = np.log(np.maximum(density, 1e-300))
+    return ChainSummary(material, n, mean, std, grid, log_density, res_values)
+
+
+# ============ 合并 ============
+
+def _grid_stats(grid: np.ndarray, log_p: np.ndarray) -> Dict:
+    """网格上归一化后验的均值、标准差和95%区间"""
+    step = grid[1] - grid[0]
+    p = np.exp(log_p - logsumexp(log_p))
+    mean = np.sum(p * grid)
+    cdf = np.cumsum(p)
+    return {
+        'mean': float(mean),
+        'std': float(np.sqrt(np.sum(p * (grid - mean)**2))),
+        '95CI': [float(np.interp(0.025, cdf, grid)), float(np.interp(0.975, cdf, grid))],
+        'density': (p / step).tolist(),
+    }
+
+
+def combine_chains(directory, column: str = 'c1', n_grid: int = 2048,
+                   reservoir_size: int = 2000,
+                   mu_grid: Optional[np.ndarray] = None,
+                   tau_grid: Optional[np.ndarray] = None,
+                   prior_range: Optional[Tuple[float, float]] = None,
+                   chunk_size: int = 1_000_000, seed: Optional[int] = None) -> Dict:
+    """
+    合并目录中的所有链，给出 c₁ 的乘积后验与总体 (μ, τ) 后验
+
+    乘积后验（所有材料共享同一个 c₁）：
+        log p(c₁ | 全部数据) = Σᵢ log p̂ᵢ(c₁) + 常数
+    各链使用相同的平坦先验时先验项只是常数；否则可给出 prior_range 截断。
+
+    总体后验（c₁,ᵢ ~ N(μ, τ²)，平坦先验）按重要性重加权：
+        p(μ, τ | 数据) ∝ Πᵢ (1/S) Σ_s N(θᵢₛ | μ, τ²)
+    其中 θᵢₛ 为材料 i 的蓄水池样本（原后验在平坦先验下即为似然的抽样）。
+    同时给出每个材料在总体后验众数 (μ̂, τ̂) 处的有效样本量作为诊断。
+    """
+    directory = Path(directory)
+    index = json.loads((directory / CHAIN_INDEX).read_text(encoding='utf-8'))
+    rng = np.random.default_rng(seed)
+
+    # 第一遍：每条链的矩和范围，确定公共网格
+    first_pass = {}
+    for material, entry in index.items():
+        col = entry['param_names'].index(column)
+        first_pass[material] = (col, _streaming_moments(directory / entry['file'], col, chunk_size))
+    lo = min(m[3] for _, m in first_pass.values())
+    hi = max(m[4] for _, m in first_pass.values())
+    if prior_range is not None:
+        lo, hi = max(lo, prior_range[0]), min(hi, prior_range[1])
+    pad = 0.1 * (hi - lo)
+    grid = np.linspace(lo - pad, hi + pad, n_grid)
+
+    # 第二遍：逐链KDE与蓄水池，任何时刻只有一个块在内存中
+    summaries: List[ChainSummary] = []
+    for material, entry in index.items():
+        col, moments = first_pass[material]
+        summaries.append(summarize_chain(directory / entry['file'], material, grid, col,
+                                         reservoir_size, chunk_size, moments, rng))
+
+    # 乘积后验
+    log_product = np.sum([s.log_density for s in summaries], axis=0)
+    product = _grid_stats(grid, log_product)
+    product['grid'] = grid.tolist()
+
+    # 总体后验：(μ, τ) 网格 × 材料 × 蓄水池样本
+    if mu_grid is None:
+        mu_grid = np.linspace(grid[0], grid[-1], 201)
+    if tau_grid is None:
+        spread = max(np.std([s.mean for s in summaries]), np.mean([s.std for s in summaries]))
+        tau_grid = np.linspace(0, 5 * spread, 101)[1:]
+    mu_grid, tau_grid = np.asarray(mu_grid, float), np.asarray(tau_grid, float)
+
+    # 逐个 τ 切片累加，峰值内存为 (μ 网格 × 蓄水池) 而非三维数组
+    log_post = np.zeros((len(mu_grid), len(tau_grid)))
+    for s in summaries:
+        theta = s.reservoir
+        for j, tau in enumerate(tau_grid):
+            z = (theta[None, :] - mu_grid[:, None]) / tau
+            log_post[:, j] += logsumexp(-0.5 * z**2, axis=-1) - np.log(tau) - np.log(theta.size)
+
+    # 在总体后验众数 (μ̂, τ̂) 处的重要性权重有效样本量
+    i_mode, j_mode = np.unravel_index(np.argmax(log_post), log_post.shape)
+    mu_hat, tau_hat = mu_grid[i_mode], tau_grid[j_mode]
+    ess = []
+    for s in summaries:
+        w = np.exp(-0.5 * ((s.reservoir - mu_hat) / tau_hat)**2)
+        ess.append(float(w.sum()**2 / np.sum(w**2)) if w.sum() > 0 else 0.0)
+
+    log_mu = logsumexp(log_post, axis=1)
+    log_tau = logsumexp(log_post, axis=0)
+    population = {
+        'mu': _grid_stats(mu_grid, log_mu),
+        'tau': _grid_stats(tau_grid, log_tau),
+        'mu_grid': mu_grid.tolist(),
+        'tau_grid': tau_grid.tolist(),
+        'mode': {'mu': float(mu_hat), 'tau': float(tau_hat)},
+    }
+
+    return {
+        'materials': [s.material for s in summaries],
+        'per_material': {s.material: {'n_samples': s.n, 'mean': float(s.mean), 'std': float(s.std)}
+                         for s in summaries},
+        'product_posterior': product,
+        'population_posterior': population,
+        'importance_ess': dict(zip([s.material for s in summaries], ess)),
+    }
+
+
+if __name__ == "__main__":
+    import sys
+
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s')
+    if len(sys.argv) < 2:
+        print("用法: python posterior_chain_combiner.py <链目录>")
+        sys.exit(1)
+
+    results = combine_chains(sys.argv[1])
+    for material, s in results['per_material'].items():
+        logger.info(f"  {material:<14} c₁ = {s['mean']:.4f} ± {s['std']:.4f} ({s['n_samples']} 样本)")
+    prod = results['product_posterior']
+    pop = results['population_posterior']
+    logger.info(f"乘积后验: c₁ = {prod['mean']:.4f} ± {prod['std']:.4f}, "
+                f"95% CI [{prod['95CI'][0]:.4f}, {prod['95CI'][1]:.4f}]")
+    logger.info(f"总体后验: μ = {pop['mu']['mean']:.4f} ± {pop['mu']['std']:.4f}, "
+                f"τ = {pop['tau']['mean']:.4f}")
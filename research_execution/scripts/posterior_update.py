@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+"""
+数据小幅改动时的后验重要性重加权更新
+目标：增加或修正一个激子能级时，不重跑8000步MCMC和嵌套采样，而是用新旧似然比
+对已保存的后验样本重加权；只有有效样本量 (ESS) 过低时才做短程SMC回春
+
+    wₛ ∝ exp(log L_new(θₛ) - log L_old(θₛ))      （先验相同时先验项抵消）
+
+ESS低于阈值时：自适应回火 β: 0 → 1，每一级选择使增量权重 ESS 恰为阈值的 β，
+系统重采样后做几步向量化随机游走MH（目标 log π + log L_old + β Δ）。
+"""
+
+import numpy as np
+from scipy.special import logsumexp
+from typing import Callable, Dict, Optional, Union
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+# ============ 加权统计 ============
+
+def effective_sample_size(log_weights: np.ndarray) -> float:
+    """Kish有效样本量 (Σw)²/Σw²"""
+    w = np.exp(log_weights - logsumexp(log_weights))
+    return float(1.0 / np.sum(w**2))
+
+
+def weighted_quantile(samples: np.ndarray, weights: np.ndarray, q) -> np.ndarray:
+    """逐列加权分位数，返回 (len(q), ndim)"""
+    q = np.atleast_1d(q)
+    order = np.argsort(samples, axis=0)
+    sorted_samples = np.take_along_axis(samples, order, axis=0)
+    cdf = np.cumsum(weights[order], axis=0)
+    cdf = (cdf - 0.5 * weights[order]) / cdf[-1]
+    return np.array([[np.interp(qi, cdf[:, j], sorted_samples[:, j])
+                      for j in range(samples.shape[1])] for qi in q])
+
+
+def weighted_statistics(samples: np.ndarray, weights: Optional[np.ndarray] = None) -> Dict:
+    """与 MCMCSampler.get_statistics() 相同格式的（加权）统计量"""
+    samples = np.atleast_2d(samples)
+    if weights is None:
+        weights = np.full(len(samples), 1.0 / len(samples))
+    weights = weights / weights.sum()
+    mean = weights @ samples
+    # 所有分位数共用一次排序
+    q = weighted_quantile(samples, weights, [0.5, 0.16, 0.84, 0.025, 0.975])
+    return {
+        'mean': mean,
+        'std': np.sqrt(weights @ (samples - mean)**2),
+        'median': q[0],
+        'percentiles_16_84': q[1:3],
+        'percentiles_2.5_97.5': q[3:5]
+    }
+
+
+def systematic_resample(weights: np.ndarray, n: int, rng: np.random.Generator) -> np.ndarray:
+    """系统重采样，返回索引"""
+    positions = (rng.random() + np.arange(n)) / n
+    cdf = np.cumsum(weights)
+    cdf[-1] = 1.0
+    return np.searchsorted(cdf, positions)
+
+
+# ============ 更新 ============
+
+def edit_log_likelihood_ratio(n_old, delta_old, err_old, n_new, delta_new, err_new,
+                              model_func) -> Callable:
+    """
+    数据编辑的批量对数似然比 log L_new - log L_old
+
+    误差独立时未改动的能级在比值中完全抵消，模型只需在被增加、删除或修改的
+    能级上求值——单个能级的编辑与数据集大小无关。
+    """
+    old = {float(n): (float(d), float(e)) for n, d, e in zip(n_old, delta_old, err_old)}
+    new = {float(n): (float(d), float(e)) for n, d, e in zip(n_new, delta_new, err_new)}
+    changed = sorted(n for n in set(old) | set(new) if old.get(n) != new.get(n))
+
+    def terms(table):
+        levels = [n for n in changed if n in table]
+        return (np.array(levels), np.array([table[n][0] for n in levels]),
+                np.array([table[n][1] for n in levels]))
+
+    n_o, d_o, e_o = terms(old)
+    n_n, d_n, e_n = terms(new)
+
+    def chi2(n, d, e, params):
+        if n.size == 0:
+            return np.zeros(len(params))
+        pred = model_func(n, np.asarray(params).T[..., None])
+        return np.sum(((d - pred) / e)**2, axis=-1)
+
+    def log_ratio(params):
+        return -0.5 * (chi2(n_n, d_n, e_n, params) - chi2(n_o, d_o, e_o, params))
+
+    return log_ratio
+
+
+def _next_beta(delta: np.ndarray, beta: float, target_ess: float) -> float:
+    """二分求下一个回火系数，使增量权重 exp((β' - β)Δ) 的 ESS 等于 target_ess"""
+    if effective_sample_size((1.0 - beta) * delta) >= target_ess:
+        return 1.0
+    lo, hi = beta, 1.0
+    for _ in range(50):
+        mid = 0.5 * (lo + hi)
+        if effective_sample_size((mid - beta) * delta) >= target_ess:
+            lo = mid
+        else:
+            hi = mid
+    return max(lo, beta + 1e-6)
+
+
+def update_posterior(samples: np.ndarray,
+                     log_like_old: Union[Callable, np.ndarray],
+                     log_like_new: Callable,
+                     log_prior: Optional[Callable] = None,
+                     ess_threshold: float = 0.5,
+                     max_particles: int = 4000,
+                     n_rejuvenate: int = 10,
+                     log_ratio: Optional[Callable] = None,
+                     rng: Optional[np.random.Generator] = None) -> Dict:
+    """
+    用新旧似然比更新已有后验样本
+
+    Parameters:
+    -----------
+    samples : array (S, ndim)
+        旧数据下的后验样本（如 MCMCSampler.run_mcmc 的返回值）
+    log_like_old : callable 或 array
+        旧对数似然（批量函数，create_log_likelihood(..., vectorized=True)），
+        或已保存的每个样本的旧对数似然值
+    log_like_new : callable
+        新数据的批量对数似然
+    log_prior : callable, optional
+        批量对数先验；仅回春步骤需要，缺省时视为平坦
+    ess_threshold : float
+        ESS/S 低于该值时回火 + 回春
+    log_ratio : callable, optional
+        直接给出批量对数似然比（如 edit_log_likelihood_ratio），
+        ESS足够时无需在全部能级上求新旧似然
+
+    返回 get_statistics() 格式的统计量，另含 'ess'、'ess_fraction'、'rejuvenated'、
+    'n_stages' 以及（加权）样本 'samples'、'weights'。
+    """
+    rng = np.random.default_rng() if rng is None else rng
+    samples = np.atleast_2d(np.asarray(samples, dtype=float))
+    if log_ratio is not None:
+        delta = log_ratio(samples)
+        delta = np.where(np.isnan(delta), -np.inf, delta)
+    else:
+        old = log_like_old(samples) if callable(log_like_old) else np.asarray(log_like_old, dtype=float)
+        new = log_like_new(samples)
+        delta = np.where(np.isfinite(new), new - old, -np.inf)
+
+    ess = effective_sample_size(delta)
+    if ess >= ess_threshold * len(samples):
+        weights = np.exp(delta - logsumexp(delta))
+        result = weighted_statistics(samples, weights)
+        result.update({'ess': ess, 'ess_fraction': ess / len(samples), 'rejuvenated': False,
+                       'n_stages': 0, 'samples': samples, 'weights': weights})
+        return result
+
+    logger.info(f"ESS = {ess:.0f} / {len(samples)}，回火并回春")
+    log_prior = (lambda x: np.zeros(len(x))) if log_prior is None else log_prior
+
+    # 先均匀抽取至多 max_particles 个粒子
+    idx = (rng.choice(len(samples), max_particles, replace=False)
+           if len(samples) > max_particles else np.arange(len(samples)))
+    particles = samples[idx].copy()
+    if log_ratio is not None:
+        old = log_like_old(particles) if callable(log_like_old) else np.asarray(log_like_old)[idx]
+        new = log_like_new(particles)
+    else:
+        old, new = old[idx], new[idx]
+    delta = np.where(np.isfinite(new), new - old, -np.inf)
+    N, ndim = particles.shape
+    target_ess = min(ess_threshold, 0.99) * N
+
+    # 只有旧似然的数值时无法在新位置求旧似然：直接一级到 β=1
+    can_temper = callable(log_like_old)
+    beta, n_stages = 0.0, 0
+    while beta < 1.0:
+        beta_next = _next_beta(delta, beta, target_ess) if can_temper else 1.0
+        log_w = (beta_next - beta) * delta
+        beta = beta_next
+        n_stages += 1
+
+        w = np.exp(log_w - logsumexp(log_w))
+        cov = np.atleast_2d(np.cov(particles.T, aweights=w)) * 2.38**2 / ndim
+        idx = systematic_resample(w, N, rng)
+        particles, old, new = particles[idx], old[idx], new[idx]
+        if not can_temper:
+            old = np.zeros(N)
+        chol = np.linalg.cholesky(cov + 1e-12 * np.eye(ndim))
+
+        # 目标 log π + (1 - β) log L_old + β log L_new 下的随机游走MH
+        current = log_prior(particles) + (1 - beta) * old + beta * new
+        for _ in range(n_rejuvenate):
+            proposal = particles + rng.standard_normal((N, ndim)) @ chol.T
+            lp = log_prior(proposal)
+            inside = np.isfinite(lp)
+            prop_old = np.zeros(N)
+            prop_new = np.zeros(N)
+            if inside.any():
+                if can_temper:
+                    prop_old[inside] = log_like_old(proposal[inside])
+                prop_new[inside] = log_like_new(proposal[inside])
+            target = np.where(inside, lp + (1 - beta) * prop_old + beta * prop_new, -np.inf)
+            target = np.where(np.isnan(target), -np.inf, target)
+            accept = np.log(rng.random(N)) < target - current
+            particles[accept] = proposal[accept]
+            old[accept], new[accept] = prop_old[accept], prop_new[accept]
+            current[accept] = target[accept]
+        delta = np.where(np.isfinite(new), new - old, -np.inf)
+
+    weights = np.full(N, 1.0 / N)
+    result = weighted_statistics(particles, weights)
+    result.update({'ess': ess, 'ess_fraction': ess / len(samples), 'rejuvenated': True,
+                   'n_stages': n_stages, 'samples': particles, 'weights': weights})
+    return result
+
+
+if __name__ == "__main__":
+    import time
+    from bayesian_evidence_mcmc import (MCMCSampler, create_log_likelihood,
+                                        create_log_prior, dimflow_model)
+
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s')
+    rng = np.random.default_rng(0)
+    bounds = [(0.01, 1.0), (1.0, 20.0), (0.1, 2.0)]
+    n_data = np.arange(3, 26)
+    delta_data = dimflow_model(n_data, (0.23, 10.0, 0.516))
+    delta_err = np.full(len(n_data), 0.01)
+
+    log_prior = create_log_prior(bounds, vectorized=True)
+    old_like = create_log_likelihood(n_data, delta_data, delta_err, dimflow_model, vectorized=True)
+    sampler = MCMCSampler(old_like, log_prior, ndim=3, nwalkers=50, vectorized=True, rng=rng)
+    samples = sampler.run_mcmc(nsteps=8000, burn_in=2000,
+                               initial_pos=np.array([0.23, 10.0, 0.516]) + rng.standard_normal((50, 3)) * 0.05)
+
+    # 修正一个能级 / 增加一个能级
+    for label, n_new, d_new in [
+        ('修正 n=5', n_data, np.where(n_data == 5, delta_data + 0.02, delta_data)),
+        ('增加 n=26', np.append(n_data, 26), np.append(delta_data, dimflow_model(26, (0.23, 10.0, 0.516)))),
+    ]:
+        new_like = create_log_likelihood(n_new, d_new, np.full(len(n_new), 0.01),
+                                         dimflow_model, vectorized=True)
+        ratio = edit_log_likelihood_ratio(n_data, delta_data, delta_err,
+                                          n_new, d_new, np.full(len(n_new), 0.01), dimflow_model)
+        start = time.perf_counter()
+        result = update_posterior(samples, old_like, new_like, log_prior, log_ratio=ratio, rng=rng)
+        logger.info(f"{label}: {time.perf_counter() - start:.3f} s, ESS比例 {result['ess_fraction']:.2f}, "
+                    f"回春={result['rejuvenated']}, c₁ = {result['mean'][2]:.4f} ± {result['std'][2]:.4f}")
@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+"""
+基于模拟的校准 (Simulation-Based Calibration, SBC)
+目标：检验 c₁ 推断流水线（curve_fit / MCMCSampler / nested_sampling_evidence）
+在小n光谱上是否有偏、区间覆盖率是否正确
+
+流程：θ ~ 先验 → 用 dimflow_defect_2d_free 模拟数据 → 各方法给出后验样本
+→ 统计真值在后验样本中的秩。校准良好时秩服从均匀分布。
+秩检验假设后验样本近似独立，因此每种方法同时报告样本的有效样本量 (ESS)。
+"""
+
+import os
+import numpy as np
+import warnings
+from scipy.optimize import curve_fit
+from scipy.special import logsumexp
+from scipy.stats import chisquare
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, Optional, Tuple
+import logging
+
+from bayesian_evidence_mcmc import (MCMCSampler, create_log_likelihood,
+                                    create_log_prior, dimflow_model,
+                                    integrated_autocorr_time, nested_sampling_evidence)
+from tmdc_phase2_analysis import dimflow_defect_2d_free
+
+logger = logging.getLogger(__name__)
+
+# 与 fit_all_models 中自由c₁拟合相同的先验/边界
+SBC_BOUNDS = [(0.01, 1.0), (0.5, 10.0), (0.1, 2.0)]
+PARAM_NAMES = ['delta0', 'n0', 'c1']
+
+
+@dataclass
+class SBCConfig:
+    """SBC设置"""
+    n_values: np.ndarray = field(default_factory=lambda: np.arange(1, 8))
+    delta_err: float = 0.01  # 量子缺陷的测量误差
+    n_draws: int = 99  # 每次重复用于计算秩的后验样本数 L
+    methods: Tuple[str, ...] = ('fit', 'mcmc')
+    mcmc_walkers: int = 32
+    mcmc_steps: int = 1500
+    mcmc_burn_in: int = 500
+    mcmc_max_steps: int = 20000  # 独立样本不足时延长链的总步数上限
+    nested_live: int = 50
+    nested_steps: int = 1000
+    coverage_levels: Tuple[float, ...] = (0.5, 0.9)
+
+
+# ============ 各推断方法的后验样本 ============
+
+def _fit_free(n, delta, err):
+    """与 fit_all_models 相同设置的自由c₁拟合"""
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        try:
+            return curve_fit(
+                dimflow_defect_2d_free, n, delta,
+                sigma=err, absolute_sigma=True,
+                p0=[0.3, 3.0, 1.0],
+                bounds=([0.01, 0.5, 0.1], [1.0, 10.0, 2.0])
+            )
+        except (RuntimeError, ValueError):
+            return None, None
+
+
+def posterior_draws_fit(n, delta, err, fit, config, rng):
+    """curve_fit：以 N(popt, pcov) 作为近似后验（独立抽样，ESS = L）"""
+    popt, pcov = fit
+    ess = np.full(3, float(config.n_draws))
+    if popt is None or not np.all(np.isfinite(pcov)):
+        return np.full((config.n_draws, 3), np.nan), ess
+    return rng.multivariate_normal(popt, pcov, size=config.n_draws,
+                                   check_valid='ignore'), ess
+
+
+def posterior_draws_mcmc(n, delta, err, fit, config, rng):
+    """
+    MCMCSampler（向量化似然），从拟合最优点附近出发，按自相关时间抽稀
+
+    随机游走链的相邻样本高度相关，等间隔抽稀会使秩直方图有偏。
+    这里估计积分自相关时间 τ（取各参数最大值），每个walker只在间隔 ≥ τ 的
+    步上取样本，再从中无放回抽取 L 个；不够时以 mcmc_steps 为单位延长链，
+    直到 mcmc_max_steps，仍不够则返回NaN（计为失败）。
+    返回 (样本, 每个参数的ESS = 步数·walker数/τ)。
+    """
+    log_like = create_log_likelihood(n, delta, err, dimflow_model, vectorized=True)
+    log_prior = create_log_prior(SBC_BOUNDS, vectorized=True)
+    low, high = np.array(SBC_BOUNDS).T
+
+    popt, _ = fit
+    start = rng.uniform(low, high) if popt is None else popt
+    initial_pos = np.clip(start + rng.standard_normal((config.mcmc_walkers, 3)) * 0.05,
+                          low, high)
+
+    sampler = MCMCSampler(log_like, log_prior, ndim=3, nwalkers=config.mcmc_walkers,
+                          vectorized=True, rng=rng)
+    samples = sampler.run_mcmc(nsteps=config.mcmc_steps, burn_in=config.mcmc_burn_in,
+                               initial_pos=initial_pos)
+    chain = samples.reshape(-1, config.mcmc_walkers, 3)
+    while True:
+        tau = integrated_autocorr_time(chain)
+        steps = np.arange(chain.shape[0] - 1, -1, -int(np.ceil(np.max(tau))))
+        if (steps.size * config.mcmc_walkers >= config.n_draws
+                or config.mcmc_burn_in + chain.shape[0] >= config.mcmc_max_steps):
+            break
+        more = sampler.run_mcmc(nsteps=config.mcmc_steps, burn_in=0, initial_pos=chain[-1])
+        chain = np.concatenate([chain, more.reshape(-1, config.mcmc_walkers, 3)])
+
+    ess = chain.shape[0] * config.mcmc_walkers / tau
+    pool = chain[steps].reshape(-1, 3)
+    if len(pool) < config.n_draws:
+        return np.full((config.n_draws, 3), np.nan), ess
+    return pool[rng.choice(len(pool), size=config.n_draws, replace=False)], ess
+
+
+def posterior_draws_nested(n, delta, err, fit, config, rng):
+    """嵌套采样：按后验权重对死点重采样（ESS 取权重的 Kish 有效样本量）"""
+    log_like = create_log_likelihood(n, delta, err, dimflow_model)
+    log_prior = create_log_prior(SBC_BOUNDS)
+    _, samples = nested_sampling_evidence(log_like, log_prior, 3, SBC_BOUNDS,
+                                          nlive=config.nested_live,
+                                          nsteps=config.nested_steps, rng=rng)
+    log_w = samples[:, -1]
+    weights = np.exp(log_w - logsumexp(log_w))
+    idx = rng.choice(len(samples), size=config.n_draws, p=weights / weights.sum())
+    ess = np.full(3, weights.sum()**2 / np.sum(weights**2))
+    return samples[idx, :3], ess
+
+
+POSTERIOR_METHODS = {
+    'fit': posterior_draws_fit,
+    'mcmc': posterior_draws_mcmc,
+    'nested': posterior_draws_nested,
+}
+
+
+# ============ 单次重复 ============
+
+def run_replicate(seed: np.random.SeedSequence, config: SBCConfig) -> Dict[str, np.ndarray]:
+    """一次SBC重复：先验抽样 → 模拟 → 各方法后验样本及其ESS"""
+    rng = np.random.default_rng(seed)
+    low, high = np.array(SBC_BOUNDS).T
+    theta = rng.uniform(low, high)
+
+    n = np.asarray(config.n_values, dtype=float)
+    err = np.full(len(n), config.delta_err)
+    delta = dimflow_defect_2d_free(n, *theta) + rng.standard_normal(len(n)) * err
+
+    # 拟合只做一次，curve_fit近似后验与MCMC初始化共用
+    fit = _fit_free(n, delta, err)
+    out = {'theta': theta}
+    for method in config.methods:
+        out[method], out[method + '_ess'] = POSTERIOR_METHODS[method](n, delta, err, fit,
+                                                                      config, rng)
+    return out
+
+
+# ============ 汇总统计 ============
+
+def summarize_sbc(theta: np.ndarray, draws: np.ndarray,
+                  coverage_levels=(0.5, 0.9), n_bins: int = 10,
+                  ess: Optional[np.ndarray] = None) -> Dict:
+    """
+    汇总一种方法的SBC结果
+
+    theta : (R, 3) 真值；draws : (R, L, 3) 后验样本；ess : (R, 3) 可选
+    返回每个参数的秩直方图、均匀性χ²检验、各置信水平覆盖率和偏差，
+    给出 ess 时同时报告其中位数和最小值（远小于 L 时秩检验不可信）
+    """
+    valid = ~np.isnan(draws).any(axis=(1, 2))
+    theta, draws = theta[valid], draws[valid]
+    ess = None if ess is None else np.asarray(ess, dtype=float)[valid]
+    R, L, _ = draws.shape
+    summary = {'n_replicates': int(R), 'n_failed': int((~valid).sum())}
+    if R == 0:
+        return summary
+
+    ranks = np.sum(draws < theta[:, None, :], axis=1)  # (R, 3)
+    post_mean = draws.mean(axis=1)
+    post_std = draws.std(axis=1, ddof=1)
+
+    for k, name in enumerate(PARAM_NAMES):
+        hist = np.bincount(ranks[:, k] * n_bins // (L + 1), minlength=n_bins)
+        entry = {
+            'rank_histogram': hist.tolist(),
+            'rank_uniformity_pvalue': float(chisquare(hist).pvalue),
+            'bias': float(np.mean(post_mean[:, k] - theta[:, k])),
+            'rmse': float(np.sqrt(np.mean((post_mean[:, k] - theta[:, k])**2))),
+            'mean_z': float(np.mean((post_mean[:, k] - theta[:, k])
+                                    / np.where(post_std[:, k] > 0, post_std[:, k], np.nan))),
+            'coverage': {},
+        }
+        if ess is not None:
+            entry['ess_median'] = float(np.median(ess[:, k]))
+            entry['ess_min'] = float(np.min(ess[:, k]))
+        for level in coverage_levels:
+            lo, hi = np.quantile(draws[:, :, k], [(1 - level) / 2, (1 + level) / 2], axis=1)
+            covered = (theta[:, k] >= lo) & (theta[:, k] <= hi)
+            entry['coverage'][level] = float(covered.mean())
+        summary[name] = entry
+    return summary
+
+
+def run_sbc(n_replicates: int = 1000, config: Optional[SBCConfig] = None,
+            seed: Optional[int] = None, n_workers: Optional[int] = None) -> Dict:
+    """
+    运行SBC：每次重复使用 SeedSequence.spawn 派生的独立流，
+    在进程池中并行，结果与 n_workers 无关。
+    """
+    config = SBCConfig() if config is None else config
+    # 数千次采样的进度日志没有意义
+    logging.getLogger('bayesian_evidence_mcmc').setLevel(logging.ERROR)
+
+    seeds = np.random.SeedSequence(seed).spawn(n_replicates)
+    if n_workers == 1:
+        replicates = [run_replicate(s, config) for s in seeds]
+    else:
+        with ProcessPoolExecutor(max_workers=n_workers) as pool:
+            chunksize = max(1, n_replicates // (16 * (n_workers or os.cpu_count() or 1)))
+            replicates = list(pool.map(run_replicate, seeds,
+                                       [config] * n_replicates, chunksize=chunksize))
+
+    theta = np.array([r['theta'] for r in replicates])
+    results = {'config': config, 'theta': theta, 'methods': {}}
+    for method in config.methods:
+        draws = np.array([r[method] for r in replicates])
+        ess = np.array([r[method + '_ess'] for r in replicates])
+        results['methods'][method] = summarize_sbc(theta, draws, config.coverage_levels,
+                                                   ess=ess)
+    return results
+
+
+if __name__ == "__main__":
+    import sys
+    import time
+
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s')
+    n_rep = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+
+    start = time.perf_counter()
+    results = run_sbc(n_rep, seed=2024)
+    logger.info(f"SBC: {n_rep} 次重复, 用时 {time.perf_counter() - start:.1f} s")
+
+    for method, summary in results['methods'].items():
+        logger.info(f"\n方法 {method} (失败 {summary['n_failed']}):")
+        for name in PARAM_NAMES:
+            if name not in summary:
+                continue
+            s = summary[name]
+            cov = ", ".join(f"{int(100 * lv)}%: {c:.2f}" for lv, c in s['coverage'].items())
+            logger.info(f"  {name:<7} bias={s['bias']:+.4f}  rmse={s['rmse']:.4f}  "
+                        f"覆盖率 [{cov}]  秩均匀性 p={s['rank_uniformity_pvalue']:.3f}  "
+                        f"ESS 中位数={s['ess_median']:.0f} (最小 {s['ess_min']:.0f})")
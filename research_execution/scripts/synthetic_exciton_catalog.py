@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+大规模合成激子光谱目录生成器
+目标：按固定大小的块流式生成数百万条合成激子能级序列并写入磁盘，
+为拟合与贝叶斯流水线提供端到端的吞吐量基准与校准负载
+"""
+
+import numpy as np
+import json
+from pathlib import Path
+from dataclasses import dataclass, asdict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
+import logging
+
+from tmdc_phase2_analysis import TMDCData
+
+logger = logging.getLogger(__name__)
+
+# 分布规格: (名称, 参数...)
+#   ('fixed', v) | ('uniform', lo, hi) | ('loguniform', lo, hi)
+#   ('normal', mu, sd) | ('integers', lo, hi)  (hi 包含在内)
+Distribution = Tuple
+
+
+@dataclass
+class CatalogConfig:
+    """合成目录的参数分布"""
+    band_gap: Distribution = ('uniform', 1.5, 2.3)  # eV
+    binding_energy: Distribution = ('uniform', 150.0, 500.0)  # meV
+    n_max: Distribution = ('integers', 3, 7)  # 最高主量子数，n从1开始
+    noise_level: Distribution = ('loguniform', 0.001, 0.01)  # eV
+    c1_true: Distribution = ('uniform', 0.3, 1.5)
+    delta0: Distribution = ('uniform', 0.05, 0.45)
+    n0: Distribution = ('uniform', 1.0, 6.0)
+    reduced_mass: float = 0.28  # m₀
+    dielectric_constant: float = 6.5
+
+    @property
+    def max_levels(self) -> int:
+        """填充后数组的列数"""
+        kind, *args = self.n_max
+        return int(args[-1])
+
+
+def _draw(rng: np.random.Generator, spec: Distribution, size: int) -> np.ndarray:
+    """按分布规格抽样"""
+    kind, *args = spec
+    if kind == 'fixed':
+        return np.full(size, args[0], dtype=float)
+    if kind == 'uniform':
+        return rng.uniform(args[0], args[1], size)
+    if kind == 'loguniform':
+        return np.exp(rng.uniform(np.log(args[0]), np.log(args[1]), size))
+    if kind == 'normal':
+        return rng.normal(args[0], args[1], size)
+    if kind == 'integers':
+        return rng.integers(args[0], args[1] + 1, size)
+    raise ValueError(f"Unknown distribution: {kind}")
+
+
+# ============ 块生成 ============
+
+def generate_chunk(size: int, config: CatalogConfig,
+                   seed: np.random.SeedSequence) -> Dict[str, np.ndarray]:
+    """
+    生成一个块的合成光谱
+
+    返回列式字典：标量列形状 (size,)，能级列为填充到 max_levels 的 (size, max_levels)，
+    mask 标记有效能级。能级公式与 generate_synthetic_tmdc_data 相同：
+    E_n = E_g - R*/(n - 1/2 - δ(n))²，δ(n) = δ₀ n₀^c₁ / (n^c₁ + n₀^c₁)
+    """
+    rng = np.random.default_rng(seed)
+
+    band_gap = _draw(rng, config.band_gap, size)
+    binding_energy = _draw(rng, config.binding_energy, size)
+    n_max = _draw(rng, config.n_max, size).astype(int)
+    noise = _draw(rng, config.noise_level, size)
+    c1 = _draw(rng, config.c1_true, size)
+    delta0 = _draw(rng, config.delta0, size)
+    n0 = _draw(rng, config.n0, size)
+
+    n_values = np.arange(1, config.max_levels + 1, dtype=float)[None, :]
+    mask = n_values <= n_max[:, None]
+
+    delta = delta0[:, None] * n0[:, None]**c1[:, None] / (
+        n_values**c1[:, None] + n0[:, None]**c1[:, None])
+    R_star = binding_energy[:, None] / 1000.0
+    energies = band_gap[:, None] - R_star / (n_values - 0.5 - delta)**2
+    energies = energies + rng.normal(size=energies.shape) * noise[:, None]
+
+    return {
+        'band_gap': band_gap,
+        'binding_energy_1s': binding_energy,
+        'noise_level': noise,
+        'c1_true': c1,
+        'delta0_true': delta0,
+        'n0_true': n0,
+        'n_values': np.broadcast_to(n_values, mask.shape).astype(np.int16),
+        'energies': np.where(mask, energies, np.nan),
+        'energy_errors': np.where(mask, noise[:, None], np.nan),
+        'mask': mask,
+    }
+
+
+def iter_catalog_chunks(n_spectra: int, chunk_size: int = 100_000,
+                        config: Optional[CatalogConfig] = None,
+                        seed: Optional[int] = None) -> Iterator[Dict[str, np.ndarray]]:
+    """
+    流式生成目录：每块使用 SeedSequence(seed).spawn 派生的独立 Generator，
+    因此任一块都可单独重现，且与生成顺序和并行度无关。
+    """
+    config = CatalogConfig() if config is None else config
+    n_chunks = -(-n_spectra // chunk_size)
+    seeds = np.random.SeedSequence(seed).spawn(n_chunks)
+    for k, s in enumerate(seeds):
+        size = min(chunk_size, n_spectra - k * chunk_size)
+        yield generate_chunk(size, config, s)
+
+
+def chunk_to_tmdc_data(chunk: Dict[str, np.ndarray], config: Optional[CatalogConfig] = None,
+                       prefix: str = "synthetic") -> List[TMDCData]:
+    """把一个块转换为 TMDCData 列表（供 fit_all_models 等使用）"""
+    config = CatalogConfig() if config is None else config
+    datasets = []
+    for i in range(len(chunk['band_gap'])):
+        m = chunk['mask'][i]
+        datasets.append(TMDCData(
+            material=f"{prefix}-{i}",
+            n_values=chunk['n_values'][i, m].astype(int),
+            energies=chunk['energies'][i, m],
+            energy_errors=chunk['energy_errors'][i, m],
+            band_gap=float(chunk['band_gap'][i]),
+            binding_energy_1s=float(chunk['binding_energy_1s'][i]),
+            reduced_mass=config.reduced_mass,
+            dielectric_constant=config.dielectric_constant,
+            reference=f"Synthetic (c₁={chunk['c1_true'][i]:.3f})"
+        ))
+    return datasets
+
+
+# ============ 磁盘读写 ============
+
+def _write_chunk(path: Path, size: int, config: CatalogConfig,
+                 seed: np.random.SeedSequence) -> int:
+    np.savez(path, **generate_chunk(size, config, seed))
+    return size
+
+
+def write_catalog(directory: str, n_spectra: int, chunk_size: int = 100_000,
+                  config: Optional[CatalogConfig] = None, seed: Optional[int] = None,
+                  n_workers: Optional[int] = 1) -> Path:
+    """
+    把目录写入 directory/chunk_XXXXXX.npz，并写 manifest.json
+
+    n_workers > 1（或None表示CPU数）时各块在进程池中生成；
+    由于每块的RNG流独立，输出与 n_workers 无关。
+    """
+    config = CatalogConfig() if config is None else config
+    out = Path(directory)
+    out.mkdir(parents=True, exist_ok=True)
+
+    n_chunks = -(-n_spectra // chunk_size)
+    root_seed = np.random.SeedSequence(seed)
+    seeds = root_seed.spawn(n_chunks)
+    sizes = [min(chunk_size, n_spectra - k * chunk_size) for k in range(n_chunks)]
+    paths = [out / f"chunk_{k:06d}.npz" for k in range(n_chunks)]
+
+    if n_workers == 1:
+        for p, size, s in zip(paths, sizes, seeds):
+            _write_chunk(p, size, config, s)
+    else:
+        with ProcessPoolExecutor(max_workers=n_workers) as pool:
+            list(pool.map(_write_chunk, paths, sizes, [config] * n_chunks, seeds))
+
+    manifest = {
+        'n_spectra': n_spectra,
+        'chunk_size': chunk_size,
+        'chunks': [p.name for p in paths],
+        'entropy': str(root_seed.entropy),
+        'config': asdict(config),
+    }
+    with open(out / "manifest.json", 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+    logger.info(f"写入 {n_spectra} 条合成光谱 ({n_chunks} 块) 到 {out}")
+    return out
+
+
+def read_catalog(directory: str) -> Iterator[Dict[str, np.ndarray]]:
+    """按块读取已写入的目录"""
+    root = Path(directory)
+    with open(root / "manifest.json") as f:
+        manifest = json.load(f)
+    for name in manifest['chunks']:
+        with np.load(root / name) as chunk:
+            yield dict(chunk)
+
+
+if __name__ == "__main__":
+    import sys
+    import time
+
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s')
+    n_total = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+
+    start = time.perf_counter()
+    write_catalog("research_execution/results/synthetic_catalog", n_total,
+                  seed=42, n_workers=None)
+    logger.info(f"生成速率: {n_total / (time.perf_counter() - start):,.0f} 条/秒")
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+batched_least_squares 回归测试：有界（边界活跃）拟合须与 curve_fit 一致
+"""
+
+import numpy as np
+from scipy.optimize import curve_fit
+
+from batched_fitting import batched_least_squares, dimflow_jacobian
+from tmdc_phase2_analysis import dimflow_defect_2d_free
+
+BOUNDS = ([0.01, 0.5, 0.1], [1.0, 10.0, 2.0])
+P0 = [0.3, 3.0, 1.0]
+
+
+def _bound_active_data():
+    """c₁ 的最优值落在上界 2.0 的7点数据集"""
+    n = np.arange(1, 8, dtype=float)
+    sigma = np.array([7.4e-5, 8.2e-3, 4.8e-2, 0.167, 0.288, 0.524, 2.39])
+    delta = dimflow_defect_2d_free(n, 0.25, 3.3, 4.0)
+    delta = delta + np.array([0.0, -0.3, 0.5, -0.6, 0.4, 0.3, -0.8]) * sigma
+    return n, delta, sigma
+
+
+def _chi2(n, delta, sigma, params):
+    return np.sum(((delta - dimflow_defect_2d_free(n, *params)) / sigma)**2)
+
+
+def test_bound_active_fit_matches_curve_fit():
+    n, delta, sigma = _bound_active_data()
+    ref, _ = curve_fit(dimflow_defect_2d_free, n, delta, p0=P0, sigma=sigma,
+                       absolute_sigma=True, bounds=BOUNDS, max_nfev=10000)
+    fit = batched_least_squares(dimflow_defect_2d_free, n, delta[None, :], sigma, P0,
+                                bounds=BOUNDS, jac=dimflow_jacobian)
+
+    assert fit.converged[0]
+    assert fit.params[0, 2] == BOUNDS[1][2]
+    assert np.isclose(fit.chi2[0], _chi2(n, delta, sigma, ref), rtol=1e-6)
+    np.testing.assert_allclose(fit.params[0], ref, rtol=1e-4)
+
+
+def test_batched_replicates_match_curve_fit():
+    n, delta, sigma = _bound_active_data()
+    rng = np.random.default_rng(0)
+    y = delta + rng.normal(size=(8, n.size)) * sigma
+    fit = batched_least_squares(dimflow_defect_2d_free, n, y, sigma, P0,
+                                bounds=BOUNDS, jac=dimflow_jacobian)
+
+    assert fit.converged.all()
+    for b in range(y.shape[0]):
+        ref, _ = curve_fit(dimflow_defect_2d_free, n, y[b], p0=P0, sigma=sigma,
+                           absolute_sigma=True, bounds=BOUNDS, max_nfev=10000)
+        assert fit.chi2[b] <= _chi2(n, y[b], sigma, ref) * (1 + 1e-6)
+
+
+def test_iteration_limit_is_not_convergence():
+    n, delta, sigma = _bound_active_data()
+    fit = batched_least_squares(dimflow_defect_2d_free, n, delta[None, :], sigma, P0,
+                                bounds=BOUNDS, jac=dimflow_jacobian, max_iter=2)
+    assert not fit.converged[0]
+
+
+def test_correlated_covariance_matches_curve_fit():
+    n, delta, sigma = _bound_active_data()
+    gradient = np.linspace(1.0, -1.0, n.size) * sigma
+    covariance = np.diag(sigma**2) + 0.5 * np.outer(gradient, gradient)
+    delta = dimflow_defect_2d_free(n, 0.25, 3.3, 1.3) + np.linalg.cholesky(covariance) @ np.array(
+        [0.3, -0.5, 0.8, -0.2, 0.1, 0.6, -0.4])
+
+    ref, _ = curve_fit(dimflow_defect_2d_free, n, delta, p0=P0, sigma=covariance,
+                       absolute_sigma=True, bounds=BOUNDS, max_nfev=20000)
+    fit = batched_least_squares(dimflow_defect_2d_free, n, delta[None, :], None, P0,
+                                bounds=BOUNDS, jac=dimflow_jacobian, covariance=covariance)
+
+    residual = delta - dimflow_defect_2d_free(n, *ref)
+    assert fit.converged[0]
+    assert fit.chi2[0] <= residual @ np.linalg.solve(covariance, residual) * (1 + 1e-6)
+    np.testing.assert_allclose(fit.params[0], ref, rtol=1e-3)
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+E_g、R* 解析边缘似然的回归测试：须与 (E_g, R*) 上的数值积分一致
+"""
+
+import numpy as np
+from scipy import stats
+from scipy.integrate import trapezoid
+
+from bayesian_evidence_mcmc import (create_marginal_energy_log_likelihood, dimflow_model,
+                                    fit_series_priors)
+
+N_DATA = np.arange(1, 5, dtype=float)
+THETA = np.array([0.3, 3.0, 1.0])
+BAND_GAP_PRIOR = (2.001, 3e-3)
+RYDBERG_PRIOR = (0.049, 4e-3)
+
+
+def _small_dataset():
+    """2D类氢系列 (n - 1/2 - δ) 的4个能级"""
+    errors = np.full(N_DATA.size, 2e-3)
+    u = 1.0 / (N_DATA - 0.5 - dimflow_model(N_DATA, THETA))**2
+    energies = 2.0 - 0.05 * u + np.array([0.5, -1.0, 0.3, 0.8]) * errors
+    return energies, errors
+
+
+def _brute_force_log_marginal(params, energies, errors):
+    """在 ±8σ 先验网格上对 (E_g, R*) 数值积分"""
+    E_g = np.linspace(BAND_GAP_PRIOR[0] - 8 * BAND_GAP_PRIOR[1],
+                      BAND_GAP_PRIOR[0] + 8 * BAND_GAP_PRIOR[1], 801)
+    R = np.linspace(RYDBERG_PRIOR[0] - 8 * RYDBERG_PRIOR[1],
+                    RYDBERG_PRIOR[0] + 8 * RYDBERG_PRIOR[1], 801)
+    u = 1.0 / (N_DATA - 0.5 - dimflow_model(N_DATA, params))**2
+    predicted = E_g[:, None, None] - R[None, :, None] * u
+    log_f = (np.sum(stats.norm.logpdf(energies, predicted, errors), axis=-1)
+             + stats.norm.logpdf(E_g, *BAND_GAP_PRIOR)[:, None]
+             + stats.norm.logpdf(R, *RYDBERG_PRIOR)[None, :])
+    peak = log_f.max()
+    return peak + np.log(trapezoid(trapezoid(np.exp(log_f - peak), R, axis=1), E_g))
+
+
+def test_marginal_matches_numerical_integration():
+    energies, errors = _small_dataset()
+    log_like = create_marginal_energy_log_likelihood(N_DATA, energies, errors, dimflow_model,
+                                                     BAND_GAP_PRIOR, RYDBERG_PRIOR)
+    for params in (THETA, [0.28, 3.2, 0.95], [0.25, 3.5, 1.0]):
+        assert np.isclose(log_like(params), _brute_force_log_marginal(params, energies, errors),
+                          rtol=0, atol=1e-6)
+
+
+def test_batched_marginal_matches_scalar():
+    energies, errors = _small_dataset()
+    args = (N_DATA, energies, errors, dimflow_model, BAND_GAP_PRIOR, RYDBERG_PRIOR)
+    scalar = create_marginal_energy_log_likelihood(*args)
+    batch = create_marginal_energy_log_likelihood(*args, vectorized=True)
+    params = np.array([THETA, [0.28, 3.2, 0.95], [0.25, 3.5, 1.0]])
+    np.testing.assert_allclose(batch(params), [scalar(p) for p in params], rtol=1e-12)
+
+
+def test_series_priors_recover_band_gap_and_rydberg():
+    n_data = np.arange(1, 11, dtype=float)
+    errors = np.full(n_data.size, 1e-6)
+    u = 1.0 / (n_data - 0.5 - dimflow_model(n_data, THETA))**2
+    theta, (E_g, sigma_g), (R, sigma_R) = fit_series_priors(
+        n_data, 2.0 - 0.05 * u, errors, dimflow_model, [0.25, 3.5, 0.9],
+        [(0.01, 1.0), (1.0, 10.0), (0.1, 2.0)])
+    assert abs(E_g - 2.0) < 5 * sigma_g
+    assert abs(R - 0.05) < 5 * sigma_R
+    np.testing.assert_allclose(theta, THETA, rtol=1e-4)
@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+TMDC拟合参数的Bootstrap不确定度
+目标：取代 np.sqrt(np.diag(pcov))，为 δ₀、n₀、c₁ 给出百分位与BCa置信区间
+（3–7个数据点时线性化协方差不可靠）
+"""
+
+import numpy as np
+from scipy.stats import norm
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
+import logging
+
+from batched_fitting import (batched_least_squares, dimflow_jacobian,
+                             dimflow_fixed_jacobian)
+from tmdc_phase2_analysis import (TMDCData, dimflow_defect_2d_fixed,
+                                  dimflow_defect_2d_free)
+
+logger = logging.getLogger(__name__)
+
+# 与 fit_all_models 保持一致的边界与初值
+BOUNDS_FIXED = ([0.01, 0.5], [1.0, 10.0])
+BOUNDS_FREE = ([0.01, 0.5, 0.1], [1.0, 10.0, 2.0])
+P0_FIXED = [0.3, 3.0]
+P0_FREE = [0.3, 3.0, 1.0]
+
+
+# ============ 置信区间 ============
+
+def percentile_interval(replicates: np.ndarray, alpha: float = 0.05) -> np.ndarray:
+    """百分位区间，返回 (2, P)"""
+    return np.percentile(replicates, [100 * alpha / 2, 100 * (1 - alpha / 2)], axis=0)
+
+
+def bca_interval(replicates: np.ndarray, theta_hat: np.ndarray,
+                 jackknife: np.ndarray, alpha: float = 0.05) -> np.ndarray:
+    """
+    偏差校正加速 (BCa) 区间，返回 (2, P)
+
+    z₀ 由bootstrap分布相对 θ̂ 的偏移估计，加速常数 a 由留一jackknife估计。
+    """
+    B = replicates.shape[0]
+    frac_below = (np.sum(replicates < theta_hat, axis=0)
+                  + 0.5 * np.sum(replicates == theta_hat, axis=0)) / B
+    z0 = norm.ppf(np.clip(frac_below, 1.0 / (B + 1), B / (B + 1)))
+
+    jk_mean = jackknife.mean(axis=0)
+    diff = jk_mean - jackknife
+    denom = 6.0 * np.sum(diff**2, axis=0)**1.5
+    accel = np.divide(np.sum(diff**3, axis=0), denom,
+                      out=np.zeros_like(jk_mean), where=denom > 0)
+
+    z = norm.ppf([alpha / 2, 1 - alpha / 2])[:, None]
+    adjusted = norm.cdf(z0 + (z0 + z) / (1 - accel * (z0 + z)))
+
+    interval = np.empty((2, replicates.shape[1]))
+    for k in range(replicates.shape[1]):
+        interval[:, k] = np.percentile(replicates[:, k], 100 * adjusted[:, k])
+    return interval
+
+
+# ============ Bootstrap引擎 ============
+
+def bootstrap_dimflow_fit(n: np.ndarray,
+                          delta: np.ndarray,
+                          delta_err: np.ndarray,
+                          free_c1: Optional[bool] = None,
+                          c1_fixed: float = 1.0,
+                          method: str = 'parametric',
+                          n_boot: int = 2000,
+                          alpha: float = 0.05,
+                          min_converged_fraction: float = 0.95,
+                          rng: Optional[np.random.Generator] = None) -> Dict:
+    """
+    对单个材料的维度流拟合做bootstrap
+
+    Parameters:
+    -----------
+    n, delta, delta_err : array
+        有效数据点（已去除NaN）
+    free_c1 : bool, optional
+        是否拟合自由c₁；缺省时与 fit_all_models 相同（≥4点才拟合自由c₁）
+    method : str
+        'parametric'（按 delta_err 加高斯噪声）或 'residual'（重采样标准化残差）
+    n_boot : int
+        bootstrap重复次数，全部在一次批量求解中完成
+    min_converged_fraction : float
+        收敛重复拟合所占比例的下限；低于该比例时只丢弃未收敛样本会使区间
+        有偏，因此不给出区间并标记 reliable=False
+    """
+    rng = np.random.default_rng() if rng is None else rng
+    n = np.asarray(n, dtype=float)
+    delta = np.asarray(delta, dtype=float)
+    delta_err = np.asarray(delta_err, dtype=float)
+    N = len(n)
+
+    if free_c1 is None:
+        free_c1 = N >= 4
+    if free_c1:
+        model, jac = dimflow_defect_2d_free, dimflow_jacobian
+        bounds, p0 = BOUNDS_FREE, P0_FREE
+        names = ['delta0', 'n0', 'c1']
+    else:
+        model = lambda n, d0, n0: dimflow_defect_2d_fixed(n, d0, n0, c1_fixed)
+        jac = dimflow_fixed_jacobian(c1_fixed)
+        bounds, p0 = BOUNDS_FIXED, P0_FIXED
+        names = ['delta0', 'n0']
+
+    # 全数据拟合，作为所有重复拟合的热启动点
+    full = batched_least_squares(model, n, delta[None, :], delta_err, p0,
+                                 bounds=bounds, jac=jac)
+    theta_hat = full.params[0]
+    fitted = model(n, *theta_hat)
+
+    if method == 'parametric':
+        y_boot = fitted + rng.normal(size=(n_boot, N)) * delta_err
+    elif method == 'residual':
+        dof = max(N - len(theta_hat), 1)
+        std_resid = (delta - fitted) / delta_err * np.sqrt(N / dof)
+        std_resid -= std_resid.mean()
+        idx = rng.integers(0, N, size=(n_boot, N))
+        y_boot = fitted + std_resid[idx] * delta_err
+    else:
+        raise ValueError(f"Unknown bootstrap method: {method}")
+
+    boot = batched_least_squares(model, n, y_boot, delta_err, theta_hat,
+                                 bounds=bounds, jac=jac)
+    replicates = boot.params[boot.converged]
+    converged_fraction = float(np.mean(boot.converged))
+
+    # 留一jackknife（BCa加速常数），同样批量求解
+    jk_mask = ~np.eye(N, dtype=bool)
+    jack = batched_least_squares(model, n, np.broadcast_to(delta, (N, N)),
+                                 delta_err, theta_hat, bounds=bounds, jac=jac,
+                                 mask=jk_mask)
+
+    results = {
+        'method': method,
+        'model': 'dimflow_free' if free_c1 else 'dimflow_fixed',
+        'n_boot': n_boot,
+        'n_converged': int(len(replicates)),
+        'converged_fraction': converged_fraction,
+        'full_fit_converged': bool(full.converged[0]),
+        'reliable': False,
+        'params': dict(zip(names, theta_hat.tolist())),
+    }
+    if not full.converged[0]:
+        logger.warning("全数据拟合未收敛，不给出bootstrap区间")
+        return results
+    if converged_fraction < min_converged_fraction or len(replicates) < 2:
+        logger.warning(f"bootstrap收敛比例 {converged_fraction:.1%} 低于 "
+                       f"{min_converged_fraction:.0%}，不给出区间")
+        return results
+
+    results['reliable'] = True
+    pct = percentile_interval(replicates, alpha)
+    results['std'] = dict(zip(names, replicates.std(axis=0, ddof=1).tolist()))
+    results['percentile'] = {name: pct[:, k].tolist() for k, name in enumerate(names)}
+    # 加速常数需要完整的留一jackknife，任一折未收敛时只报告百分位区间
+    if jack.converged.all():
+        bca = bca_interval(replicates, theta_hat, jack.params, alpha)
+        results['bca'] = {name: bca[:, k].tolist() for k, name in enumerate(names)}
+    else:
+        logger.warning("jackknife拟合未全部收敛，跳过BCa区间")
+    results['confidence_level'] = 1 - alpha
+    return results
+
+
+def bootstrap_material(data: TMDCData, seed=None, **kwargs) -> Dict:
+    """对一个TMDCData做bootstrap（自动去除NaN量子缺陷）"""
+    delta, delta_err = data.quantum_defect()
+    valid = ~np.isnan(delta)
+    if valid.sum() < 3:
+        return {'material': data.material, 'error': 'Insufficient data points'}
+
+    rng = np.random.default_rng(seed)
+    results = bootstrap_dimflow_fit(data.n_values[valid], delta[valid],
+                                    delta_err[valid], rng=rng, **kwargs)
+    results['material'] = data.material
+    return results
+
+
+def bootstrap_all_materials(datasets: List[TMDCData],
+                            seed: Optional[int] = None,
+                            n_workers: Optional[int] = 1,
+                            **kwargs) -> List[Dict]:
+    """
+    对所有材料做bootstrap，每个材料使用独立的RNG流
+
+    子种子由 SeedSequence.spawn 生成，结果与 n_workers 无关。
+    n_workers > 1（或None表示CPU数）时按材料分发到进程池。
+    """
+    child_seeds = np.random.SeedSequence(seed).spawn(len(datasets))
+
+    if n_workers == 1 or len(datasets) <= 1:
+        return [bootstrap_material(d, s, **kwargs)
+                for d, s in zip(datasets, child_seeds)]
+
+    with ProcessPoolExecutor(max_workers=n_workers) as pool:
+        futures = [pool.submit(bootstrap_material, d, s, **kwargs)
+                   for d, s in zip(datasets, child_seeds)]
+        return [f.result() for f in futures]
+
+
+if __name__ == "__main__":
+    from tmdc_phase2_analysis import (load_tmdc_data_comprehensive,
+                                      generate_synthetic_tmdc_data)
+
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s')
+    all_data = load_tmdc_data_comprehensive() + generate_synthetic_tmdc_data()
+    for r in bootstrap_all_materials(all_data, seed=2024, n_workers=None):
+        if 'error' in r:
+            logger.info(f"{r['material']}: {r['error']}")
+            continue
+        if not r['reliable']:
+            logger.info(f"{r['material']}: 收敛比例 {r['converged_fraction']:.1%}，无可靠区间")
+            continue
+        for name, (lo, hi) in r.get('bca', {}).items():
+            logger.info(f"{r['material']:<14} {name:<7} = {r['params'][name]:.3f}  "
+                        f"BCa 95%: [{lo:.3f}, {hi:.3f}]")
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+留一能级交叉验证 (LOO / K折) 模型比较
+目标：在3–7个激子能级上，用精确的留出预测密度 (ELPD) 比较标准模型与维度流模型，
+取代仅基于BIC差的 calculate_model_comparison
+
+所有材料、所有折的重拟合在每个模型的一次批量求解中完成，
+并以对应材料的全数据最优解热启动。
+"""
+
+import numpy as np
+from scipy.stats import norm
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+import logging
+
+from batched_fitting import (_evaluate, _jacobian, batched_least_squares,
+                             dimflow_fixed_jacobian, dimflow_jacobian)
+from tmdc_phase2_analysis import (TMDCData, dimflow_defect_2d_fixed,
+                                  dimflow_defect_2d_free, standard_defect_2d)
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class CVModel:
+    """参与交叉验证的模型（初值和边界与 fit_all_models 一致）"""
+    func: Callable
+    jac: Optional[Callable]
+    p0: Sequence[float]
+    bounds: Tuple[Sequence[float], Sequence[float]]
+    min_points: int
+
+
+CV_MODELS = {
+    'standard': CVModel(standard_defect_2d, None, [0.2, 0.5],
+                        ([0, 0], [1, 2]), 3),
+    'dimflow_fixed': CVModel(lambda n, d0, n0: dimflow_defect_2d_fixed(n, d0, n0, 1.0),
+                             dimflow_fixed_jacobian(1.0), [0.3, 3.0],
+                             ([0.01, 0.5], [1.0, 10.0]), 3),
+    'dimflow_free': CVModel(dimflow_defect_2d_free, dimflow_jacobian, [0.3, 3.0, 1.0],
+                            ([0.01, 0.5, 0.1], [1.0, 10.0, 2.0]), 4),
+}
+
+
+def _fold_ids(n_points: int, k_folds: Optional[int], rng: np.random.Generator) -> np.ndarray:
+    """每个点所属的折编号；k_folds=None 为留一"""
+    if k_folds is None or k_folds >= n_points:
+        return np.arange(n_points)
+    return rng.permutation(n_points) % k_folds
+
+
+def _pad(arrays: List[np.ndarray], fill: float) -> np.ndarray:
+    out = np.full((len(arrays), max(len(a) for a in arrays)), fill, dtype=float)
+    for i, a in enumerate(arrays):
+        out[i, :len(a)] = a
+    return out
+
+
+def cross_validate_models(datasets: List[TMDCData],
+                          models: Sequence[str] = ('standard', 'dimflow_fixed', 'dimflow_free'),
+                          k_folds: Optional[int] = None,
+                          reference: str = 'standard',
+                          seed: Optional[int] = None) -> List[Dict]:
+    """
+    对所有材料做留一（或K折）交叉验证
+
+    留出点的预测分布取 N(f(n_i; θ̂₋ᵢ), σ_i² + J_i Σ₋ᵢ J_iᵀ)，
+    即在测量误差之外计入折内拟合参数的拉普拉斯不确定度。
+
+    返回与 datasets 对齐的列表，每项含各模型的 ELPD、逐点 lpd，
+    以及相对 reference 模型的 ELPD 差与标准误 SE = √(N·Var(Δlpdᵢ))。
+    折内拟合未收敛的模型不计入该材料的 ELPD，未收敛折数记在 'unconverged_folds'。
+    """
+    rng = np.random.default_rng(seed)
+
+    prepared = []
+    for data in datasets:
+        delta, delta_err = data.quantum_defect()
+        valid = ~np.isnan(delta)
+        prepared.append((data.n_values[valid].astype(float), delta[valid], delta_err[valid]))
+
+    usable = [i for i, (n, _, _) in enumerate(prepared) if len(n) >= 3]
+    results = [{'material': d.material} for d in datasets]
+    for i, d in enumerate(datasets):
+        if i not in usable:
+            results[i]['error'] = 'Insufficient data points'
+    if not usable:
+        return results
+
+    X = _pad([prepared[i][0] for i in usable], 1.0)
+    Y = _pad([prepared[i][1] for i in usable], np.nan)
+    S = _pad([prepared[i][2] for i in usable], 1.0)
+    counts = np.array([len(prepared[i][0]) for i in usable])
+    folds = [_fold_ids(c, k_folds, rng) for c in counts]
+
+    pointwise = {name: np.full(Y.shape, np.nan) for name in models}
+    failed_folds = {name: np.zeros(len(usable), dtype=int) for name in models}
+
+    for name in models:
+        spec = CV_MODELS[name]
+        eligible = np.flatnonzero(counts >= spec.min_points)
+        if eligible.size == 0:
+            continue
+
+        # 全数据拟合（热启动点）
+        full = batched_least_squares(spec.func, X[eligible], Y[eligible], S[eligible],
+                                     spec.p0, bounds=spec.bounds, jac=spec.jac)
+
+        # 展开为 (材料, 折) 行，一次批量求解
+        row_material, row_start, train, test = [], [], [], []
+        for j, m in enumerate(eligible):
+            fold_of_point = np.full(Y.shape[1], -1)
+            fold_of_point[:counts[m]] = folds[m]
+            # 全数据拟合未收敛时不以其作热启动点
+            start = full.params[j] if full.converged[j] else spec.p0
+            for f in np.unique(folds[m]):
+                row_material.append(m)
+                row_start.append(start)
+                test.append(fold_of_point == f)
+                train.append((fold_of_point >= 0) & (fold_of_point != f))
+        row_material = np.array(row_material)
+        train, test = np.array(train), np.array(test)
+
+        x_rows, y_rows, s_rows = X[row_material], Y[row_material], S[row_material]
+        cv = batched_least_squares(spec.func, x_rows, y_rows, s_rows,
+                                   np.array(row_start), bounds=spec.bounds,
+                                   jac=spec.jac, mask=train)
+
+        pred = _evaluate(spec.func, x_rows, cv.params)
+        J = _jacobian(spec.func, spec.jac, x_rows, cv.params)
+        var = s_rows**2 + np.einsum('bnp,bpq,bnq->bn', J, cv.covariance, J)
+        lpd = norm.logpdf(y_rows, pred, np.sqrt(var))
+
+        # 未收敛折的留出点保持NaN，该模型不参与对应材料的ELPD汇总
+        np.add.at(failed_folds[name], row_material[~cv.converged], 1)
+        rows, cols = np.nonzero(test & cv.converged[:, None])
+        pointwise[name][row_material[rows], cols] = lpd[rows, cols]
+
+    for j, i in enumerate(usable):
+        N = counts[j]
+        entry = results[i]
+        entry['n_points'] = int(N)
+        entry['scheme'] = 'LOO' if k_folds is None or k_folds >= N else f'{k_folds}-fold'
+        entry['elpd'] = {}
+        entry['unconverged_folds'] = {name: int(failed_folds[name][j]) for name in models
+                                      if failed_folds[name][j] > 0}
+        for name in models:
+            lpd_i = pointwise[name][j, :N]
+            if np.all(np.isfinite(lpd_i)):
+                entry['elpd'][name] = {
+                    'elpd': float(lpd_i.sum()),
+                    'se': float(np.sqrt(N * np.var(lpd_i, ddof=1))),
+                    'pointwise': lpd_i.tolist(),
+                }
+
+        if reference in entry['elpd']:
+            ref = pointwise[reference][j, :N]
+            entry['elpd_diff'] = {}
+            for name in entry['elpd']:
+                if name == reference:
+                    continue
+                diff = pointwise[name][j, :N] - ref
+                entry['elpd_diff'][f'{name} - {reference}'] = {
+                    'diff': float(diff.sum()),
+                    'se': float(np.sqrt(N * np.var(diff, ddof=1))),
+                }
+
+    return results
+
+
+if __name__ == "__main__":
+    from tmdc_phase2_analysis import (load_tmdc_data_comprehensive,
+                                      generate_synthetic_tmdc_data)
+
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s')
+    all_data = load_tmdc_data_comprehensive() + generate_synthetic_tmdc_data()
+    for r in cross_validate_models(all_data):
+        if 'error' in r:
+            logger.info(f"{r['material']}: {r['error']}")
+            continue
+        for name, n_failed in r['unconverged_folds'].items():
+            logger.info(f"{r['material']:<14} {r['scheme']}  {name}: {n_failed} 折未收敛，不计入ELPD")
+        for label, d in r.get('elpd_diff', {}).items():
+            logger.info(f"{r['material']:<14} {r['scheme']}  ΔELPD({label}) = "
+                        f"{d['diff']:+.2f} ± {d['se']:.2f}")
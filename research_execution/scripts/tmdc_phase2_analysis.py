@@ -14,6 +14,8 @@ from dataclasses import dataclass
 from typing import List, Dict, Tuple, Optional
 import logging
 
+from batched_fitting import correlated_chi2, covariance_cholesky
+
 logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s')
 logger = logging.getLogger(__name__)
 
@@ -30,6 +32,8 @@ class TMDCData:
     reduced_mass: float  # 约化质量 (m₀)
     dielectric_constant: float  # 介电常数
     reference: str
+    band_gap_error: float = 0.0  # 带隙误差 (eV)
+    binding_energy_error: float = 0.0  # 1s束缚能误差 (meV)
     
     def calculate_rydberg(self) -> float:
         """计算有效里德伯能量 (eV)"""
@@ -67,6 +71,33 @@ class TMDCData:
                 delta_err[i] = np.nan
         
         return delta_n, delta_err
+    
+    def quantum_defect_covariance(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        计算量子缺陷及其完整协方差矩阵
+        
+        所有 δ(n) 共用同一个 E_g 和 R*，其误差在各能级间完全相关：
+        Σ = diag(g_E² σ_E²) + σ_Eg² g_Eg g_Egᵀ + σ_R² g_R g_Rᵀ，
+        其中 g 为 δ_i 对 E_i、E_g、R* 的导数。
+        E_g、R* 误差为零时对角元与 quantum_defect() 的误差平方一致。
+        无效能级（E ≥ E_g）对应的行列为NaN。
+        """
+        R_star = self.calculate_rydberg()
+        denominator = self.band_gap - np.asarray(self.energies, dtype=float)
+        valid = denominator > 0
+        D = np.where(valid, denominator, np.nan)
+        sqrt_term = np.sqrt(R_star / D)
+        
+        delta_n = self.n_values - 0.5 - sqrt_term
+        g_E = -0.5 * sqrt_term / D  # ∂δ/∂E_i
+        g_Eg = 0.5 * sqrt_term / D  # ∂δ/∂E_g
+        g_R = -0.5 * sqrt_term / R_star  # ∂δ/∂R*
+        sigma_R = self.binding_energy_error / 1000.0  # meV → eV
+        
+        cov = (np.diag((g_E * self.energy_errors)**2)
+               + self.band_gap_error**2 * np.outer(g_Eg, g_Eg)
+               + sigma_R**2 * np.outer(g_R, g_R))
+        return delta_n, cov
 
 
 # ============ 模型定义 ============
@@ -208,8 +239,14 @@ def generate_synthetic_tmdc_data() -> List[TMDCData]:
 
 # ============ 模型拟合 ============
 
-def fit_all_models(data: TMDCData) -> Dict:
-    """对数据拟合所有模型"""
+def fit_all_models(data: TMDCData, correlated: bool = False) -> Dict:
+    """
+    对数据拟合所有模型
+    
+    correlated=True 时使用 quantum_defect_covariance() 的完整协方差：
+    Cholesky因子每个数据集只分解一次，所有模型的 χ² 都由白化残差计算，
+    curve_fit 以二维 sigma 接收协方差。
+    """
     
     n = data.n_values
     delta, delta_err = data.quantum_defect()
@@ -224,17 +261,27 @@ def fit_all_models(data: TMDCData) -> Dict:
         logger.warning(f"{data.material}: 数据点不足 ({len(n_valid)} < 3)")
         return {'error': 'Insufficient data points'}
     
+    if correlated:
+        _, cov = data.quantum_defect_covariance()
+        sigma_fit = cov[np.ix_(valid_mask, valid_mask)]
+        chol = covariance_cholesky(sigma_fit)
+        chi2_of = lambda residual: float(correlated_chi2(residual, chol))
+    else:
+        sigma_fit = delta_err_valid
+        chi2_of = lambda residual: np.sum((residual / delta_err_valid)**2)
+    
     results = {
         'material': data.material,
         'n_points': len(n_valid),
         'n_values': n_valid.tolist(),
-        'quantum_defects': delta_valid.tolist()
+        'quantum_defects': delta_valid.tolist(),
+        'correlated': correlated
     }
     
     try:
         # 1. 纯2D氢原子（参考）
         delta_pred_hydrogenic = hydrogenic_2d(n_valid)
-        chi2_hydro = np.sum(((delta_valid - delta_pred_hydrogenic) / delta_err_valid)**2)
+        chi2_hydro = chi2_of(delta_valid - delta_pred_hydrogenic)
         
         results['hydrogenic'] = {
             'chi2': chi2_hydro,
@@ -245,11 +292,11 @@ def fit_all_models(data: TMDCData) -> Dict:
         # 2. 标准模型
         popt_std, pcov_std = curve_fit(
             standard_defect_2d, n_valid, delta_valid,
-            sigma=delta_err_valid, absolute_sigma=True,
+            sigma=sigma_fit, absolute_sigma=True,
             p0=[0.2, 0.5], bounds=([0, 0], [1, 2])
         )
         delta_pred_std = standard_defect_2d(n_valid, *popt_std)
-        chi2_std = np.sum(((delta_valid - delta_pred_std) / delta_err_valid)**2)
+        chi2_std = chi2_of(delta_valid - delta_pred_std)
         
         results['standard'] = {
             'params': {'delta0': popt_std[0], 'alpha': popt_std[1]},
@@ -265,11 +312,11 @@ def fit_all_models(data: TMDCData) -> Dict:
         popt_df_fix, pcov_df_fix = curve_fit(
             lambda n, d0, n0: dimflow_defect_2d_fixed(n, d0, n0, 1.0),
             n_valid, delta_valid,
-            sigma=delta_err_valid, absolute_sigma=True,
+            sigma=sigma_fit, absolute_sigma=True,
             p0=[0.3, 3.0], bounds=([0.01, 0.5], [1.0, 10.0])
         )
         delta_pred_df_fix = dimflow_defect_2d_fixed(n_valid, *popt_df_fix, 1.0)
-        chi2_df_fix = np.sum(((delta_valid - delta_pred_df_fix) / delta_err_valid)**2)
+        chi2_df_fix = chi2_of(delta_valid - delta_pred_df_fix)
         
         results['dimflow_fixed'] = {
             'params': {'delta0': popt_df_fix[0], 'n0': popt_df_fix[1]},
@@ -286,12 +333,12 @@ def fit_all_models(data: TMDCData) -> Dict:
         if len(n_valid) >= 4:
             popt_df_free, pcov_df_free = curve_fit(
                 dimflow_defect_2d_free, n_valid, delta_valid,
-                sigma=delta_err_valid, absolute_sigma=True,
+                sigma=sigma_fit, absolute_sigma=True,
                 p0=[0.3, 3.0, 1.0],
                 bounds=([0.01, 0.5, 0.1], [1.0, 10.0, 2.0])
             )
             delta_pred_df_free = dimflow_defect_2d_free(n_valid, *popt_df_free)
-            chi2_df_free = np.sum(((delta_valid - delta_pred_df_free) / delta_err_valid)**2)
+            chi2_df_free = chi2_of(delta_valid - delta_pred_df_free)
             
             results['dimflow_free'] = {
                 'params': {'delta0': popt_df_free[0], 
@@ -522,7 +569,27 @@ def main_phase2():
         if comparison:
             logger.info(f"  B₁₀ = {comparison.get('B10', 'N/A')}")
             logger.info(f"  结论: {comparison.get('preference', 'N/A')}")
-    
+
+    # Bootstrap不确定度（每个材料独立RNG流，批量重拟合）
+    logger.info("\n计算bootstrap置信区间...")
+    from tmdc_bootstrap import bootstrap_all_materials
+    bootstrap_results = bootstrap_all_materials(all_data, seed=42, n_boot=2000)
+    for results, boot in zip(all_results, bootstrap_results):
+        results['bootstrap'] = boot
+        if 'converged_fraction' in boot:
+            logger.info(f"  {boot['material']}: 收敛比例 {boot['converged_fraction']:.1%}"
+                        f"{'' if boot['reliable'] else '（不可靠，未给出区间）'}")
+        for name, (lo, hi) in boot.get('bca', {}).items():
+            logger.info(f"  {boot['material']} {name}: BCa 95% [{lo:.3f}, {hi:.3f}]")
+
+    # 留一能级交叉验证（所有材料、所有折一次批量重拟合）
+    logger.info("\n留一交叉验证模型比较...")
+    from tmdc_cross_validation import cross_validate_models
+    for results, cv in zip(all_results, cross_validate_models(all_data)):
+        results['loo'] = cv
+        for label, d in cv.get('elpd_diff', {}).items():
+            logger.info(f"  {cv['material']} ΔELPD({label}) = {d['diff']:+.2f} ± {d['se']:.2f}")
+
     # 创建汇总图
     logger.info("\n生成可视化...")
     create_phase2_summary_plot(all_results, 